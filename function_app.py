@@ -1,30 +1,113 @@
 """Azure Functions entry point — Timer Trigger (every 1 minute)."""
 
+import atexit
 import logging
 import os
 
 import azure.functions as func
-import yaml
-
-from src.auth import create_auth_azure
-from src.cache.table_cache import TableSyncCache
-from src.graph_client import GraphClient
-from src.rules.evaluator import TaskEvaluator
-from src.services.calendar_service import CalendarService
-from src.services.onenote_service import OneNoteService
-from src.services.sync_engine import SyncEngine
-from src.services.todo_service import TodoService
-from src.utils.logger import setup_logger
 
 app = func.FunctionApp()
 
 logger = logging.getLogger("onenote_todo_sync")
 
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Parsed config keyed by (path, mtime) — reused across warm invocations
+_CONFIG_CACHE: dict[tuple[str, float], dict] = {}
+_INITIALIZED = False
+
+# Sync stack (auth, Graph, cache, services) imported on first invocation
+_SERVICES: dict = {}
+
+# Auth, Graph client, cache and engine built once and reused on warm ticks
+_CTX: dict = {}
+
+
+def _load_services() -> dict:
+    """Import the sync stack once per worker and return it by name."""
+    if not _SERVICES:
+        from src.auth import create_auth_azure
+        from src.cache.table_cache import TableSyncCache
+        from src.graph_client import GraphClient, create_session
+        from src.rules.evaluator import TaskEvaluator
+        from src.services.calendar_service import CalendarService
+        from src.services.onenote_service import OneNoteService
+        from src.services.sync_engine import SyncEngine
+        from src.services.todo_service import TodoService
+        from src.utils.logger import setup_logger
+
+        _SERVICES.update(
+            create_auth_azure=create_auth_azure,
+            TableSyncCache=TableSyncCache,
+            GraphClient=GraphClient,
+            create_session=create_session,
+            TaskEvaluator=TaskEvaluator,
+            CalendarService=CalendarService,
+            OneNoteService=OneNoteService,
+            SyncEngine=SyncEngine,
+            TodoService=TodoService,
+            setup_logger=setup_logger,
+        )
+    return _SERVICES
+
+
+def _close_context():
+    """Drop the cached sync context, closing its cache."""
+    cache = _CTX.get("cache")
+    _CTX.clear()
+    if cache is not None:
+        cache.close()
+
+
+atexit.register(_close_context)
+
+
+def _build_context(services: dict, config: dict, settings: tuple) -> dict:
+    """Build the sync stack for the given settings, reusing it while they match."""
+    if _CTX.get("settings") == settings and _CTX.get("config") is config:
+        return _CTX
+
+    _close_context()
+    client_id, connection_string, authority, blob_name, table_prefix = settings
+
+    auth = services["create_auth_azure"](
+        client_id, connection_string, authority=authority, blob_name=blob_name,
+    )
+    graph = services["GraphClient"](auth, session=services["create_session"]())
+    cache = services["TableSyncCache"](connection_string, table_prefix=table_prefix)
+    evaluator = services["TaskEvaluator"](config.get("rules", {}))
+    todo = services["TodoService"](graph)
+    onenote = services["OneNoteService"](graph)
+    calendar = services["CalendarService"](graph)
+
+    engine = services["SyncEngine"](
+        todo_service=todo,
+        onenote_service=onenote,
+        calendar_service=calendar,
+        evaluator=evaluator,
+        cache=cache,
+        config=config,
+    )
+
+    _CTX.update(settings=settings, config=config, cache=cache, engine=engine)
+    return _CTX
+
 
 def _load_config(config_file: str = "config.yaml") -> dict:
-    config_path = os.path.join(os.path.dirname(__file__), config_file)
+    config_path = os.path.join(_APP_DIR, config_file)
+    key = (config_path, os.stat(config_path).st_mtime)
+    cached = _CONFIG_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    import yaml
+
+    # Prefer the LibYAML parser; fall back if PyYAML was built without it
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     with open(config_path, "r") as f:
-        return yaml.safe_load(f)
+        config = yaml.load(f, Loader=loader)
+    _CONFIG_CACHE[key] = config
+    return config
 
 
 @app.timer_trigger(
@@ -34,10 +117,11 @@ def _load_config(config_file: str = "config.yaml") -> dict:
 )
 def sync_trigger(timer: func.TimerRequest) -> None:
     """Run one sync cycle every minute."""
+    global _INITIALIZED
+
     if timer.past_due:
         logger.warning("Timer trigger is past due — running anyway")
 
-    cache = None
     try:
         client_id = os.environ["CLIENT_ID"]
         connection_string = os.environ["AzureWebJobsStorage"]
@@ -46,32 +130,19 @@ def sync_trigger(timer: func.TimerRequest) -> None:
         table_prefix = os.environ.get("TABLE_PREFIX", "")
         config_file = os.environ.get("CONFIG_FILE", "config.yaml")
 
+        services = _load_services()
         config = _load_config(config_file)
-        setup_logger(config)
-
-        auth = create_auth_azure(client_id, connection_string, authority=authority, blob_name=blob_name)
-        graph = GraphClient(auth)
-        cache = TableSyncCache(connection_string, table_prefix=table_prefix)
-        evaluator = TaskEvaluator(config.get("rules", {}))
-        todo = TodoService(graph)
-        onenote = OneNoteService(graph)
-        calendar = CalendarService(graph)
-
-        engine = SyncEngine(
-            todo_service=todo,
-            onenote_service=onenote,
-            calendar_service=calendar,
-            evaluator=evaluator,
-            cache=cache,
-            config=config,
-        )
+        if not _INITIALIZED:
+            services["setup_logger"](config)
+            _INITIALIZED = True
 
-        engine.run_once()
+        settings = (client_id, connection_string, authority, blob_name, table_prefix)
+        ctx = _build_context(services, config, settings)
+        ctx["engine"].run_once()
         logger.info("Sync cycle completed successfully")
 
     except Exception:
         logger.exception("Sync cycle failed")
+        # Rebuild on the next tick (e.g. to pick up a re-uploaded token cache)
+        _close_context()
         raise
-    finally:
-        if cache is not None:
-            cache.close()
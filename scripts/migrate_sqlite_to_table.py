@@ -12,6 +12,8 @@ Requires:
 import argparse
 import os
 import sys
+from collections import defaultdict
+from datetime import datetime, timezone
 
 from dotenv import load_dotenv
 
@@ -21,6 +23,39 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from src.cache.local_cache import SyncCache
 from src.cache.table_cache import TableSyncCache
 
+# Azure Table entity-group transactions: max 100 operations, one PartitionKey
+BATCH_SIZE = 100
+PROGRESS_EVERY = 1000
+
+
+def submit_batches(table_client, entities, label: str) -> int:
+    """Upsert entities in per-PartitionKey transactions of up to BATCH_SIZE.
+
+    Entities are consumed lazily; at most BATCH_SIZE are buffered per
+    partition. A RowKey repeated within a pending batch keeps the last one,
+    since a transaction may not touch the same entity twice.
+    """
+    pending = defaultdict(dict)
+    done = 0
+
+    def flush(partition_key: str):
+        nonlocal done
+        chunk = list(pending.pop(partition_key).values())
+        table_client.submit_transaction([("upsert", e) for e in chunk])
+        previous, done = done, done + len(chunk)
+        if done // PROGRESS_EVERY > previous // PROGRESS_EVERY:
+            print(f"  Migrated {done} {label}...")
+
+    for entity in entities:
+        batch = pending[entity["PartitionKey"]]
+        batch[entity["RowKey"]] = entity
+        if len(batch) == BATCH_SIZE:
+            flush(entity["PartitionKey"])
+
+    for partition_key in list(pending):
+        flush(partition_key)
+    return done
+
 
 def main():
     parser = argparse.ArgumentParser(description="Migrate SQLite cache to Azure Table Storage")
@@ -51,22 +86,36 @@ def main():
     # Migrate tasks
     tasks = local.get_all_tasks()
     print(f"Found {len(tasks)} tasks to migrate")
-    for task in tasks:
-        table.upsert_task(task)
-        print(f"  Migrated task: {task['title'][:50]}")
-
-    # Migrate weekly reviews
-    rows = local.conn.execute("SELECT * FROM weekly_reviews").fetchall()
-    reviews = [dict(r) for r in rows]
-    print(f"Found {len(reviews)} weekly reviews to migrate")
-    for review in reviews:
-        table.save_weekly_review(review["event_id"], review["week_start"])
-        print(f"  Migrated review: week_start={review['week_start']}")
+    submit_batches(
+        table.tasks_client,
+        (TableSyncCache._task_to_entity(task) for task in tasks),
+        "tasks",
+    )
+
+    # Migrate weekly reviews, streamed as plain tuples straight from the cursor
+    cursor = local.conn.cursor()
+    cursor.row_factory = None
+    cursor.execute("SELECT event_id, week_start FROM weekly_reviews ORDER BY id")
+    now = datetime.now(timezone.utc).isoformat()
+    reviews = submit_batches(
+        table.reviews_client,
+        (
+            {
+                "PartitionKey": "review",
+                "RowKey": week_start,
+                "EventId": event_id,
+                "CreatedAt": now,
+            }
+            for event_id, week_start in cursor
+        ),
+        "reviews",
+    )
+    print(f"Migrated {reviews} weekly reviews")
 
     local.close()
     table.close()
 
-    print(f"\nMigration complete: {len(tasks)} tasks, {len(reviews)} reviews")
+    print(f"\nMigration complete: {len(tasks)} tasks, {reviews} reviews")
 
 
 if __name__ == "__main__":
@@ -11,6 +11,7 @@ Requires:
 """
 
 import argparse
+import hashlib
 import os
 import sys
 
@@ -44,7 +45,8 @@ def main():
         print("Run 'python -m src.main --auth' first to authenticate and create it.")
         sys.exit(1)
 
-    from azure.storage.blob import BlobServiceClient
+    from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+    from azure.storage.blob import BlobServiceClient, ContentSettings
 
     blob_service = BlobServiceClient.from_connection_string(connection_string)
     container_client = blob_service.get_container_client(CONTAINER)
@@ -52,14 +54,32 @@ def main():
     try:
         container_client.create_container()
         print(f"Created container '{CONTAINER}'")
-    except Exception:
+    except ResourceExistsError:
         print(f"Container '{CONTAINER}' already exists")
 
-    with open(LOCAL_CACHE, "r") as f:
-        data = f.read()
+    from src.auth import compress_token_cache
+
+    with open(LOCAL_CACHE, "rb") as f:
+        data = compress_token_cache(f.read())
+    md5 = hashlib.md5(data).digest()
 
     blob_client = container_client.get_blob_client(blob_name)
-    blob_client.upload_blob(data, overwrite=True)
+    try:
+        remote_md5 = blob_client.get_blob_properties().content_settings.content_md5
+    except ResourceNotFoundError:
+        remote_md5 = None
+    if remote_md5 is not None and bytes(remote_md5) == md5:
+        print(f"{CONTAINER}/{blob_name} is already up to date, skipping upload")
+        return
+
+    blob_client.upload_blob(
+        data,
+        overwrite=True,
+        length=len(data),
+        content_settings=ContentSettings(
+            content_type="application/json", content_encoding="gzip", content_md5=md5,
+        ),
+    )
 
     print(f"Uploaded {LOCAL_CACHE} -> {CONTAINER}/{blob_name}")
     print("Token cache is now available for Azure Functions.")
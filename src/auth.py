@@ -1,15 +1,21 @@
 from __future__ import annotations
 
+import gzip
 import json
 import logging
 import os
+import socketserver
 import sys
 import threading
+import time
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from typing import Any, Callable
 from urllib.parse import urlparse, parse_qs
 
 import msal
 import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
 
 logger = logging.getLogger("onenote_todo_sync")
 
@@ -20,9 +26,38 @@ SCOPES = [
     "https://graph.microsoft.com/User.Read",
 ]
 
+_ME_URL = "https://graph.microsoft.com/v1.0/me"
+
 TOKEN_CACHE_DIR = os.path.expanduser("~/.onenote-todo-sync")
 TOKEN_CACHE_PATH = os.path.join(TOKEN_CACHE_DIR, "token_cache.json")
 
+# Pooled HTTPS session shared by verify_connection() calls (keeps TLS alive)
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+class _BearerAuth(AuthBase):
+    """Set the Authorization header from a token getter at request time."""
+
+    def __init__(self, get_token):
+        self.get_token = get_token
+
+    def __call__(self, request):
+        request.headers["Authorization"] = "Bearer " + self.get_token()
+        return request
+
+
+class _CallbackServer(HTTPServer):
+    """One-shot OAuth callback server that binds without DNS lookups."""
+
+    allow_reuse_address = True
+
+    def server_bind(self):
+        # HTTPServer.server_bind calls socket.getfqdn(), a reverse DNS lookup
+        # that can stall for seconds; the server name is never used here.
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = self.server_address[:2]
+
 
 class AuthManager:
     """Handles MSAL device code flow authentication with persistent token cache."""
@@ -35,6 +70,17 @@ class AuthManager:
         self.cache_path = cache_path
         self.label = label or authority
         self.auth_flow = auth_flow
+        flows = {
+            "device_code": self._device_code_flow,
+            "interactive": self._interactive_flow,
+            "manual": self._manual_flow,
+        }
+        if auth_flow not in flows:
+            raise ValueError(
+                f"Unknown auth_flow {auth_flow!r}; expected one of: {', '.join(flows)}"
+            )
+        self._flow_fn = flows[auth_flow]
+        self.expires_at = 0.0
         self.cache = msal.SerializableTokenCache()
         self._load_cache()
         self.app = msal.PublicClientApplication(
@@ -42,6 +88,12 @@ class AuthManager:
             authority=self.authority,
             token_cache=self.cache,
         )
+        self._auth = _BearerAuth(self.get_token)
+
+    def _accept_token(self, result: dict) -> str:
+        # Record expiry so callers (GraphClient) can reuse the token until then
+        self.expires_at = time.time() + int(result.get("expires_in", 0) or 0)
+        return result["access_token"]
 
     def _load_cache(self):
         os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
@@ -64,18 +116,14 @@ class AuthManager:
             if result and "access_token" in result:
                 self._save_cache()
                 logger.debug("Token acquired silently (%s)", self.label)
-                return result["access_token"]
+                return self._accept_token(result)
             if result and "error" in result:
                 logger.warning(
                     "Silent token acquisition failed (%s): %s",
                     self.label, result.get("error_description"),
                 )
 
-        if self.auth_flow == "interactive":
-            return self._interactive_flow()
-        elif self.auth_flow == "manual":
-            return self._manual_flow()
-        return self._device_code_flow()
+        return self._flow_fn()
 
     def _device_code_flow(self) -> str:
         """Initiate device code flow for user authentication."""
@@ -101,7 +149,7 @@ class AuthManager:
         if "access_token" in result:
             self._save_cache()
             logger.info("Authentication successful via device code flow (%s)", self.label)
-            return result["access_token"]
+            return self._accept_token(result)
 
         error_msg = result.get("error_description", result.get("error", "Unknown error"))
         raise RuntimeError(f"Device code flow failed ({self.label}): {error_msg}")
@@ -122,7 +170,7 @@ class AuthManager:
         if "access_token" in result:
             self._save_cache()
             logger.info("Authentication successful via interactive flow (%s)", self.label)
-            return result["access_token"]
+            return self._accept_token(result)
 
         error_msg = result.get("error_description", result.get("error", "Unknown error"))
         raise RuntimeError(f"Interactive flow failed ({self.label}): {error_msg}")
@@ -162,7 +210,7 @@ class AuthManager:
         if "access_token" in result:
             self._save_cache()
             logger.info("Authentication successful via manual flow (%s)", self.label)
-            return result["access_token"]
+            return self._accept_token(result)
 
         error_msg = result.get("error_description", result.get("error", "Unknown error"))
         raise RuntimeError(f"Manual auth flow failed ({self.label}): {error_msg}")
@@ -190,7 +238,7 @@ class AuthManager:
                 # Suppress default HTTP log output
                 pass
 
-        server = HTTPServer(("localhost", port), CallbackHandler)
+        server = _CallbackServer(("localhost", port), CallbackHandler)
         server.handle_request()  # serve exactly one request
         server.server_close()
 
@@ -200,12 +248,7 @@ class AuthManager:
 
     def verify_connection(self) -> dict:
         """Verify the token works by calling /me endpoint."""
-        token = self.get_token()
-        resp = requests.get(
-            "https://graph.microsoft.com/v1.0/me",
-            headers={"Authorization": f"Bearer {token}"},
-            timeout=10,
-        )
+        resp = _SESSION.get(_ME_URL, auth=self._auth, timeout=10)
         resp.raise_for_status()
         user = resp.json()
         logger.info("Connected as (%s): %s (%s)",
@@ -233,36 +276,131 @@ def create_auth(client_id: str,
 # Azure Functions support: Blob-backed token cache + silent-only auth
 # ---------------------------------------------------------------------------
 
+# BlobServiceClient per connection string, reused across warm invocations
+_BLOB_SERVICE_CACHE: dict = {}
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def compress_token_cache(data: bytes) -> bytes:
+    """Gzip a serialized token cache deterministically (fixed mtime)."""
+    return gzip.compress(data, mtime=0)
+
+
+def _get_blob_service(connection_string: str):
+    """Return a cached BlobServiceClient for the connection string."""
+    service = _BLOB_SERVICE_CACHE.get(connection_string)
+    if service is None:
+        from azure.storage.blob import BlobServiceClient
+
+        service = BlobServiceClient.from_connection_string(connection_string)
+        _BLOB_SERVICE_CACHE[connection_string] = service
+    return service
+
+
 class BlobTokenCacheBackend:
     """Read/write MSAL SerializableTokenCache to Azure Blob Storage."""
 
     CONTAINER = "sync-data"
 
-    def __init__(self, connection_string: str, blob_name: str = "token_cache.json"):
-        from azure.storage.blob import BlobServiceClient
+    # Last seen (etag, data) per blob, shared across instances in this worker
+    _MEM_CACHE: dict[tuple[str, str, str], tuple[str, str]] = {}
+
+    # Containers already ensured in this process, keyed by account URL
+    _CONTAINERS_READY: set[tuple[str, str]] = set()
+
+    # Blobs known to be missing: monotonic time after which to look again
+    _MISSING_UNTIL: dict[tuple[str, str, str], float] = {}
+    MISSING_RECHECK_SECONDS = 300
 
+    def __init__(self, connection_string: str, blob_name: str = "token_cache.json",
+                 blob_service_factory: Callable[[str], Any] | None = None):
         self.blob_name = blob_name
-        self.blob_service = BlobServiceClient.from_connection_string(connection_string)
+        # A factory (e.g. a test stub) bypasses the lazy SDK import and process cache
+        factory = blob_service_factory or _get_blob_service
+        self.blob_service = factory(connection_string)
         self.container_client = self.blob_service.get_container_client(self.CONTAINER)
-        try:
-            self.container_client.create_container()
-        except Exception:
-            pass  # already exists
+
+        ready_key = (self.blob_service.url, self.CONTAINER)
+        if ready_key not in self._CONTAINERS_READY:
+            from azure.core.exceptions import ResourceExistsError
+
+            try:
+                self.container_client.create_container()
+            except ResourceExistsError:
+                pass
+            self._CONTAINERS_READY.add(ready_key)
+
+    @property
+    def _mem_key(self) -> tuple[str, str, str]:
+        return (self.blob_service.url, self.CONTAINER, self.blob_name)
 
     def load(self, cache: msal.SerializableTokenCache):
+        from azure.core import MatchConditions
+        from azure.core.exceptions import (
+            HttpResponseError, ResourceNotFoundError, ResourceNotModifiedError,
+        )
+
+        key = self._mem_key
+        if time.monotonic() < self._MISSING_UNTIL.get(key, 0.0):
+            logger.debug("Token cache blob still missing, skipping download")
+            return
+
+        cached = self._MEM_CACHE.get(key)
         try:
             blob_client = self.container_client.get_blob_client(self.blob_name)
-            data = blob_client.download_blob().readall().decode("utf-8")
+            if cached:
+                # Conditional GET: the service answers 304 if the blob is unchanged
+                downloader = blob_client.download_blob(
+                    etag=cached[0], match_condition=MatchConditions.IfModified,
+                )
+            else:
+                downloader = blob_client.download_blob()
+            raw = downloader.readall()
+            # The SDK inflates Content-Encoding: gzip itself; handle raw gzip too
+            if raw[:2] == _GZIP_MAGIC:
+                raw = gzip.decompress(raw)
+            data = raw.decode("utf-8")
+            self._MEM_CACHE[key] = (downloader.properties.etag, data)
+            self._MISSING_UNTIL.pop(key, None)
             cache.deserialize(data)
             logger.debug("Token cache loaded from Blob Storage")
-        except Exception as exc:
-            logger.warning("Could not load token cache from Blob: %s", exc)
+        except ResourceNotModifiedError:
+            cache.deserialize(cached[1])
+            logger.debug("Token cache unchanged in Blob Storage, using in-memory copy")
+        except ResourceNotFoundError:
+            self._MEM_CACHE.pop(key, None)
+            self._MISSING_UNTIL[key] = time.monotonic() + self.MISSING_RECHECK_SECONDS
+            logger.warning("Token cache blob %s/%s not found", self.CONTAINER, self.blob_name)
+        except HttpResponseError as exc:
+            logger.warning("Could not load token cache from Blob (HTTP %s): %s",
+                           exc.status_code, exc.reason)
+        except (ValueError, OSError, EOFError) as exc:
+            # Bad or truncated gzip, undecodable or malformed JSON;
+            # get_token() reports the empty cache
+            logger.warning("Token cache blob %s is corrupt: %s", self.blob_name, exc)
 
     def save(self, cache: msal.SerializableTokenCache):
-        if cache.has_state_changed:
-            blob_client = self.container_client.get_blob_client(self.blob_name)
-            blob_client.upload_blob(cache.serialize(), overwrite=True)
-            logger.debug("Token cache saved to Blob Storage")
+        if not cache.has_state_changed:
+            return
+        data = cache.serialize()
+        cached = self._MEM_CACHE.get(self._mem_key)
+        if cached and cached[1] == data:
+            logger.debug("Token cache unchanged, skipping Blob upload")
+            return
+
+        from azure.storage.blob import ContentSettings
+
+        blob_client = self.container_client.get_blob_client(self.blob_name)
+        result = blob_client.upload_blob(
+            compress_token_cache(data.encode("utf-8")),
+            overwrite=True,
+            content_settings=ContentSettings(
+                content_type="application/json", content_encoding="gzip",
+            ),
+        )
+        self._MEM_CACHE[self._mem_key] = (result.get("etag"), data)
+        logger.debug("Token cache saved to Blob Storage")
 
 
 class AzureAuthManager:
@@ -286,16 +424,35 @@ class AzureAuthManager:
             authority=self.authority,
             token_cache=self.cache,
         )
+        # Single-user cache: remember the account instead of re-enumerating
+        self._account = None
+        self.expires_at = 0.0
+        self._auth = _BearerAuth(self.get_token)
+
+    def _accept_token(self, result: dict) -> str:
+        # Record expiry so callers (GraphClient) can reuse the token until then
+        self.expires_at = time.time() + int(result.get("expires_in", 0) or 0)
+        return result["access_token"]
 
     def get_token(self) -> str:
         """Get a valid access token using silent auth only."""
+        if self._account is not None:
+            result = self.app.acquire_token_silent(self.scopes, account=self._account)
+            if result and "access_token" in result:
+                self.blob_backend.save(self.cache)
+                logger.debug("Token acquired silently (%s)", self.label)
+                return self._accept_token(result)
+            # Fall back to a full account lookup
+            self._account = None
+
         accounts = self.app.get_accounts()
         if accounts:
             result = self.app.acquire_token_silent(self.scopes, account=accounts[0])
             if result and "access_token" in result:
+                self._account = accounts[0]
                 self.blob_backend.save(self.cache)
                 logger.debug("Token acquired silently (%s)", self.label)
-                return result["access_token"]
+                return self._accept_token(result)
             error = result.get("error_description", "unknown") if result else "no result"
             raise RuntimeError(
                 f"Silent token acquisition failed ({self.label}): {error}. "
@@ -309,21 +466,20 @@ class AzureAuthManager:
 
     def verify_connection(self) -> dict:
         """Verify the token works by calling /me endpoint."""
-        token = self.get_token()
-        resp = requests.get(
-            "https://graph.microsoft.com/v1.0/me",
-            headers={"Authorization": f"Bearer {token}"},
-            timeout=10,
-        )
+        resp = _SESSION.get(_ME_URL, auth=self._auth, timeout=10)
         resp.raise_for_status()
         return resp.json()
 
 
 def create_auth_azure(client_id: str, connection_string: str,
                       authority: str = "https://login.microsoftonline.com/consumers",
-                      blob_name: str = "token_cache.json") -> AzureAuthManager:
+                      blob_name: str = "token_cache.json",
+                      blob_service_factory: Callable[[str], Any] | None = None,
+                      ) -> AzureAuthManager:
     """Create AzureAuthManager with Blob Storage-backed token cache."""
-    blob_backend = BlobTokenCacheBackend(connection_string, blob_name=blob_name)
+    blob_backend = BlobTokenCacheBackend(
+        connection_string, blob_name=blob_name, blob_service_factory=blob_service_factory,
+    )
     return AzureAuthManager(
         client_id=client_id,
         authority=authority,
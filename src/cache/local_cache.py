@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import json
 import logging
 import os
 import sqlite3
-from datetime import datetime, timezone
+import threading
+from contextlib import contextmanager
+
+from src.utils.clock import now_iso
 
 logger = logging.getLogger("onenote_todo_sync")
 
@@ -11,16 +15,139 @@ CACHE_DIR = os.path.expanduser("~/.onenote-todo-sync")
 CACHE_DB_PATH = os.path.join(CACHE_DIR, "sync_cache.db")
 
 
+# Columns a caller may omit on update; omitted ones keep their stored value
+_UPDATABLE_COLUMNS = (
+    "list_id", "list_name", "title", "onenote_page_id", "onenote_link",
+    "calendar_event_id", "status", "due_date", "last_modified_todo", "needs_onenote",
+)
+_NOT_NULL_COLUMNS = ("list_id", "list_name", "title", "status")
+
+# Native UPSERT: one statement, no read-before-write. A column is overwritten
+# only when its key was present in task_data (:set_<col>), as before.
+_UPSERT_TASK_SQL = """
+    INSERT INTO synced_tasks
+        (task_id, list_id, list_name, title, onenote_page_id,
+         onenote_link, calendar_event_id, status, due_date,
+         last_modified_todo, last_modified_local, needs_onenote,
+         created_at, updated_at)
+    VALUES
+        (:task_id, :list_id, :list_name, :title, :onenote_page_id,
+         :onenote_link, :calendar_event_id, :status, :due_date,
+         :last_modified_todo, :now, COALESCE(:needs_onenote, 0),
+         :now, :now)
+    ON CONFLICT(task_id) DO UPDATE SET
+        list_id = CASE WHEN :set_list_id THEN excluded.list_id ELSE list_id END,
+        list_name = CASE WHEN :set_list_name THEN excluded.list_name ELSE list_name END,
+        title = CASE WHEN :set_title THEN excluded.title ELSE title END,
+        onenote_page_id = CASE WHEN :set_onenote_page_id
+            THEN excluded.onenote_page_id ELSE onenote_page_id END,
+        onenote_link = CASE WHEN :set_onenote_link
+            THEN excluded.onenote_link ELSE onenote_link END,
+        calendar_event_id = CASE WHEN :set_calendar_event_id
+            THEN excluded.calendar_event_id ELSE calendar_event_id END,
+        status = CASE WHEN :set_status THEN excluded.status ELSE status END,
+        due_date = CASE WHEN :set_due_date THEN excluded.due_date ELSE due_date END,
+        last_modified_todo = CASE WHEN :set_last_modified_todo
+            THEN excluded.last_modified_todo ELSE last_modified_todo END,
+        needs_onenote = CASE WHEN :set_needs_onenote
+            THEN :needs_onenote ELSE needs_onenote END,
+        last_modified_local = excluded.last_modified_local,
+        updated_at = excluded.updated_at
+"""
+
+# Partial writes (a NOT NULL column omitted) may only touch an existing row;
+# the INSERT half of the UPSERT would reject them even when the row exists
+_UPDATE_TASK_SQL = """
+    UPDATE synced_tasks SET
+        list_id = CASE WHEN :set_list_id THEN :list_id ELSE list_id END,
+        list_name = CASE WHEN :set_list_name THEN :list_name ELSE list_name END,
+        title = CASE WHEN :set_title THEN :title ELSE title END,
+        onenote_page_id = CASE WHEN :set_onenote_page_id
+            THEN :onenote_page_id ELSE onenote_page_id END,
+        onenote_link = CASE WHEN :set_onenote_link
+            THEN :onenote_link ELSE onenote_link END,
+        calendar_event_id = CASE WHEN :set_calendar_event_id
+            THEN :calendar_event_id ELSE calendar_event_id END,
+        status = CASE WHEN :set_status THEN :status ELSE status END,
+        due_date = CASE WHEN :set_due_date THEN :due_date ELSE due_date END,
+        last_modified_todo = CASE WHEN :set_last_modified_todo
+            THEN :last_modified_todo ELSE last_modified_todo END,
+        needs_onenote = CASE WHEN :set_needs_onenote
+            THEN :needs_onenote ELSE needs_onenote END,
+        last_modified_local = :now,
+        updated_at = :now
+    WHERE task_id = :task_id
+"""
+
+
+# Fixed SQL text so sqlite3's per-connection statement cache always hits
+_SELECT_TASK_SQL = "SELECT * FROM synced_tasks WHERE task_id = ?"
+_SELECT_ALL_TASKS_SQL = "SELECT * FROM synced_tasks"
+_SELECT_TASKS_BY_LIST_SQL = "SELECT * FROM synced_tasks WHERE list_name = ?"
+# Remote ids travel as one JSON array so the SQL text stays fixed
+_SELECT_REMOVED_TASKS_SQL = """
+    SELECT task_id, list_name, title, calendar_event_id FROM synced_tasks
+    WHERE list_name = ? AND task_id NOT IN (SELECT value FROM json_each(?))
+"""
+_SELECT_PENDING_TASKS_SQL = (
+    "SELECT list_name, title FROM synced_tasks WHERE status != 'completed' ORDER BY list_name"
+)
+_DELETE_TASK_SQL = "DELETE FROM synced_tasks WHERE task_id = ?"
+_INSERT_LOG_SQL = (
+    "INSERT INTO sync_log (timestamp, action, task_id, details, success) VALUES (?, ?, ?, ?, ?)"
+)
+_SELECT_DELTA_LINK_SQL = "SELECT delta_link FROM delta_links WHERE list_name = ?"
+_UPSERT_DELTA_LINK_SQL = """
+    INSERT INTO delta_links (list_name, delta_link, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT(list_name) DO UPDATE SET
+        delta_link = excluded.delta_link, updated_at = excluded.updated_at
+"""
+_SELECT_REVIEW_SQL = "SELECT * FROM weekly_reviews WHERE week_start = ?"
+_INSERT_REVIEW_SQL = (
+    "INSERT INTO weekly_reviews (event_id, week_start, created_at) VALUES (?, ?, ?)"
+)
+
+
+def _upsert_params(task_data: dict, now: str) -> dict:
+    """Named parameters for _UPSERT_TASK_SQL."""
+    params = {"task_id": task_data["task_id"], "now": now}
+    for col in _UPDATABLE_COLUMNS:
+        params[col] = task_data.get(col)
+        params["set_" + col] = col in task_data
+    return params
+
+
+def _is_partial(params: dict) -> bool:
+    """True if a NOT NULL column was omitted, so only an existing row can be updated."""
+    return not all(params["set_" + col] for col in _NOT_NULL_COLUMNS)
+
+
 class SyncCache:
     """SQLite-backed cache for tracking synchronization state."""
 
     def __init__(self, db_path: str = CACHE_DB_PATH):
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        directory = os.path.dirname(db_path)
+        if directory:  # empty for ":memory:" and bare file names
+            os.makedirs(directory, exist_ok=True)
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path)
+        # Shared by the engine's per-list worker threads; _lock serializes access
+        self.conn = sqlite3.connect(db_path, cached_statements=256, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        self._txn_depth = 0
+        self._configure()
         self._create_tables()
 
+    def _configure(self):
+        # WAL + synchronous=NORMAL: one fsync per checkpoint instead of two per commit
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA cache_size=-20000;
+            PRAGMA busy_timeout=30000;
+        """)
+
     def _create_tables(self):
         self.conn.executescript("""
             CREATE TABLE IF NOT EXISTS synced_tasks (
@@ -55,105 +182,145 @@ class SyncCache:
                 week_start TEXT NOT NULL,
                 created_at TEXT NOT NULL
             );
+
+            CREATE TABLE IF NOT EXISTS delta_links (
+                list_name TEXT PRIMARY KEY,
+                delta_link TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_tasks_list_name ON synced_tasks(list_name);
+            CREATE INDEX IF NOT EXISTS idx_log_task_id ON sync_log(task_id);
+            CREATE INDEX IF NOT EXISTS idx_weekly_reviews_week_start ON weekly_reviews(week_start);
         """)
+        # Gather planner statistics once; later opens reuse sqlite_stat1
+        has_stats = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).fetchone()
+        if not has_stats:
+            self.conn.execute("ANALYZE")
         self.conn.commit()
 
+    @contextmanager
+    def transaction(self):
+        """Group writes into one commit; nested calls join the outer transaction."""
+        if self._txn_depth:
+            self._txn_depth += 1
+            try:
+                yield self
+            finally:
+                self._txn_depth -= 1
+            return
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        self._txn_depth = 1
+        try:
+            yield self
+        except BaseException:
+            self._txn_depth = 0
+            self.conn.rollback()
+            raise
+        self._txn_depth = 0
+        self.conn.commit()
+
+    def _commit(self):
+        # Ad-hoc writes outside transaction() keep committing immediately
+        if not self._txn_depth:
+            self.conn.commit()
+
     def get_task(self, task_id: str) -> dict | None:
-        row = self.conn.execute(
-            "SELECT * FROM synced_tasks WHERE task_id = ?", (task_id,)
-        ).fetchone()
+        with self._lock:
+            row = self.conn.execute(_SELECT_TASK_SQL, (task_id,)).fetchone()
         return dict(row) if row else None
 
     def get_all_tasks(self) -> list[dict]:
-        rows = self.conn.execute("SELECT * FROM synced_tasks").fetchall()
+        with self._lock:
+            rows = self.conn.execute(_SELECT_ALL_TASKS_SQL).fetchall()
         return [dict(r) for r in rows]
 
     def get_tasks_by_list(self, list_name: str) -> list[dict]:
-        rows = self.conn.execute(
-            "SELECT * FROM synced_tasks WHERE list_name = ?", (list_name,)
-        ).fetchall()
+        with self._lock:
+            rows = self.conn.execute(_SELECT_TASKS_BY_LIST_SQL, (list_name,)).fetchall()
         return [dict(r) for r in rows]
 
-    def upsert_task(self, task_data: dict):
-        now = datetime.now(timezone.utc).isoformat()
-        existing = self.get_task(task_data["task_id"])
-
-        if existing:
-            self.conn.execute(
-                """UPDATE synced_tasks SET
-                    list_id=?, list_name=?, title=?, onenote_page_id=?,
-                    onenote_link=?, calendar_event_id=?, status=?,
-                    due_date=?, last_modified_todo=?, last_modified_local=?,
-                    needs_onenote=?, updated_at=?
-                WHERE task_id=?""",
-                (
-                    task_data.get("list_id", existing["list_id"]),
-                    task_data.get("list_name", existing["list_name"]),
-                    task_data.get("title", existing["title"]),
-                    task_data.get("onenote_page_id", existing["onenote_page_id"]),
-                    task_data.get("onenote_link", existing["onenote_link"]),
-                    task_data.get("calendar_event_id", existing["calendar_event_id"]),
-                    task_data.get("status", existing["status"]),
-                    task_data.get("due_date", existing["due_date"]),
-                    task_data.get("last_modified_todo", existing["last_modified_todo"]),
-                    now,
-                    task_data.get("needs_onenote", existing["needs_onenote"]),
-                    now,
-                    task_data["task_id"],
-                ),
-            )
-        else:
-            self.conn.execute(
-                """INSERT INTO synced_tasks
-                    (task_id, list_id, list_name, title, onenote_page_id,
-                     onenote_link, calendar_event_id, status, due_date,
-                     last_modified_todo, last_modified_local, needs_onenote,
-                     created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (
-                    task_data["task_id"],
-                    task_data["list_id"],
-                    task_data["list_name"],
-                    task_data["title"],
-                    task_data.get("onenote_page_id"),
-                    task_data.get("onenote_link"),
-                    task_data.get("calendar_event_id"),
-                    task_data["status"],
-                    task_data.get("due_date"),
-                    task_data.get("last_modified_todo"),
-                    now,
-                    task_data.get("needs_onenote", 0),
-                    now,
-                    now,
-                ),
-            )
-        self.conn.commit()
+    def find_removed_tasks(self, list_name: str, remote_ids: set[str]) -> list[dict]:
+        """Cached tasks of list_name whose id is not in remote_ids."""
+        with self._lock:
+            rows = self.conn.execute(
+                _SELECT_REMOVED_TASKS_SQL, (list_name, json.dumps(list(remote_ids))),
+            ).fetchall()
+        return [dict(r) for r in rows]
 
-    def delete_task(self, task_id: str):
-        self.conn.execute("DELETE FROM synced_tasks WHERE task_id = ?", (task_id,))
-        self.conn.commit()
+    def get_pending_tasks(self) -> list[dict]:
+        """list_name and title of every task not completed, grouped by list."""
+        with self._lock:
+            rows = self.conn.execute(_SELECT_PENDING_TASKS_SQL).fetchall()
+        return [dict(r) for r in rows]
+
+    def upsert_task(self, task_data: dict, prior: dict | None = None):
+        # prior is accepted for parity with TableSyncCache; the UPSERT needs no lookup
+        with self._lock:
+            self._write_task(_upsert_params(task_data, now_iso()))
+            self._commit()
+
+    def _write_task(self, params: dict):
+        if _is_partial(params) and self.conn.execute(_UPDATE_TASK_SQL, params).rowcount:
+            return
+        # New rows keep NOT NULL strict: a missing column raises IntegrityError
+        self.conn.execute(_UPSERT_TASK_SQL, params)
+
+    def upsert_tasks_many(self, tasks: list[dict]):
+        """Upsert several tasks with one executemany inside a single transaction."""
+        now = now_iso()
+        rows = [_upsert_params(t, now) for t in tasks]
+        with self._lock, self.transaction():
+            if not any(_is_partial(p) for p in rows):
+                self.conn.executemany(_UPSERT_TASK_SQL, rows)
+                return
+            # Keep the caller's order when some rows are partial updates
+            for params in rows:
+                self._write_task(params)
+
+    def delete_task(self, task_id: str, list_name: str | None = None):
+        with self._lock:
+            self.conn.execute(_DELETE_TASK_SQL, (task_id,))
+            self._commit()
 
     def log_action(self, action: str, task_id: str = None, details: str = None, success: bool = True):
-        now = datetime.now(timezone.utc).isoformat()
-        self.conn.execute(
-            "INSERT INTO sync_log (timestamp, action, task_id, details, success) VALUES (?, ?, ?, ?, ?)",
-            (now, action, task_id, details, 1 if success else 0),
-        )
-        self.conn.commit()
+        now = now_iso()
+        with self._lock:
+            self.conn.execute(_INSERT_LOG_SQL, (now, action, task_id, details, 1 if success else 0))
+            self._commit()
+
+    def log_actions_many(self, entries: list[tuple]):
+        """Write (action, task_id, details, success) log entries in one transaction."""
+        now = now_iso()
+        rows = [
+            (now, action, task_id, details, 1 if success else 0)
+            for action, task_id, details, success in entries
+        ]
+        with self._lock, self.transaction():
+            self.conn.executemany(_INSERT_LOG_SQL, rows)
+
+    def get_delta_link(self, list_name: str) -> str | None:
+        with self._lock:
+            row = self.conn.execute(_SELECT_DELTA_LINK_SQL, (list_name,)).fetchone()
+        return row["delta_link"] if row else None
+
+    def set_delta_link(self, list_name: str, delta_link: str):
+        with self._lock:
+            self.conn.execute(_UPSERT_DELTA_LINK_SQL, (list_name, delta_link, now_iso()))
+            self._commit()
 
     def get_weekly_review(self, week_start: str) -> dict | None:
-        row = self.conn.execute(
-            "SELECT * FROM weekly_reviews WHERE week_start = ?", (week_start,)
-        ).fetchone()
+        with self._lock:
+            row = self.conn.execute(_SELECT_REVIEW_SQL, (week_start,)).fetchone()
         return dict(row) if row else None
 
     def save_weekly_review(self, event_id: str, week_start: str):
-        now = datetime.now(timezone.utc).isoformat()
-        self.conn.execute(
-            "INSERT INTO weekly_reviews (event_id, week_start, created_at) VALUES (?, ?, ?)",
-            (event_id, week_start, now),
-        )
-        self.conn.commit()
+        with self._lock:
+            self.conn.execute(_INSERT_REVIEW_SQL, (event_id, week_start, now_iso()))
+            self._commit()
 
     def close(self):
         self.conn.close()
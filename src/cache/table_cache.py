@@ -1,12 +1,15 @@
 from __future__ import annotations
 
+import itertools
 import logging
-import random
-import string
+import os
 import time
-from datetime import datetime, timezone
+from contextlib import contextmanager
 
-from azure.data.tables import TableServiceClient
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.data.tables import TableServiceClient, UpdateMode
+
+from src.utils.clock import now_iso, utc_timestamp
 
 logger = logging.getLogger("onenote_todo_sync")
 
@@ -31,37 +34,61 @@ _TASK_FIELD_MAP = {
 # Reverse mapping: snake_case -> PascalCase
 _TASK_REVERSE_MAP = {v: k for k, v in _TASK_FIELD_MAP.items()}
 
+# Entity columns written from task fields (the keys are handled separately)
+_ENTITY_FIELDS = tuple(
+    (local, azure) for local, azure in _TASK_REVERSE_MAP.items()
+    if local not in ("task_id", "list_name")
+)
+
+# Entity Group Transactions accept at most 100 operations on one partition
+_BATCH_SIZE = 100
+
+# Log RowKey sequence; the per-process seed keeps concurrent workers apart
+_LOG_SEQ = itertools.count(((os.getpid() ^ int.from_bytes(os.urandom(2), "big")) & 0xFFFF) << 16)
+
 
 class TableSyncCache:
     """Azure Table Storage-backed cache for tracking synchronization state."""
 
+    # Log entities held back while a transaction() is open, else None
+    _pending_logs: list[dict] | None = None
+
+    # Tables already ensured in this process, keyed by account URL
+    _TABLES_READY: set[tuple[str, str]] = set()
+
     def __init__(self, connection_string: str, table_prefix: str = ""):
         self.service = TableServiceClient.from_connection_string(connection_string)
         self.TASKS_TABLE = f"{table_prefix}SyncedTasks"
         self.LOG_TABLE = f"{table_prefix}SyncLog"
         self.REVIEWS_TABLE = f"{table_prefix}WeeklyReviews"
+        self.DELTA_TABLE = f"{table_prefix}DeltaLinks"
         self._ensure_tables()
         self.tasks_client = self.service.get_table_client(self.TASKS_TABLE)
         self.log_client = self.service.get_table_client(self.LOG_TABLE)
         self.reviews_client = self.service.get_table_client(self.REVIEWS_TABLE)
+        self.delta_client = self.service.get_table_client(self.DELTA_TABLE)
 
     def _ensure_tables(self):
-        for name in (self.TASKS_TABLE, self.LOG_TABLE, self.REVIEWS_TABLE):
+        # A warm worker rebuilding its cache skips the create_table round trips
+        for name in (self.TASKS_TABLE, self.LOG_TABLE, self.REVIEWS_TABLE, self.DELTA_TABLE):
+            ready_key = (self.service.url, name)
+            if ready_key in self._TABLES_READY:
+                continue
             try:
                 self.service.create_table(name)
-            except Exception:
-                # Table already exists
+            except ResourceExistsError:
                 pass
+            # Other failures (network, auth, throttling) propagate and are retried next time
+            self._TABLES_READY.add(ready_key)
 
     @staticmethod
     def _entity_to_task(entity: dict) -> dict:
         """Map Azure Table entity (PascalCase) to the dict format SyncEngine expects."""
-        task = {}
-        for azure_key, local_key in _TASK_FIELD_MAP.items():
-            value = entity.get(azure_key)
-            # Azure Table stores None as missing keys; normalise to None
-            task[local_key] = value if value != "" else None
-        return task
+        # Azure Table stores None as missing or empty values; normalise "" to None
+        return {
+            local_key: None if entity.get(azure_key) == "" else entity.get(azure_key)
+            for azure_key, local_key in _TASK_FIELD_MAP.items()
+        }
 
     @staticmethod
     def _task_to_entity(task_data: dict) -> dict:
@@ -70,76 +97,200 @@ class TableSyncCache:
             "PartitionKey": task_data.get("list_name", ""),
             "RowKey": task_data["task_id"],
         }
-        skip = {"task_id", "list_name"}
-        for local_key, azure_key in _TASK_REVERSE_MAP.items():
-            if local_key in skip:
-                continue
-            value = task_data.get(local_key)
-            entity[azure_key] = value if value is not None else ""
+        entity.update({
+            azure_key: "" if task_data.get(local_key) is None else task_data[local_key]
+            for local_key, azure_key in _ENTITY_FIELDS
+        })
         return entity
 
+    @contextmanager
+    def transaction(self):
+        """Buffer log writes and flush them in batches on exit; task writes apply immediately."""
+        if self._pending_logs is not None:
+            yield self
+            return
+
+        self._pending_logs = []
+        try:
+            yield self
+        except BaseException:
+            # Logs are flushed even when the block fails; they describe what happened,
+            # but a flush error must not replace the block's own exception
+            try:
+                self._flush_logs()
+            except Exception:
+                logger.exception("Failed to flush buffered sync log entries")
+            raise
+        self._flush_logs()
+
+    def _flush_logs(self):
+        pending, self._pending_logs = self._pending_logs, None
+        if pending:
+            self._submit_batches(self.log_client, pending)
+
     def get_task(self, task_id: str) -> dict | None:
-        # task_id is the RowKey; PartitionKey is unknown, so we query
-        entities = list(
-            self.tasks_client.query_entities(f"RowKey eq '{task_id}'")
-        )
-        if not entities:
-            return None
-        return self._entity_to_task(entities[0])
+        # task_id is the RowKey; PartitionKey is unknown, so we query.
+        # Stop at the first hit instead of paging through the whole scan.
+        entities = self.tasks_client.query_entities(f"RowKey eq '{task_id}'")
+        entity = next(iter(entities), None)
+        return None if entity is None else self._entity_to_task(entity)
 
     def get_all_tasks(self) -> list[dict]:
-        entities = list(self.tasks_client.list_entities())
+        # Table Storage caps pages at 1000 entities; ask for full pages
+        entities = self.tasks_client.list_entities(results_per_page=1000)
         return [self._entity_to_task(e) for e in entities]
 
     def get_tasks_by_list(self, list_name: str) -> list[dict]:
-        entities = list(
-            self.tasks_client.query_entities(f"PartitionKey eq '{list_name}'")
-        )
+        entities = self.tasks_client.query_entities(f"PartitionKey eq '{list_name}'")
         return [self._entity_to_task(e) for e in entities]
 
-    def upsert_task(self, task_data: dict):
-        now = datetime.now(timezone.utc).isoformat()
+    def find_removed_tasks(self, list_name: str, remote_ids: set[str]) -> list[dict]:
+        """Cached tasks of list_name whose id is not in remote_ids."""
+        # The filter cannot carry the id set; fetch only the needed columns
+        entities = self.tasks_client.query_entities(
+            f"PartitionKey eq '{list_name}'",
+            select=["PartitionKey", "RowKey", "Title", "CalendarEventId"],
+        )
+        return [
+            {
+                "task_id": e["RowKey"],
+                "list_name": e["PartitionKey"],
+                "title": e.get("Title", ""),
+                "calendar_event_id": e.get("CalendarEventId") or None,
+            }
+            for e in entities
+            if e["RowKey"] not in remote_ids
+        ]
+
+    def get_pending_tasks(self) -> list[dict]:
+        """list_name and title of every task not completed, grouped by list."""
+        # Results come back in PartitionKey (list_name) order
+        entities = self.tasks_client.query_entities(
+            "Status ne 'completed'", select=["PartitionKey", "Title"],
+        )
+        return [{"list_name": e["PartitionKey"], "title": e.get("Title", "")} for e in entities]
 
-        existing = self.get_task(task_data["task_id"])
+    def _merged_entity(self, task_data: dict, existing: dict | None, now: str) -> dict:
         if existing:
             # Merge: keep old values for missing keys
             merged = dict(existing)
             merged.update({k: v for k, v in task_data.items() if v is not None})
             merged["last_modified_local"] = now
             merged["updated_at"] = now
-            entity = self._task_to_entity(merged)
-        else:
-            task_data.setdefault("created_at", now)
-            task_data["updated_at"] = now
-            task_data["last_modified_local"] = now
-            entity = self._task_to_entity(task_data)
-
-        self.tasks_client.upsert_entity(entity)
-
-    def delete_task(self, task_id: str):
-        # Need partition key to delete; look it up first
-        existing = self.get_task(task_id)
-        if existing:
-            self.tasks_client.delete_entity(
-                partition_key=existing["list_name"],
-                row_key=task_id,
-            )
+            return self._task_to_entity(merged)
+        task_data.setdefault("created_at", now)
+        task_data["updated_at"] = now
+        task_data["last_modified_local"] = now
+        return self._task_to_entity(task_data)
 
-    def log_action(self, action: str, task_id: str = None, details: str = None, success: bool = True):
-        now = datetime.now(timezone.utc)
-        # Reverse timestamp for newest-first ordering
-        reverse_ts = str(9999999999 - int(now.timestamp()))
-        suffix = "".join(random.choices(string.ascii_lowercase, k=4))
+    def _submit_batches(self, client, entities: list[dict]):
+        """Upsert entities in per-partition transactions of up to _BATCH_SIZE."""
+        by_partition: dict[str, list[dict]] = {}
+        for entity in entities:
+            by_partition.setdefault(entity["PartitionKey"], []).append(entity)
+        for batch in by_partition.values():
+            for i in range(0, len(batch), _BATCH_SIZE):
+                client.submit_transaction(
+                    [("upsert", e) for e in batch[i:i + _BATCH_SIZE]]
+                )
+
+    def upsert_task(self, task_data: dict, prior: dict | None = None):
+        """Upsert a task; pass the cached row as prior, or {} for a new one, to skip the lookup."""
+        now = now_iso()
+        if prior is not None:
+            self.tasks_client.upsert_entity(self._merged_entity(task_data, prior, now))
+            return
+
+        # Blind server-side merge: omitted and None fields keep their stored value
         entity = {
+            "PartitionKey": task_data.get("list_name", ""),
+            "RowKey": task_data["task_id"],
+            "LastModifiedLocal": now,
+            "UpdatedAt": now,
+        }
+        # Unmapped keys are ignored, as in _task_to_entity
+        for local_key, azure_key in _ENTITY_FIELDS:
+            if task_data.get(local_key) is not None:
+                entity[azure_key] = task_data[local_key]
+        try:
+            self.tasks_client.update_entity(entity, mode=UpdateMode.MERGE)
+        except ResourceNotFoundError:
+            self.tasks_client.upsert_entity(self._merged_entity(task_data, None, now))
+
+    def upsert_tasks_many(self, tasks: list[dict]):
+        """Upsert several tasks, one existing-row query per list instead of per task."""
+        now = now_iso()
+        by_list: dict[str, list[dict]] = {}
+        for task_data in tasks:
+            by_list.setdefault(task_data.get("list_name", ""), []).append(task_data)
+
+        entities = {}
+        for list_name, batch in by_list.items():
+            existing = {
+                e["RowKey"]: self._entity_to_task(e)
+                for e in self.tasks_client.query_entities(f"PartitionKey eq '{list_name}'")
+            }
+            for task_data in batch:
+                entity = self._merged_entity(task_data, existing.get(task_data["task_id"]), now)
+                # A transaction may not touch the same row twice; last write wins
+                entities[(entity["PartitionKey"], entity["RowKey"])] = entity
+        self._submit_batches(self.tasks_client, list(entities.values()))
+
+    def delete_task(self, task_id: str, list_name: str | None = None):
+        if list_name is None:
+            # Partition key unknown; look it up first
+            existing = self.get_task(task_id)
+            if not existing:
+                return
+            list_name = existing["list_name"]
+        # delete_entity ignores rows that are already gone
+        self.tasks_client.delete_entity(partition_key=list_name, row_key=task_id)
+
+    @staticmethod
+    def _log_entity(action: str, task_id: str | None, details: str | None,
+                    success: bool) -> dict:
+        epoch, now = utc_timestamp()
+        # Reverse timestamp for newest-first ordering
+        reverse_ts = str(9999999999 - epoch)
+        return {
             "PartitionKey": "log",
-            "RowKey": f"{reverse_ts}-{suffix}",
-            "LogTimestamp": now.isoformat(),
+            "RowKey": f"{reverse_ts}-{next(_LOG_SEQ) & 0xFFFFFFFF:08x}",
+            "LogTimestamp": now,
             "Action": action,
             "TaskId": task_id or "",
             "Details": details or "",
             "Success": success,
         }
-        self.log_client.upsert_entity(entity)
+
+    def log_action(self, action: str, task_id: str = None, details: str = None, success: bool = True):
+        pending = self._pending_logs
+        if pending is None:
+            self.log_client.upsert_entity(self._log_entity(action, task_id, details, success))
+            return
+        pending.append(self._log_entity(action, task_id, details, success))
+
+    def log_actions_many(self, entries: list[tuple]):
+        """Write (action, task_id, details, success) log entries in batched transactions."""
+        entities = [
+            self._log_entity(action, task_id, details, success)
+            for action, task_id, details, success in entries
+        ]
+        self._submit_batches(self.log_client, entities)
+
+    def get_delta_link(self, list_name: str) -> str | None:
+        try:
+            entity = self.delta_client.get_entity(partition_key="delta", row_key=list_name)
+        except ResourceNotFoundError:
+            return None
+        return entity.get("DeltaLink") or None
+
+    def set_delta_link(self, list_name: str, delta_link: str):
+        self.delta_client.upsert_entity({
+            "PartitionKey": "delta",
+            "RowKey": list_name,
+            "DeltaLink": delta_link,
+            "UpdatedAt": now_iso(),
+        })
 
     def get_weekly_review(self, week_start: str) -> dict | None:
         try:
@@ -156,7 +307,7 @@ class TableSyncCache:
             return None
 
     def save_weekly_review(self, event_id: str, week_start: str):
-        now = datetime.now(timezone.utc).isoformat()
+        now = now_iso()
         entity = {
             "PartitionKey": "review",
             "RowKey": week_start,
@@ -166,5 +317,5 @@ class TableSyncCache:
         self.reviews_client.upsert_entity(entity)
 
     def close(self):
-        # No persistent connection to close for Table Storage
-        pass
+        # No persistent connection to close; just flush buffered logs
+        self._flush_logs()
@@ -1,30 +1,102 @@
+from __future__ import annotations
+
 import logging
 import os
 import random
+import threading
 import time
+from typing import Callable
 
 import requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger("onenote_todo_sync")
 
 BASE_URL = "https://graph.microsoft.com/v1.0"
 
+# JSON batching accepts at most 20 sub-requests per call
+BATCH_LIMIT = 20
+
+# Set by the Functions host before the worker imports us, so read it once
+_IS_AZURE = bool(os.environ.get("AZURE_FUNCTIONS_ENVIRONMENT"))
+
+
+def create_session(pool_connections: int = 8, pool_maxsize: int = 32) -> requests.Session:
+    """Build a requests.Session with a pooled keep-alive adapter for Graph.
+
+    Status-code retries are left to GraphClient._request (Retry-After, backoff).
+    """
+    session = requests.Session()
+    session.mount(
+        "https://graph.microsoft.com",
+        HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize),
+    )
+    return session
+
 
 class GraphClient:
     """HTTP client for Microsoft Graph API with retry, rate limiting, and pagination."""
 
-    def __init__(self, auth_manager, timeout: int = 60, max_retries: int = 3):
+    def __init__(self, auth_manager, timeout: int = 60, max_retries: int = 3,
+                 session: requests.Session | None = None,
+                 sleep_fn: Callable[[float], None] = time.sleep):
         self.auth = auth_manager
         self.timeout = timeout
         self.max_retries = max_retries
-        self.session = requests.Session()
+        self.session = session or create_session()
+        self._sleep = sleep_fn
+        self._cached_headers: dict | None = None
+        self._token_exp = 0.0
+        # The engine's worker threads share this client; the auth manager and
+        # its token cache file are not thread-safe, so refresh one at a time
+        self._auth_lock = threading.Lock()
+
+    def _cached(self) -> dict | None:
+        headers = self._cached_headers
+        if headers is not None and time.time() < self._token_exp - 30:
+            return headers
+        return None
 
     def _headers(self) -> dict:
-        token = self.auth.get_token()
-        return {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-        }
+        """Request headers, reused until shortly before the token expires."""
+        headers = self._cached()
+        if headers is not None:
+            return headers
+        with self._auth_lock:
+            # Another thread may have refreshed while we waited
+            headers = self._cached()
+            if headers is not None:
+                return headers
+            token = self.auth.get_token()
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+            }
+            exp = getattr(self.auth, "expires_at", None)
+            if isinstance(exp, (int, float)):
+                self._cached_headers, self._token_exp = headers, exp
+            return headers
+
+    def _reject_token(self, sent_auth: str | None):
+        """Drop a token the server refused, unless another thread already replaced it."""
+        with self._auth_lock:
+            current = self._cached_headers
+            if current is not None and current.get("Authorization") != sent_auth:
+                return
+            self._invalidate_headers()
+            if not _IS_AZURE:
+                # Local: force token refresh by clearing MSAL cache accounts
+                try:
+                    accounts = self.auth.app.get_accounts()
+                    if accounts:
+                        self.auth.app.remove_account(accounts[0])
+                except Exception:
+                    pass
+            # In Azure Functions: just retry without removing the account
+
+    def _invalidate_headers(self):
+        self._cached_headers = None
+        self._token_exp = 0.0
 
     def _request(self, method: str, url: str, **kwargs) -> requests.Response:
         """Execute an HTTP request with retry and rate-limit handling."""
@@ -37,7 +109,8 @@ class GraphClient:
         for attempt in range(self.max_retries):
             try:
                 headers = self._headers()
-                headers.update(extra_headers)
+                if extra_headers:
+                    headers = {**headers, **extra_headers}
                 resp = self.session.request(
                     method, url, headers=headers, **kwargs
                 )
@@ -45,22 +118,14 @@ class GraphClient:
                 if resp.status_code == 429:
                     retry_after = int(resp.headers.get("Retry-After", 5))
                     logger.warning("Rate limited. Waiting %ds", retry_after)
-                    time.sleep(retry_after)
+                    self._sleep(retry_after)
                     continue
 
                 if resp.status_code == 401:
                     logger.warning(
                         "401 Unauthorized: %s", resp.text[:300]
                     )
-                    if not os.environ.get("AZURE_FUNCTIONS_ENVIRONMENT"):
-                        # Local: force token refresh by clearing MSAL cache accounts
-                        try:
-                            accounts = self.auth.app.get_accounts()
-                            if accounts:
-                                self.auth.app.remove_account(accounts[0])
-                        except Exception:
-                            pass
-                    # In Azure Functions: just retry without removing the account
+                    self._reject_token(headers.get("Authorization"))
                     continue
 
                 if resp.status_code >= 500:
@@ -68,7 +133,7 @@ class GraphClient:
                     logger.warning(
                         "Server error %d, retrying in %.1fs", resp.status_code, wait
                     )
-                    time.sleep(wait)
+                    self._sleep(wait)
                     continue
 
                 resp.raise_for_status()
@@ -77,7 +142,7 @@ class GraphClient:
             except requests.ConnectionError as e:
                 wait = (2 ** attempt) + random.uniform(0, 1)
                 logger.warning("Connection error: %s. Retrying in %.1fs", e, wait)
-                time.sleep(wait)
+                self._sleep(wait)
 
         raise requests.HTTPError(
             f"Request failed after {self.max_retries} retries: {method} {url}"
@@ -87,22 +152,37 @@ class GraphClient:
         resp = self._request("GET", url, params=params)
         return resp.json() if resp.content else {}
 
-    def get_all(self, url: str, params: dict = None) -> list:
-        """GET with automatic pagination — follows @odata.nextLink."""
-        items = []
+    def iter_all(self, url: str, params: dict = None):
+        """Yield items across pages, fetching each @odata.nextLink only when needed."""
         resp = self.get(url, params=params)
-        items.extend(resp.get("value", []))
+        yield from resp.get("value", [])
 
         while "@odata.nextLink" in resp:
             resp = self.get(resp["@odata.nextLink"])
-            items.extend(resp.get("value", []))
+            yield from resp.get("value", [])
 
-        return items
+    def get_all(self, url: str, params: dict = None) -> list:
+        """GET with automatic pagination — follows @odata.nextLink."""
+        return list(self.iter_all(url, params=params))
 
     def post(self, url: str, json: dict = None, **kwargs) -> dict:
         resp = self._request("POST", url, json=json, **kwargs)
         return resp.json() if resp.content else {}
 
+    def batch(self, sub_requests: list[dict]) -> dict:
+        """Send sub-requests through /$batch, 20 per call; return responses by id.
+
+        Each sub-request is {"id", "method", "url"[, "body", "headers"]} with a
+        URL relative to the API version root. Sub-responses keep their own
+        status; callers decide how to handle failed ones.
+        """
+        responses = {}
+        for i in range(0, len(sub_requests), BATCH_LIMIT):
+            resp = self.post("/$batch", json={"requests": sub_requests[i:i + BATCH_LIMIT]})
+            for sub in resp.get("responses", []):
+                responses[sub["id"]] = sub
+        return responses
+
     def patch(self, url: str, json: dict = None) -> dict:
         resp = self._request("PATCH", url, json=json)
         return resp.json() if resp.content else {}
@@ -1,4 +1,7 @@
 import logging
+import re
+from collections import Counter
+from functools import lru_cache
 
 logger = logging.getLogger("onenote_todo_sync")
 
@@ -13,10 +16,14 @@ class TaskEvaluator:
         self.negative_keywords = [
             kw.lower() for kw in rules_config.get("negative_keywords", [])
         ]
+        self._positive_matcher = _KeywordMatcher(self.positive_keywords)
+        self._negative_matcher = _KeywordMatcher(self.negative_keywords)
         self.force_onenote_prefix = rules_config.get("force_onenote_prefix", "#onenote").lower()
         self.force_skip_prefix = rules_config.get("force_skip_prefix", "#simple").lower()
         self.min_words = rules_config.get("min_words_for_complex", 8)
         self.threshold = rules_config.get("score_threshold", 2)
+        # Rules are fixed per instance, so a score depends only on its inputs
+        self._cached_score = lru_cache(maxsize=1024)(self._calculate_score)
 
     def needs_onenote(self, task: dict) -> bool:
         """Determine if a task should have a OneNote page."""
@@ -37,7 +44,7 @@ class TaskEvaluator:
             logger.debug("Task '%s' forced to skip OneNote by prefix", title)
             return False
 
-        score = self._calculate_score(title_lower, body_content)
+        score = self._cached_score(title_lower, body_content)
         result = score >= self.threshold
         logger.debug("Task '%s' score=%d, needs_onenote=%s", title, score, result)
         return result
@@ -45,15 +52,9 @@ class TaskEvaluator:
     def _calculate_score(self, title_lower: str, body_content: str) -> int:
         score = 0
 
-        # Positive keyword matches
-        for kw in self.positive_keywords:
-            if kw in title_lower:
-                score += 2
-
-        # Negative keyword matches
-        for kw in self.negative_keywords:
-            if kw in title_lower:
-                score -= 2
+        # Keyword matches: each keyword found in the title counts once
+        score += 2 * self._positive_matcher.count(title_lower)
+        score -= 2 * self._negative_matcher.count(title_lower)
 
         # Word count: long titles suggest complexity
         word_count = len(title_lower.split())
@@ -69,3 +70,26 @@ class TaskEvaluator:
             score += 1
 
         return score
+
+
+class _KeywordMatcher:
+    """Count how many keywords occur in a text with a single regex pass."""
+
+    def __init__(self, keywords: list[str]):
+        self._weights = Counter(keywords)
+        # Longest first: at each position the lookahead captures the longest
+        # keyword starting there; shorter ones there or inside it are implied.
+        ordered = sorted(self._weights, key=len, reverse=True)
+        self._pattern = (
+            re.compile("(?=(" + "|".join(map(re.escape, ordered)) + "))")
+            if ordered else None
+        )
+        self._implied = {kw: [k for k in ordered if k in kw] for kw in ordered}
+
+    def count(self, text: str) -> int:
+        if self._pattern is None:
+            return 0
+        found = set()
+        for match in set(self._pattern.findall(text)):
+            found.update(self._implied[match])
+        return sum(self._weights[kw] for kw in found)
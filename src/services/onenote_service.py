@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import html
 import logging
 
+import requests
+
 logger = logging.getLogger("onenote_todo_sync")
 
 PAGE_TEMPLATE = """<!DOCTYPE html>
@@ -34,20 +37,47 @@ PAGE_TEMPLATE = """<!DOCTYPE html>
 </html>"""
 
 
+def _odata_escape(value: str) -> str:
+    """Escape a string literal for an OData $filter (single quotes are doubled)."""
+    return value.replace("'", "''")
+
+
 class OneNoteService:
     """Operations for OneNote via Graph API."""
 
     def __init__(self, graph_client):
         self.client = graph_client
+        self._server_filter = True
 
-    def get_notebook(self, name: str) -> dict | None:
-        """Find a notebook by name (filtered locally — OneNote API doesn't support $filter)."""
-        notebooks = self.client.get_all("/me/onenote/notebooks")
-        for nb in notebooks:
-            if nb.get("displayName") == name:
-                return nb
+    def _find_by_name(self, url: str, name: str) -> dict | None:
+        """Look up an item by displayName, filtering server-side when possible."""
+        if self._server_filter:
+            params = {
+                "$filter": f"displayName eq '{_odata_escape(name)}'",
+                "$select": "id,displayName",
+            }
+            try:
+                # Re-check locally: the server match may be case-insensitive
+                for item in self.client.iter_all(url, params=params):
+                    if item.get("displayName") == name:
+                        return item
+                return None
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 400:
+                    raise
+                logger.info("Server-side $filter rejected for %s; filtering locally", url)
+                self._server_filter = False
+
+        # Stop paging as soon as the name turns up
+        for item in self.client.iter_all(url):
+            if item.get("displayName") == name:
+                return item
         return None
 
+    def get_notebook(self, name: str) -> dict | None:
+        """Find a notebook by name."""
+        return self._find_by_name("/me/onenote/notebooks", name)
+
     def get_sections(self, notebook_id: str) -> list[dict]:
         """Get all sections in a notebook."""
         return self.client.get_all(
@@ -56,10 +86,9 @@ class OneNoteService:
 
     def ensure_section(self, notebook_id: str, name: str) -> dict:
         """Get a section by name, creating it if it doesn't exist."""
-        sections = self.get_sections(notebook_id)
-        for section in sections:
-            if section.get("displayName") == name:
-                return section
+        section = self._find_by_name(f"/me/onenote/notebooks/{notebook_id}/sections", name)
+        if section:
+            return section
 
         logger.info("Creating OneNote section: %s", name)
         return self.client.post(
@@ -71,14 +100,15 @@ class OneNoteService:
         self, section_id: str, title: str, list_name: str, objective: str = ""
     ) -> dict:
         """Create a new page in a section using the task template."""
-        html = PAGE_TEMPLATE.format(
-            title=title,
-            objective=objective or title,
-            list_name=list_name,
-        )
+        # Escape user text: a stray "&" or "<" makes the XHTML invalid and Graph rejects it
+        page_html = PAGE_TEMPLATE.format_map({
+            "title": html.escape(title),
+            "objective": html.escape(objective or title),
+            "list_name": html.escape(list_name),
+        })
         resp = self.client.post(
             f"/me/onenote/sections/{section_id}/pages",
-            data=html.encode("utf-8"),
+            data=page_html.encode("utf-8"),
             headers={"Content-Type": "application/xhtml+xml"},
         )
         return resp
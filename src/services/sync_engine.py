@@ -1,12 +1,28 @@
 from __future__ import annotations
 
 import logging
+import re
 import signal
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from types import MappingProxyType
 
 logger = logging.getLogger("onenote_todo_sync")
 
+# Graph sends 7 fractional digits; keep the first 6 (the timezone suffix is untouched)
+_EXTRA_FRACTION_RX = re.compile(r"(\.\d{6})\d+")
+
+_WEEKDAYS = MappingProxyType({
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3,
+    "friday": 4, "saturday": 5, "sunday": 6,
+})
+
+# Python 3.11+ parses "Z" and over-long fractions natively
+_NATIVE_ISO = sys.version_info >= (3, 11)
+
 
 class SyncEngine:
     """Orchestrates synchronization between To Do, OneNote, and Calendar."""
@@ -30,10 +46,31 @@ class SyncEngine:
         self.monitored_lists = config.get("monitored_lists", [])
         self.section_map = config.get("list_to_section_map", {})
         self.weekly_config = config.get("weekly_review", {})
+        if self.weekly_config.get("enabled", False):
+            # Parsed once so a malformed day/time fails at startup
+            day = self.weekly_config.get("day", "sunday").lower()
+            self._review_weekday = _WEEKDAYS.get(day, 6)
+            review_time = self.weekly_config.get("time", "18:00")
+            try:
+                # Seconds ("18:00:00") are accepted and ignored, as before
+                hour, minute = (int(part) for part in str(review_time).split(":")[:2])
+            except ValueError:
+                raise ValueError(
+                    f"weekly_review.time must be HH:MM, got {review_time!r}"
+                ) from None
+            self._review_time = (hour, minute)
+        self.sync_workers = config.get("sync_workers", 4)
         self._running = True
+        # Set on shutdown so the wait between cycles returns immediately
+        self._stop = threading.Event()
         self._notebook_id = None
         self._sections_cache = {}
         self._list_ids = {}
+        # week_start whose review is known to exist; skips the cache lookup
+        self._reviewed_week = None
+        # To Do link PATCHes run in the background; drained once per cycle
+        self._io_pool = ThreadPoolExecutor(max_workers=2)
+        self._pending_io = []
 
     def run(self):
         """Start the polling loop. Blocks until SIGTERM/SIGINT."""
@@ -43,15 +80,23 @@ class SyncEngine:
         logger.info("Sync engine starting (interval=%ds)", self.interval)
         self._initialize()
 
+        failures = 0
+        next_tick = time.monotonic()
         while self._running:
             try:
                 self._sync_cycle()
+                failures = 0
             except Exception:
+                failures += 1
                 logger.exception("Error in sync cycle")
                 self.cache.log_action("sync_cycle_error", success=False)
 
-            if self._running:
-                time.sleep(self.interval)
+            # Cadence is measured from cycle start; repeated failures back off
+            next_tick += self.interval * min(2 ** failures, 16)
+            now = time.monotonic()
+            # After an overrun, wait from now instead of bursting to catch up
+            next_tick = max(next_tick, now)
+            self._stop.wait(next_tick - now)
 
         logger.info("Sync engine stopped")
 
@@ -63,6 +108,7 @@ class SyncEngine:
     def _handle_signal(self, signum, frame):
         logger.info("Received signal %d, shutting down...", signum)
         self._running = False
+        self._stop.set()
 
     def _initialize(self):
         """Discover notebook, sections, and list IDs."""
@@ -80,35 +126,89 @@ class SyncEngine:
             self._sections_cache[list_name] = section
             logger.info("Section '%s' ready (id=%s)", section_name, section["id"])
 
-        # Find To Do list IDs
+        # Find To Do list IDs with one fetch per initialization; a warm worker
+        # must pick up lists that were deleted and recreated under a new id
+        lists_by_name = self.todo.get_lists_by_name(refresh=True)
         for list_name in self.monitored_lists:
-            todo_list = self.todo.find_list_by_name(list_name)
+            todo_list = lists_by_name.get(list_name)
             if todo_list:
                 self._list_ids[list_name] = todo_list["id"]
                 logger.info("Found To Do list: %s (%s)", list_name, todo_list["id"])
             else:
+                self._list_ids.pop(list_name, None)
                 logger.warning("To Do list '%s' not found", list_name)
 
     def _sync_cycle(self):
         """Execute one full sync cycle across all monitored lists."""
         logger.debug("Starting sync cycle")
 
-        for list_name, list_id in self._list_ids.items():
+        # One commit per cycle instead of one per cache write
+        with self.cache.transaction():
+            deltas = self._fetch_all_deltas()
+            jobs = [
+                (list_name, list_id, deltas.get(list_id))
+                for list_name, list_id in self._list_ids.items()
+            ]
+            workers = min(self.sync_workers, len(jobs))
+            if workers > 1:
+                # Lists are independent and network-bound: overlap their Graph calls
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    list(executor.map(lambda job: self._sync_list_safe(*job), jobs))
+            else:
+                for job in jobs:
+                    self._sync_list_safe(*job)
+
+            self._check_weekly_review()
+            self._drain_pending_io()
+        logger.debug("Sync cycle complete")
+
+    def _drain_pending_io(self):
+        """Wait for background To Do PATCHes and record the ones that failed."""
+        pending, self._pending_io = self._pending_io, []
+        for future, task_id, title in pending:
             try:
-                self._sync_list(list_name, list_id)
+                future.result()
             except Exception:
-                logger.exception("Error syncing list '%s'", list_name)
+                logger.exception("Failed to add OneNote link to task: %s", title)
+                self.cache.log_action(
+                    "update_task_body", task_id=task_id, details=title, success=False
+                )
 
-        self._check_weekly_review()
-        logger.debug("Sync cycle complete")
+    def _fetch_all_deltas(self) -> dict:
+        """Fetch every monitored list's changes in one batched Graph call."""
+        if not self._list_ids:
+            return {}
+        delta_links = {
+            list_id: self.cache.get_delta_link(list_name)
+            for list_name, list_id in self._list_ids.items()
+        }
+        try:
+            return self.todo.get_deltas_for_lists(delta_links)
+        except Exception:
+            # Lists missing from the result are fetched one by one in _sync_list
+            logger.exception("Batched delta fetch failed")
+            return {}
 
-    def _sync_list(self, list_name: str, list_id: str):
-        """Sync a single To Do list."""
-        tasks = self.todo.get_tasks(list_id)
+    def _sync_list_safe(self, list_name: str, list_id: str, delta: tuple | None = None):
+        """Sync a list, logging instead of raising so other lists still run."""
+        try:
+            self._sync_list(list_name, list_id, delta)
+        except Exception:
+            logger.exception("Error syncing list '%s'", list_name)
+
+    def _sync_list(self, list_name: str, list_id: str, delta: tuple | None = None):
+        """Sync a single To Do list from a (tasks, delta_link, full) delta result."""
+        if delta is None:
+            delta = self.todo.get_tasks_delta(list_id, self.cache.get_delta_link(list_name))
+        tasks, delta_link, full = delta
         remote_task_ids = set()
+        removed_task_ids = []
 
         for task in tasks:
             task_id = task["id"]
+            if "@removed" in task:
+                removed_task_ids.append(task_id)
+                continue
             remote_task_ids.add(task_id)
             cached = self.cache.get_task(task_id)
             last_modified = task.get("lastModifiedDateTime", "")
@@ -118,11 +218,20 @@ class SyncEngine:
             elif cached.get("last_modified_todo") != last_modified:
                 self._handle_modified_task(task, cached, list_name, list_id)
 
-        # Detect tasks removed from To Do
-        cached_tasks = self.cache.get_tasks_by_list(list_name)
-        for ct in cached_tasks:
-            if ct["task_id"] not in remote_task_ids:
+        if full:
+            # Full snapshot: anything cached for this list but not returned is gone
+            for ct in self.cache.find_removed_tasks(list_name, remote_task_ids):
                 self._handle_removed_task(ct)
+        else:
+            for task_id in removed_task_ids:
+                cached = self.cache.get_task(task_id)
+                # A task moved to another list may already be cached under it
+                if cached and cached.get("list_id") == list_id:
+                    self._handle_removed_task(cached)
+
+        # Saved last so a failed list replays the same changes next cycle
+        if delta_link:
+            self.cache.set_delta_link(list_name, delta_link)
 
     def _handle_new_task(self, task: dict, list_name: str, list_id: str):
         """Process a newly discovered task."""
@@ -131,6 +240,7 @@ class SyncEngine:
         logger.info("New task found: '%s' in list '%s'", title, list_name)
 
         needs_onenote = self.evaluator.needs_onenote(task)
+        due_date = self._extract_due_date(task)
 
         cache_data = {
             "task_id": task_id,
@@ -138,7 +248,7 @@ class SyncEngine:
             "list_name": list_name,
             "title": title,
             "status": task.get("status", "notStarted"),
-            "due_date": self._extract_due_date(task),
+            "due_date": due_date,
             "last_modified_todo": task.get("lastModifiedDateTime", ""),
             "needs_onenote": 1 if needs_onenote else 0,
         }
@@ -146,11 +256,11 @@ class SyncEngine:
         if needs_onenote:
             self._create_onenote_page(task, list_name, list_id, cache_data)
 
-        due_date = self._extract_due_date(task)
         if due_date:
             self._sync_calendar_event(task, cache_data)
 
-        self.cache.upsert_task(cache_data)
+        # Not cached yet: write the row directly instead of trying a merge first
+        self.cache.upsert_task(cache_data, prior={})
         self.cache.log_action("new_task_synced", task_id=task_id, details=title)
 
     def _handle_modified_task(
@@ -162,13 +272,14 @@ class SyncEngine:
         logger.info("Modified task: '%s'", title)
 
         new_status = task.get("status", "notStarted")
+        new_due = self._extract_due_date(task)
         cache_data = {
             "task_id": task_id,
             "list_id": list_id,
             "list_name": list_name,
             "title": title,
             "status": new_status,
-            "due_date": self._extract_due_date(task),
+            "due_date": new_due,
             "last_modified_todo": task.get("lastModifiedDateTime", ""),
             "onenote_page_id": cached.get("onenote_page_id"),
             "onenote_link": cached.get("onenote_link"),
@@ -189,12 +300,10 @@ class SyncEngine:
                     logger.exception("Failed to update calendar event")
 
         # Sync due date changes to calendar
-        new_due = self._extract_due_date(task)
-        old_due = cached.get("due_date")
-        if new_due and new_due != old_due:
+        if new_due and new_due != cached.get("due_date"):
             self._sync_calendar_event(task, cache_data)
 
-        self.cache.upsert_task(cache_data)
+        self.cache.upsert_task(cache_data, prior=cached)
         self.cache.log_action("task_updated", task_id=task_id, details=title)
 
     def _handle_removed_task(self, cached: dict):
@@ -209,7 +318,7 @@ class SyncEngine:
             except Exception:
                 logger.exception("Failed to delete calendar event for removed task")
 
-        self.cache.delete_task(task_id)
+        self.cache.delete_task(task_id, list_name=cached.get("list_name"))
         self.cache.log_action("task_removed", task_id=task_id, details=title)
 
     def _create_onenote_page(
@@ -223,10 +332,8 @@ class SyncEngine:
             return
 
         try:
-            body = task.get("body", {})
-            objective = ""
-            if isinstance(body, dict):
-                objective = body.get("content", "")
+            body = task.get("body")
+            objective = body.get("content", "") if isinstance(body, dict) else ""
 
             page = self.onenote.create_page(
                 section_id=section["id"],
@@ -235,18 +342,21 @@ class SyncEngine:
                 objective=objective,
             )
             page_id = page.get("id", "")
-            link = self.onenote.get_page_link(page_id) if page_id else ""
+            # The create response usually carries the web link; fetch it only if not
+            link = page.get("links", {}).get("oneNoteWebUrl", {}).get("href", "")
+            if not link and page_id:
+                link = self.onenote.get_page_link(page_id)
 
             cache_data["onenote_page_id"] = page_id
             cache_data["onenote_link"] = link
 
             if link:
-                existing_body = task.get("body", {})
-                existing_content = ""
-                if isinstance(existing_body, dict):
-                    existing_content = existing_body.get("content", "")
-                new_content = f"{existing_content}\n\nOneNote: {link}".strip()
-                self.todo.update_task_body(list_id, task["id"], new_content)
+                new_content = f"{objective}\n\nOneNote: {link}".strip()
+                # Nothing later in the cycle reads the PATCH result; don't wait for it
+                future = self._io_pool.submit(
+                    self.todo.update_task_body, list_id, task["id"], new_content
+                )
+                self._pending_io.append((future, task["id"], title))
 
             logger.info("Created OneNote page for: %s", title)
             self.cache.log_action(
@@ -259,28 +369,19 @@ class SyncEngine:
             )
 
     def _sync_calendar_event(self, task: dict, cache_data: dict):
-        """Create or update a calendar event for a task with a due date."""
+        """Create or update the calendar event for cache_data's due date."""
         title = task.get("title", "")
-        due_date_str = self._extract_due_date(task)
+        due_date_str = cache_data.get("due_date")
         if not due_date_str:
             return
 
         try:
-            # Truncate fractional seconds to 6 digits for Python 3.9 compat
-            clean = due_date_str.replace("Z", "+00:00")
-            if "." in clean:
-                base, frac_and_rest = clean.split(".", 1)
-                # Separate fractional digits from timezone suffix
-                frac_digits = ""
-                rest = ""
-                for i, ch in enumerate(frac_and_rest):
-                    if ch.isdigit():
-                        frac_digits += ch
-                    else:
-                        rest = frac_and_rest[i:]
-                        break
-                clean = f"{base}.{frac_digits[:6]}{rest}"
-            due_dt = datetime.fromisoformat(clean)
+            if _NATIVE_ISO:
+                due_dt = datetime.fromisoformat(due_date_str)
+            else:
+                # Truncate fractional seconds to 6 digits for Python 3.9 compat
+                clean = _EXTRA_FRACTION_RX.sub(r"\1", due_date_str.replace("Z", "+00:00"))
+                due_dt = datetime.fromisoformat(clean)
             start = due_dt.replace(hour=9, minute=0, second=0)
 
             existing_event_id = cache_data.get("calendar_event_id")
@@ -319,41 +420,35 @@ class SyncEngine:
             return
 
         now = datetime.now(timezone.utc)
-        target_day = self.weekly_config.get("day", "sunday").lower()
-        days = {
-            "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3,
-            "friday": 4, "saturday": 5, "sunday": 6,
-        }
-        target_weekday = days.get(target_day, 6)
 
         # Calculate next occurrence of target day
-        days_ahead = target_weekday - now.weekday()
+        days_ahead = self._review_weekday - now.weekday()
         if days_ahead < 0:
             days_ahead += 7
         next_date = now.date() + timedelta(days=days_ahead)
         week_start = str(next_date - timedelta(days=next_date.weekday()))
 
+        if week_start == self._reviewed_week:
+            return
         if self.cache.get_weekly_review(week_start):
+            self._reviewed_week = week_start
             return
 
         try:
-            time_parts = self.weekly_config.get("time", "18:00").split(":")
-            hour, minute = int(time_parts[0]), int(time_parts[1])
+            hour, minute = self._review_time
             start = datetime(
                 next_date.year, next_date.month, next_date.day, hour, minute,
             )
 
             # Build summary of pending tasks
-            all_tasks = self.cache.get_all_tasks()
-            pending = [t for t in all_tasks if t["status"] != "completed"]
-            summary_lines = []
-            for t in pending:
-                summary_lines.append(f"- [{t['list_name']}] {t['title']}")
-            summary = "\n".join(summary_lines) if summary_lines else "No hay tareas pendientes."
+            summary = "\n".join(
+                f"- [{t['list_name']}] {t['title']}" for t in self.cache.get_pending_tasks()
+            ) or "No hay tareas pendientes."
 
             duration = self.weekly_config.get("duration_minutes", 30)
             event = self.calendar.create_weekly_review(start, duration, summary)
             self.cache.save_weekly_review(event.get("id", ""), week_start)
+            self._reviewed_week = week_start
             self.cache.log_action("create_weekly_review", details=week_start)
             logger.info("Created weekly review event for week of %s", week_start)
         except Exception:
@@ -362,7 +457,5 @@ class SyncEngine:
     @staticmethod
     def _extract_due_date(task: dict) -> str | None:
         """Extract due date string from a task."""
-        due = task.get("dueDateTime")
-        if due and isinstance(due, dict):
-            return due.get("dateTime")
-        return None
+        # Graph sends dueDateTime as an object or omits it / sends null
+        return (task.get("dueDateTime") or {}).get("dateTime")
@@ -2,14 +2,22 @@ from __future__ import annotations
 
 import logging
 
+import requests
+
+from src.graph_client import BASE_URL
+
 logger = logging.getLogger("onenote_todo_sync")
 
+# Graph pages To Do tasks 10 at a time by default; pages are fetched serially
+TASKS_PAGE_SIZE = 100
+
 
 class TodoService:
     """Operations for Microsoft To Do via Graph API."""
 
     def __init__(self, graph_client):
         self.client = graph_client
+        self._lists_by_name: dict[str, dict] | None = None
 
     def get_lists(self) -> list[dict]:
         """Get all To Do task lists."""
@@ -17,22 +25,80 @@ class TodoService:
 
     def find_list_by_name(self, name: str) -> dict | None:
         """Find a specific list by display name."""
-        lists = self.get_lists()
-        for lst in lists:
+        # Stop paging as soon as the name turns up
+        for lst in self.client.iter_all("/me/todo/lists"):
             if lst.get("displayName") == name:
                 return lst
         return None
 
+    def get_lists_by_name(self, refresh: bool = False) -> dict[str, dict]:
+        """Get all lists keyed by display name, fetched once per instance."""
+        if self._lists_by_name is None or refresh:
+            self._lists_by_name = {lst.get("displayName"): lst for lst in self.get_lists()}
+        return self._lists_by_name
+
     def get_tasks(
         self,
         list_id: str,
         status_filter: str = None,
     ) -> list[dict]:
         """Get tasks from a list with optional status filter."""
-        params = {}
+        params = {"$top": TASKS_PAGE_SIZE}
         if status_filter:
             params["$filter"] = f"status eq '{status_filter}'"
-        return self.client.get_all(f"/me/todo/lists/{list_id}/tasks", params=params or None)
+        return self.client.get_all(f"/me/todo/lists/{list_id}/tasks", params=params)
+
+    def get_tasks_delta(self, list_id: str, delta_link: str | None = None) -> tuple:
+        """Get the tasks changed since delta_link, or all tasks when it is None.
+
+        Returns (tasks, next_delta_link, full). full is True when tasks is a
+        complete snapshot of the list rather than a set of changes; removed
+        tasks in a change set carry an "@removed" key.
+        """
+        url = delta_link or f"/me/todo/lists/{list_id}/tasks/delta"
+        try:
+            page = self.client.get(url)
+        except requests.HTTPError as e:
+            # Expired delta tokens answer 410 Gone: start over with a full sync
+            if delta_link is None or e.response is None or e.response.status_code != 410:
+                raise
+            logger.info("Delta link for list %s expired; resyncing", list_id)
+            return self.get_tasks_delta(list_id)
+        tasks, next_delta_link = self._drain_delta(page)
+        return tasks, next_delta_link, delta_link is None
+
+    def get_deltas_for_lists(self, delta_links: dict[str, str | None]) -> dict[str, tuple]:
+        """Run get_tasks_delta for several lists with one $batch call per 20 lists."""
+        list_ids = list(delta_links)
+        sub_requests = []
+        for i, list_id in enumerate(list_ids):
+            link = delta_links[list_id]
+            if link and link.startswith(BASE_URL):
+                url = link[len(BASE_URL):]
+            else:
+                url = link or f"/me/todo/lists/{list_id}/tasks/delta"
+            sub_requests.append({"id": str(i), "method": "GET", "url": url})
+        responses = self.client.batch(sub_requests) if sub_requests else {}
+
+        result = {}
+        for i, list_id in enumerate(list_ids):
+            link = delta_links[list_id]
+            sub = responses.get(str(i))
+            if sub is None or sub.get("status") != 200:
+                # Throttled, expired or failed inside the batch: retry on its own
+                result[list_id] = self.get_tasks_delta(list_id, link)
+                continue
+            tasks, next_delta_link = self._drain_delta(sub.get("body") or {})
+            result[list_id] = (tasks, next_delta_link, link is None)
+        return result
+
+    def _drain_delta(self, page: dict) -> tuple[list[dict], str | None]:
+        """Follow nextLinks from a delta page; return its tasks and the deltaLink."""
+        tasks = list(page.get("value", []))
+        while "@odata.nextLink" in page:
+            page = self.client.get(page["@odata.nextLink"])
+            tasks.extend(page.get("value", []))
+        return tasks, page.get("@odata.deltaLink")
 
     def get_task(self, list_id: str, task_id: str) -> dict:
         """Get a single task by ID."""
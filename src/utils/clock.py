@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime, timezone
+
+# (epoch second, ISO string) of the last call; re-formatted once per second.
+# Replaced as one tuple so concurrent callers never see a mismatched pair.
+_TS_CACHE: tuple[int, str] = (0, "")
+
+
+def utc_timestamp() -> tuple[int, str]:
+    """Current UTC time as (epoch seconds, ISO 8601 string), second resolution."""
+    global _TS_CACHE
+    t = int(time.time())
+    cached = _TS_CACHE
+    if t != cached[0]:
+        cached = (t, datetime.fromtimestamp(t, timezone.utc).isoformat())
+        _TS_CACHE = cached
+    return cached
+
+
+def now_iso() -> str:
+    """Current UTC time as an ISO 8601 string, second resolution."""
+    return utc_timestamp()[1]
@@ -1,6 +1,8 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 
 def setup_logger(config: dict) -> logging.Logger:
@@ -20,6 +22,7 @@ def setup_logger(config: dict) -> logging.Logger:
     )
 
     is_azure = os.environ.get("AZURE_FUNCTIONS_ENVIRONMENT")
+    handlers = []
 
     if not is_azure:
         # Local: write to rotating log file
@@ -36,11 +39,23 @@ def setup_logger(config: dict) -> logging.Logger:
         )
         file_handler.setLevel(level)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
 
     console_handler = logging.StreamHandler()
     console_handler.setLevel(level)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers.append(console_handler)
+
+    if is_azure:
+        # Workers may be frozen between invocations; write records synchronously
+        for handler in handlers:
+            logger.addHandler(handler)
+        return logger
+
+    # Local: format and write on a listener thread, off the sync loop
+    listener = QueueListener(queue.SimpleQueue(), *handlers, respect_handler_level=True)
+    logger.addHandler(QueueHandler(listener.queue))
+    listener.start()
+    atexit.register(listener.stop)
 
     return logger
@@ -1,13 +1,13 @@
 import os
-import tempfile
+from unittest.mock import MagicMock
 
 import pytest
 import yaml
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def config():
-    """Default test configuration."""
+    """Default test configuration (shared by the whole session; tests must not mutate it)."""
     return {
         "notebook_name": "My Notebook",
         "monitored_lists": ["Hoy", "Esta semana", "En espera"],
@@ -48,13 +48,13 @@ def config():
 
 
 @pytest.fixture
-def temp_db():
-    """Create a temporary database file."""
-    fd, path = tempfile.mkstemp(suffix=".db")
-    os.close(fd)
-    yield path
-    if os.path.exists(path):
-        os.unlink(path)
+def temp_db(tmp_path):
+    """Path for a temporary database file in the test's own directory.
+
+    tmp_path is unique per test (and per xdist worker), and pytest removes it
+    along with the WAL -wal/-shm side files.
+    """
+    return str(tmp_path / "sync_cache.db")
 
 
 @pytest.fixture
@@ -64,3 +64,75 @@ def config_file(config, tmp_path):
     with open(config_path, "w") as f:
         yaml.dump(config, f)
     return str(config_path)
+
+
+@pytest.fixture(scope="module")
+def me_response():
+    """Canned Graph /me response; shared read-only across a module's tests."""
+    resp = MagicMock()
+    resp.json.return_value = {"displayName": "Kevin", "mail": "kevin@test.com"}
+    resp.raise_for_status = MagicMock()
+    return resp
+
+
+@pytest.fixture(scope="session")
+def created_event():
+    """Read-only canned calendar event (the mock payloads are frozen)."""
+    from tests.mocks.graph_responses import CREATED_EVENT
+
+    return CREATED_EVENT
+
+
+@pytest.fixture(scope="session")
+def weekly_review_event():
+    """Read-only canned weekly review event."""
+    from tests.mocks.graph_responses import WEEKLY_REVIEW_EVENT
+
+    return WEEKLY_REVIEW_EVENT
+
+
+@pytest.fixture(scope="session")
+def azurite_connection_string():
+    """Connection string for an Azurite emulator, started once per session if needed."""
+    conn = os.environ.get("AZURITE_CONNECTION_STRING")
+    if conn:
+        yield conn
+        return
+    try:
+        from testcontainers.azurite import AzuriteContainer
+    except ImportError:
+        pytest.skip("set AZURITE_CONNECTION_STRING or install testcontainers to run Azurite")
+    try:
+        container = AzuriteContainer().start()
+    except Exception as exc:
+        pytest.skip(f"could not start Azurite: {exc}")
+    try:
+        yield container.get_connection_string()
+    finally:
+        container.stop()
+
+
+@pytest.fixture(autouse=True)
+def _reset_table_caches():
+    """Forget which Azure tables src.cache.table_cache has already ensured."""
+    from src.cache.table_cache import TableSyncCache
+
+    TableSyncCache._TABLES_READY.clear()
+    yield
+    TableSyncCache._TABLES_READY.clear()
+
+
+@pytest.fixture(autouse=True)
+def _reset_blob_caches():
+    """Clear the per-process Blob Storage caches in src.auth between tests."""
+    from src.auth import _BLOB_SERVICE_CACHE, BlobTokenCacheBackend
+
+    _BLOB_SERVICE_CACHE.clear()
+    BlobTokenCacheBackend._CONTAINERS_READY.clear()
+    BlobTokenCacheBackend._MEM_CACHE.clear()
+    BlobTokenCacheBackend._MISSING_UNTIL.clear()
+    yield
+    _BLOB_SERVICE_CACHE.clear()
+    BlobTokenCacheBackend._CONTAINERS_READY.clear()
+    BlobTokenCacheBackend._MEM_CACHE.clear()
+    BlobTokenCacheBackend._MISSING_UNTIL.clear()
@@ -1,21 +1,35 @@
-"""Mock responses for Microsoft Graph API calls."""
+"""Mock responses for Microsoft Graph API calls.
 
-USER_PROFILE = {
+Each payload is frozen at the top level (a MappingProxyType whose lists
+become tuples) so a test cannot rebind or append to shared data. Nested
+objects stay plain dicts: production code checks isinstance(body, dict).
+"""
+
+from types import MappingProxyType
+
+
+def _freeze(payload: dict):
+    return MappingProxyType({
+        k: tuple(v) if isinstance(v, list) else v for k, v in payload.items()
+    })
+
+
+USER_PROFILE = _freeze({
     "id": "user-123",
     "displayName": "Kevin Loyola",
     "mail": "kevin@example.com",
-}
+})
 
-TODO_LISTS = {
+TODO_LISTS = _freeze({
     "value": [
         {"id": "list-hoy", "displayName": "Hoy"},
         {"id": "list-semana", "displayName": "Esta semana"},
         {"id": "list-espera", "displayName": "En espera"},
         {"id": "list-other", "displayName": "Otra lista"},
     ]
-}
+})
 
-TASKS_HOY = {
+TASKS_HOY = _freeze({
     "value": [
         {
             "id": "task-simple-1",
@@ -45,9 +59,9 @@ TASKS_HOY = {
             "createdDateTime": "2025-01-15T09:00:00Z",
         },
     ]
-}
+})
 
-TASKS_SEMANA = {
+TASKS_SEMANA = _freeze({
     "value": [
         {
             "id": "task-semana-1",
@@ -59,26 +73,26 @@ TASKS_SEMANA = {
             "createdDateTime": "2025-01-16T08:00:00Z",
         },
     ]
-}
+})
 
-TASKS_ESPERA = {"value": []}
+TASKS_ESPERA = _freeze({"value": []})
 
-NOTEBOOKS = {
+NOTEBOOKS = _freeze({
     "value": [
         {"id": "nb-123", "displayName": "My Notebook"},
     ]
-}
+})
 
-SECTIONS = {
+SECTIONS = _freeze({
     "value": [
         {"id": "sec-hoy", "displayName": "Hoy"},
         {"id": "sec-semana", "displayName": "Esta semana"},
     ]
-}
+})
 
-CREATED_SECTION = {"id": "sec-espera-new", "displayName": "En espera"}
+CREATED_SECTION = _freeze({"id": "sec-espera-new", "displayName": "En espera"})
 
-CREATED_PAGE = {
+CREATED_PAGE = _freeze({
     "id": "page-123",
     "title": "Test Page",
     "links": {
@@ -86,23 +100,23 @@ CREATED_PAGE = {
             "href": "https://onenote.com/page-123"
         }
     },
-}
+})
 
-PAGE_WITH_LINK = {
+PAGE_WITH_LINK = _freeze({
     "id": "page-123",
     "links": {
         "oneNoteWebUrl": {
             "href": "https://onenote.com/page-123"
         }
     },
-}
+})
 
-CREATED_EVENT = {
+CREATED_EVENT = _freeze({
     "id": "event-123",
     "subject": "[To Do] Test Task",
-}
+})
 
-WEEKLY_REVIEW_EVENT = {
+WEEKLY_REVIEW_EVENT = _freeze({
     "id": "event-weekly-123",
     "subject": "Revisión Semanal - Tareas",
-}
+})
@@ -1,30 +1,65 @@
 import json
-import os
-import tempfile
-from unittest.mock import MagicMock, patch
+from unittest.mock import Mock, patch
 
+import msal
 import pytest
+from msal import PublicClientApplication
 
-from src.auth import AuthManager, SCOPES, create_auth
+from src.auth import AuthManager, SCOPES, TOKEN_CACHE_PATH, _SESSION, create_auth
 
 
-class TestAuthManager:
-    @patch("src.auth.msal.PublicClientApplication")
-    def test_silent_token_acquisition(self, mock_app_cls):
-        mock_app = MagicMock()
-        mock_app_cls.return_value = mock_app
-        mock_app.get_accounts.return_value = [{"username": "test@test.com"}]
-        mock_app.acquire_token_silent.return_value = {
-            "access_token": "test-token-123"
-        }
+@pytest.fixture(scope="class")
+def _msal_app_cls():
+    """Patch MSAL's PublicClientApplication once per test class."""
+    with patch.object(msal, "PublicClientApplication") as app_cls:
+        yield app_cls
+
 
-        auth = AuthManager(
+@pytest.fixture(autouse=True)
+def _msal_app(request, _msal_app_cls):
+    """Give each test a fresh MSAL app mock behind the class-wide patch."""
+    _msal_app_cls.reset_mock(return_value=True, side_effect=True)
+    _msal_app_cls.return_value = Mock(spec=PublicClientApplication)
+    request.instance.mock_app_cls = _msal_app_cls
+    request.instance.mock_app = _msal_app_cls.return_value
+
+
+@pytest.fixture(autouse=True)
+def _no_callback_server():
+    """Fail fast instead of blocking if a flow reaches the real callback server."""
+    with patch.object(
+        AuthManager, "_wait_for_callback",
+        side_effect=AssertionError("test reached the real OAuth callback server"),
+    ):
+        yield
+
+
+@pytest.fixture
+def make_auth(tmp_path):
+    """Build an AuthManager with the test defaults, overridable per test."""
+    def _make(**overrides):
+        kwargs = dict(
             client_id="test-id",
             authority="https://login.microsoftonline.com/consumers",
             scopes=SCOPES,
-            cache_path="/tmp/test_cache.json",
+            # Per-test file so tests never share (or leave behind) a token cache
+            cache_path=str(tmp_path / "token_cache.json"),
             label="test",
         )
+        kwargs.update(overrides)
+        return AuthManager(**kwargs)
+    return _make
+
+
+class TestAuthManager:
+    def test_silent_token_acquisition(self, make_auth):
+        mock_app = self.mock_app
+        mock_app.get_accounts.return_value = [{"username": "test@test.com"}]
+        mock_app.acquire_token_silent.return_value = {
+            "access_token": "test-token-123"
+        }
+
+        auth = make_auth()
         token = auth.get_token()
 
         assert token == "test-token-123"
@@ -32,10 +67,8 @@ class TestAuthManager:
             SCOPES, account={"username": "test@test.com"}
         )
 
-    @patch("src.auth.msal.PublicClientApplication")
-    def test_device_code_flow_when_no_accounts(self, mock_app_cls):
-        mock_app = MagicMock()
-        mock_app_cls.return_value = mock_app
+    def test_device_code_flow_when_no_accounts(self, make_auth):
+        mock_app = self.mock_app
         mock_app.get_accounts.return_value = []
         mock_app.initiate_device_flow.return_value = {
             "user_code": "ABC123",
@@ -45,42 +78,26 @@ class TestAuthManager:
             "access_token": "new-token-456"
         }
 
-        auth = AuthManager(
-            client_id="test-id",
-            authority="https://login.microsoftonline.com/consumers",
-            scopes=SCOPES,
-            cache_path="/tmp/test_cache.json",
-            label="test",
-        )
+        auth = make_auth()
         token = auth.get_token()
 
         assert token == "new-token-456"
         mock_app.initiate_device_flow.assert_called_once()
 
-    @patch("src.auth.msal.PublicClientApplication")
-    def test_device_code_flow_failure(self, mock_app_cls):
-        mock_app = MagicMock()
-        mock_app_cls.return_value = mock_app
+    def test_device_code_flow_failure(self, make_auth):
+        mock_app = self.mock_app
         mock_app.get_accounts.return_value = []
         mock_app.initiate_device_flow.return_value = {
             "error": "authorization_pending"
         }
 
-        auth = AuthManager(
-            client_id="test-id",
-            authority="https://login.microsoftonline.com/consumers",
-            scopes=SCOPES,
-            cache_path="/tmp/test_cache.json",
-            label="test",
-        )
+        auth = make_auth()
 
         with pytest.raises(RuntimeError, match="Failed to create device flow"):
             auth.get_token()
 
-    @patch("src.auth.msal.PublicClientApplication")
-    def test_silent_fails_then_device_code(self, mock_app_cls):
-        mock_app = MagicMock()
-        mock_app_cls.return_value = mock_app
+    def test_silent_fails_then_device_code(self, make_auth):
+        mock_app = self.mock_app
         mock_app.get_accounts.return_value = [{"username": "test@test.com"}]
         mock_app.acquire_token_silent.return_value = {
             "error": "interaction_required",
@@ -94,53 +111,35 @@ class TestAuthManager:
             "access_token": "refreshed-token"
         }
 
-        auth = AuthManager(
-            client_id="test-id",
-            authority="https://login.microsoftonline.com/consumers",
-            scopes=SCOPES,
-            cache_path="/tmp/test_cache.json",
-            label="test",
-        )
+        auth = make_auth()
         token = auth.get_token()
 
         assert token == "refreshed-token"
 
-    @patch("src.auth.requests.get")
-    @patch("src.auth.msal.PublicClientApplication")
-    def test_verify_connection(self, mock_app_cls, mock_get):
-        mock_app = MagicMock()
-        mock_app_cls.return_value = mock_app
+    @patch.object(_SESSION, "get")
+    def test_verify_connection(self, mock_get, make_auth, me_response):
+        mock_app = self.mock_app
         mock_app.get_accounts.return_value = [{"username": "test@test.com"}]
         mock_app.acquire_token_silent.return_value = {
             "access_token": "test-token"
         }
 
-        mock_resp = MagicMock()
-        mock_resp.json.return_value = {
-            "displayName": "Kevin",
-            "mail": "kevin@test.com",
-        }
-        mock_resp.raise_for_status = MagicMock()
-        mock_get.return_value = mock_resp
+        mock_get.return_value = me_response
 
-        auth = AuthManager(
-            client_id="test-id",
-            authority="https://login.microsoftonline.com/consumers",
-            scopes=SCOPES,
-            cache_path="/tmp/test_cache.json",
-            label="test",
-        )
+        auth = make_auth()
         user = auth.verify_connection()
 
         assert user["displayName"] == "Kevin"
         mock_get.assert_called_once()
 
+    def test_unknown_auth_flow_raises(self, make_auth):
+        with pytest.raises(ValueError, match="Unknown auth_flow 'browser'"):
+            make_auth(auth_flow="browser")
+        self.mock_app_cls.assert_not_called()
 
-    @patch("src.auth.AuthManager._wait_for_callback")
-    @patch("src.auth.msal.PublicClientApplication")
-    def test_manual_flow_success(self, mock_app_cls, mock_wait):
-        mock_app = MagicMock()
-        mock_app_cls.return_value = mock_app
+    @patch.object(AuthManager, "_wait_for_callback")
+    def test_manual_flow_success(self, mock_wait, make_auth):
+        mock_app = self.mock_app
         mock_app.get_accounts.return_value = []
         mock_app.initiate_auth_code_flow.return_value = {
             "auth_uri": "https://login.microsoftonline.com/auth?code=abc",
@@ -151,11 +150,8 @@ class TestAuthManager:
             "access_token": "manual-token-789"
         }
 
-        auth = AuthManager(
-            client_id="test-id",
+        auth = make_auth(
             authority="https://login.microsoftonline.com/organizations",
-            scopes=SCOPES,
-            cache_path="/tmp/test_cache.json",
             label="work",
             auth_flow="manual",
         )
@@ -168,21 +164,16 @@ class TestAuthManager:
         )
         mock_app.acquire_token_by_auth_code_flow.assert_called_once()
 
-    @patch("src.auth.AuthManager._wait_for_callback")
-    @patch("src.auth.msal.PublicClientApplication")
-    def test_manual_flow_initiate_failure(self, mock_app_cls, mock_wait):
-        mock_app = MagicMock()
-        mock_app_cls.return_value = mock_app
+    @patch.object(AuthManager, "_wait_for_callback")
+    def test_manual_flow_initiate_failure(self, mock_wait, make_auth):
+        mock_app = self.mock_app
         mock_app.get_accounts.return_value = []
         mock_app.initiate_auth_code_flow.return_value = {
             "error": "invalid_client",
         }
 
-        auth = AuthManager(
-            client_id="test-id",
+        auth = make_auth(
             authority="https://login.microsoftonline.com/organizations",
-            scopes=SCOPES,
-            cache_path="/tmp/test_cache.json",
             label="work",
             auth_flow="manual",
         )
@@ -190,11 +181,9 @@ class TestAuthManager:
         with pytest.raises(RuntimeError, match="Failed to create auth code flow"):
             auth.get_token()
 
-    @patch("src.auth.AuthManager._wait_for_callback")
-    @patch("src.auth.msal.PublicClientApplication")
-    def test_manual_flow_token_exchange_failure(self, mock_app_cls, mock_wait):
-        mock_app = MagicMock()
-        mock_app_cls.return_value = mock_app
+    @patch.object(AuthManager, "_wait_for_callback")
+    def test_manual_flow_token_exchange_failure(self, mock_wait, make_auth):
+        mock_app = self.mock_app
         mock_app.get_accounts.return_value = []
         mock_app.initiate_auth_code_flow.return_value = {
             "auth_uri": "https://login.microsoftonline.com/auth",
@@ -206,11 +195,8 @@ class TestAuthManager:
             "error_description": "Code expired",
         }
 
-        auth = AuthManager(
-            client_id="test-id",
+        auth = make_auth(
             authority="https://login.microsoftonline.com/organizations",
-            scopes=SCOPES,
-            cache_path="/tmp/test_cache.json",
             label="work",
             auth_flow="manual",
         )
@@ -220,22 +206,18 @@ class TestAuthManager:
 
 
 class TestAuthFactory:
-    @patch("src.auth.msal.PublicClientApplication")
-    def test_create_auth(self, mock_app_cls):
+    def test_create_auth(self):
         auth = create_auth("client-123")
         assert auth.label == "personal"
         assert "consumers" in auth.authority
         assert auth.scopes == SCOPES
 
-    @patch("src.auth.msal.PublicClientApplication")
-    def test_create_auth_with_custom_cache_path(self, mock_app_cls):
-        auth = create_auth("client-123", cache_path="/tmp/custom_cache.json",
-                           label="work")
-        assert auth.cache_path == "/tmp/custom_cache.json"
+    def test_create_auth_with_custom_cache_path(self, tmp_path):
+        custom_path = str(tmp_path / "custom_cache.json")
+        auth = create_auth("client-123", cache_path=custom_path, label="work")
+        assert auth.cache_path == custom_path
         assert auth.label == "work"
 
-    @patch("src.auth.msal.PublicClientApplication")
-    def test_create_auth_default_cache_path(self, mock_app_cls):
-        from src.auth import TOKEN_CACHE_PATH
+    def test_create_auth_default_cache_path(self):
         auth = create_auth("client-123")
         assert auth.cache_path == TOKEN_CACHE_PATH
@@ -1,107 +1,220 @@
 from __future__ import annotations
 
-from unittest.mock import MagicMock, patch
+import gzip
+import time
+from unittest.mock import Mock, patch
 
+import msal
 import pytest
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    HttpResponseError, ResourceExistsError, ResourceNotFoundError, ResourceNotModifiedError,
+)
+from azure.storage import blob as azure_blob
 
-from src.auth import AzureAuthManager, BlobTokenCacheBackend, SCOPES
+from src.auth import AzureAuthManager, BlobTokenCacheBackend, SCOPES, _SESSION
+
+
+@pytest.fixture(scope="class")
+def _blob_service_cls():
+    """Patch BlobServiceClient once per test class."""
+    with patch.object(azure_blob, "BlobServiceClient") as service_cls:
+        yield service_cls
+
+
+_CONN_STR = "DefaultEndpointsProtocol=https;AccountName=test"
 
 
 class TestBlobTokenCacheBackend:
-    @patch("azure.storage.blob.BlobServiceClient")
-    def test_load_success(self, mock_blob_cls):
-        mock_blob_client = MagicMock()
+    @pytest.fixture(autouse=True)
+    def _fresh_blob_service(self, _blob_service_cls):
+        """Wire service -> container -> blob client mocks afresh for each test."""
+        _blob_service_cls.reset_mock(return_value=True, side_effect=True)
+        self.mock_blob_cls = _blob_service_cls
+        self.mock_blob_client = Mock()
+        self.mock_container = Mock()
+        self.mock_container.get_blob_client.return_value = self.mock_blob_client
+        _blob_service_cls.from_connection_string.return_value.get_container_client.return_value = (
+            self.mock_container
+        )
+
+    @pytest.fixture
+    def blob_env(self):
+        """(backend, blob client, container) for tests happy with the defaults."""
+        return BlobTokenCacheBackend(_CONN_STR), self.mock_blob_client, self.mock_container
+
+    def test_load_success(self, blob_env):
+        backend, mock_blob_client, _ = blob_env
         mock_blob_client.download_blob.return_value.readall.return_value = b'{"token": "data"}'
-        mock_container = MagicMock()
-        mock_container.get_blob_client.return_value = mock_blob_client
-        mock_blob_cls.from_connection_string.return_value.get_container_client.return_value = mock_container
+        cache = Mock()
+        backend.load(cache)
 
-        backend = BlobTokenCacheBackend("DefaultEndpointsProtocol=https;AccountName=test")
-        cache = MagicMock()
+        cache.deserialize.assert_called_once_with('{"token": "data"}')
+
+    def test_load_blob_not_found(self, blob_env):
+        backend, mock_blob_client, _ = blob_env
+        download = mock_blob_client.download_blob
+        download.side_effect = ResourceNotFoundError("Not found")
+
+        cache = Mock()
         backend.load(cache)
+        backend.load(cache)
+
+        cache.deserialize.assert_not_called()
+        # The second load short-circuits until the re-check interval passes
+        download.assert_called_once()
+
+    def test_load_rechecks_missing_blob_after_interval(self, blob_env):
+        backend, mock_blob_client, _ = blob_env
+        download = mock_blob_client.download_blob
+        download.side_effect = ResourceNotFoundError("Not found")
+        with patch.object(time, "monotonic", return_value=1000.0):
+            backend.load(Mock())
+
+        download.side_effect = None
+        download.return_value.readall.return_value = b'{"token": "data"}'
+        cache = Mock()
+        with patch.object(time, "monotonic", return_value=1000.0 + backend.MISSING_RECHECK_SECONDS):
+            backend.load(cache)
 
         cache.deserialize.assert_called_once_with('{"token": "data"}')
 
-    @patch("azure.storage.blob.BlobServiceClient")
-    def test_load_blob_not_found(self, mock_blob_cls):
-        mock_container = MagicMock()
-        mock_container.get_blob_client.return_value.download_blob.side_effect = Exception("Not found")
-        mock_blob_cls.from_connection_string.return_value.get_container_client.return_value = mock_container
+    def test_load_http_error_is_logged(self, blob_env):
+        backend, mock_blob_client, _ = blob_env
+        download = mock_blob_client.download_blob
+        download.side_effect = HttpResponseError("Server busy")
 
-        backend = BlobTokenCacheBackend("DefaultEndpointsProtocol=https;AccountName=test")
-        cache = MagicMock()
+        cache = Mock()
+        backend.load(cache)
         backend.load(cache)
 
         cache.deserialize.assert_not_called()
+        assert download.call_count == 2
+
+    def test_load_unexpected_error_propagates(self, blob_env):
+        backend, mock_blob_client, _ = blob_env
+        mock_blob_client.download_blob.side_effect = RuntimeError("bad")
+
+        with pytest.raises(RuntimeError):
+            backend.load(Mock())
 
-    @patch("azure.storage.blob.BlobServiceClient")
-    def test_save_when_changed(self, mock_blob_cls):
-        mock_blob_client = MagicMock()
-        mock_container = MagicMock()
-        mock_container.get_blob_client.return_value = mock_blob_client
-        mock_blob_cls.from_connection_string.return_value.get_container_client.return_value = mock_container
+    def test_load_corrupt_blob_is_ignored(self, blob_env):
+        backend, mock_blob_client, _ = blob_env
+        mock_blob_client.download_blob.return_value.readall.return_value = b"\xff not json"
 
-        backend = BlobTokenCacheBackend("DefaultEndpointsProtocol=https;AccountName=test")
-        cache = MagicMock()
+        backend.load(Mock())
+
+    @pytest.mark.parametrize("raw", [
+        pytest.param(gzip.compress(b'{"a": 1}')[:12], id="truncated"),
+        pytest.param(b"\x1f\x8b" + b"\x00" * 16, id="bad-header"),
+    ])
+    def test_load_corrupt_gzip_blob_is_ignored(self, blob_env, raw):
+        backend, mock_blob_client, _ = blob_env
+        mock_blob_client.download_blob.return_value.readall.return_value = raw
+        cache = Mock()
+
+        backend.load(cache)
+
+        cache.deserialize.assert_not_called()
+
+    def test_save_when_changed(self, blob_env):
+        backend, mock_blob_client, _ = blob_env
+        cache = Mock()
         cache.has_state_changed = True
         cache.serialize.return_value = '{"new": "data"}'
         backend.save(cache)
 
-        mock_blob_client.upload_blob.assert_called_once_with('{"new": "data"}', overwrite=True)
+        mock_blob_client.upload_blob.assert_called_once()
+        args, kwargs = mock_blob_client.upload_blob.call_args
+        assert gzip.decompress(args[0]) == b'{"new": "data"}'
+        assert kwargs["overwrite"] is True
+        assert kwargs["content_settings"].content_encoding == "gzip"
 
-    @patch("azure.storage.blob.BlobServiceClient")
-    def test_save_when_not_changed(self, mock_blob_cls):
-        mock_blob_client = MagicMock()
-        mock_container = MagicMock()
-        mock_container.get_blob_client.return_value = mock_blob_client
-        mock_blob_cls.from_connection_string.return_value.get_container_client.return_value = mock_container
+    def test_save_skips_identical_content(self, blob_env):
+        backend, mock_blob_client, _ = blob_env
+        mock_blob_client.download_blob.return_value.readall.return_value = b'{"new": "data"}'
 
-        backend = BlobTokenCacheBackend("DefaultEndpointsProtocol=https;AccountName=test")
-        cache = MagicMock()
-        cache.has_state_changed = False
+        backend.load(Mock())
+        cache = Mock()
+        cache.has_state_changed = True
+        cache.serialize.return_value = '{"new": "data"}'
         backend.save(cache)
 
         mock_blob_client.upload_blob.assert_not_called()
 
+    def test_load_gzipped_blob(self, blob_env):
+        backend, mock_blob_client, _ = blob_env
+        mock_blob_client.download_blob.return_value.readall.return_value = gzip.compress(b'{"token": "z"}')
 
-    @patch("azure.storage.blob.BlobServiceClient")
-    def test_custom_blob_name(self, mock_blob_cls):
-        mock_blob_client = MagicMock()
-        mock_blob_client.download_blob.return_value.readall.return_value = b'{"token": "data"}'
-        mock_container = MagicMock()
-        mock_container.get_blob_client.return_value = mock_blob_client
-        mock_blob_cls.from_connection_string.return_value.get_container_client.return_value = mock_container
+        cache = Mock()
+        backend.load(cache)
 
-        backend = BlobTokenCacheBackend(
-            "DefaultEndpointsProtocol=https;AccountName=test",
-            blob_name="token_cache_work.json",
-        )
+        cache.deserialize.assert_called_once_with('{"token": "z"}')
+
+    def test_save_when_not_changed(self, blob_env):
+        backend, mock_blob_client, _ = blob_env
+        cache = Mock()
+        cache.has_state_changed = False
+        backend.save(cache)
+
+        mock_blob_client.upload_blob.assert_not_called()
+
+    def test_custom_blob_name(self):
+        self.mock_blob_client.download_blob.return_value.readall.return_value = b'{"token": "data"}'
+
+        backend = BlobTokenCacheBackend(_CONN_STR, blob_name="token_cache_work.json")
         assert backend.blob_name == "token_cache_work.json"
 
-        cache = MagicMock()
+        cache = Mock()
         backend.load(cache)
-        mock_container.get_blob_client.assert_called_with("token_cache_work.json")
+        self.mock_container.get_blob_client.assert_called_with("token_cache_work.json")
 
         cache.has_state_changed = True
         cache.serialize.return_value = '{"new": "data"}'
         backend.save(cache)
         # The last call should also be with the custom blob name
-        mock_container.get_blob_client.assert_called_with("token_cache_work.json")
-
-    @patch("azure.storage.blob.BlobServiceClient")
-    def test_default_blob_name(self, mock_blob_cls):
-        mock_container = MagicMock()
-        mock_blob_cls.from_connection_string.return_value.get_container_client.return_value = mock_container
+        self.mock_container.get_blob_client.assert_called_with("token_cache_work.json")
 
-        backend = BlobTokenCacheBackend("DefaultEndpointsProtocol=https;AccountName=test")
+    def test_default_blob_name(self, blob_env):
+        backend, _, _ = blob_env
         assert backend.blob_name == "token_cache.json"
 
+    def test_load_not_modified_uses_memory_copy(self, blob_env):
+        backend, mock_blob_client, _ = blob_env
+        downloader = mock_blob_client.download_blob.return_value
+        downloader.readall.return_value = b'{"token": "data"}'
+        downloader.properties.etag = '"etag-1"'
+        backend.load(Mock())
+
+        mock_blob_client.download_blob.side_effect = ResourceNotModifiedError("Not modified")
+        cache = Mock()
+        backend.load(cache)
+
+        mock_blob_client.download_blob.assert_called_with(
+            etag='"etag-1"', match_condition=MatchConditions.IfModified,
+        )
+        cache.deserialize.assert_called_once_with('{"token": "data"}')
+
+    def test_service_and_container_reused(self):
+        first = BlobTokenCacheBackend(_CONN_STR)
+        second = BlobTokenCacheBackend(_CONN_STR)
+
+        assert first.blob_service is second.blob_service
+        self.mock_blob_cls.from_connection_string.assert_called_once()
+        self.mock_container.create_container.assert_called_once()
+
+    def test_existing_container_is_ignored(self):
+        self.mock_container.create_container.side_effect = ResourceExistsError("exists")
+
+        backend = BlobTokenCacheBackend(_CONN_STR)
+        assert backend.container_client is self.mock_container
+
 
 class TestAzureAuthManager:
     def _make_manager(self):
-        blob_backend = MagicMock()
-        with patch("msal.PublicClientApplication") as mock_app_cls:
-            mock_app = MagicMock()
+        blob_backend = Mock()
+        with patch.object(msal, "PublicClientApplication") as mock_app_cls:
+            mock_app = Mock()
             mock_app_cls.return_value = mock_app
             manager = AzureAuthManager(
                 client_id="test-client-id",
@@ -122,6 +235,42 @@ class TestAzureAuthManager:
         assert token == "abc123"
         blob_backend.save.assert_called_once()
 
+    def test_get_token_records_expiry(self):
+        manager, mock_app, _ = self._make_manager()
+        mock_app.get_accounts.return_value = [{"username": "user@test.com"}]
+        mock_app.acquire_token_silent.return_value = {"access_token": "abc", "expires_in": 3600}
+
+        with patch.object(time, "time", return_value=1000.0):
+            manager.get_token()
+
+        assert manager.expires_at == 4600.0
+
+    def test_get_token_reuses_account(self):
+        manager, mock_app, blob_backend = self._make_manager()
+        mock_app.get_accounts.return_value = [{"username": "user@test.com"}]
+        mock_app.acquire_token_silent.return_value = {"access_token": "abc123"}
+
+        manager.get_token()
+        manager.get_token()
+
+        mock_app.get_accounts.assert_called_once()
+        assert mock_app.acquire_token_silent.call_count == 2
+
+    def test_get_token_reenumerates_when_cached_account_fails(self):
+        manager, mock_app, blob_backend = self._make_manager()
+        mock_app.get_accounts.return_value = [{"username": "user@test.com"}]
+        mock_app.acquire_token_silent.side_effect = [
+            {"access_token": "abc123"},
+            None,
+            {"access_token": "def456"},
+        ]
+
+        manager.get_token()
+        token = manager.get_token()
+
+        assert token == "def456"
+        assert mock_app.get_accounts.call_count == 2
+
     def test_get_token_no_accounts_raises(self):
         manager, mock_app, blob_backend = self._make_manager()
         mock_app.get_accounts.return_value = []
@@ -148,16 +297,18 @@ class TestAzureAuthManager:
         with pytest.raises(RuntimeError, match="Silent token acquisition failed"):
             manager.get_token()
 
-    @patch("src.auth.requests.get")
-    def test_verify_connection(self, mock_get):
+    @patch.object(_SESSION, "get")
+    def test_verify_connection(self, mock_get, me_response):
         manager, mock_app, blob_backend = self._make_manager()
         mock_app.get_accounts.return_value = [{"username": "user@test.com"}]
         mock_app.acquire_token_silent.return_value = {"access_token": "abc123"}
 
-        mock_resp = MagicMock()
-        mock_resp.json.return_value = {"displayName": "Test User", "mail": "test@test.com"}
-        mock_resp.raise_for_status = MagicMock()
-        mock_get.return_value = mock_resp
+        mock_get.return_value = me_response
 
         user = manager.verify_connection()
-        assert user["displayName"] == "Test User"
+        assert user["displayName"] == "Kevin"
+
+        args, kwargs = mock_get.call_args
+        assert args == ("https://graph.microsoft.com/v1.0/me",)
+        request = kwargs["auth"](Mock(headers={}))
+        assert request.headers["Authorization"] == "Bearer abc123"
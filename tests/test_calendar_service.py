@@ -1,17 +1,26 @@
 from datetime import datetime
-from unittest.mock import MagicMock
+from unittest.mock import Mock
+
+import pytest
 
 from src.services.calendar_service import CalendarService
-from tests.mocks.graph_responses import CREATED_EVENT, WEEKLY_REVIEW_EVENT
+
+
+@pytest.fixture(scope="class")
+def _calendar_pair():
+    """One mocked Graph client and CalendarService per test class."""
+    graph = Mock()
+    return graph, CalendarService(graph)
 
 
 class TestCalendarService:
-    def setup_method(self):
-        self.graph = MagicMock()
-        self.service = CalendarService(self.graph)
+    @pytest.fixture(autouse=True)
+    def _fresh_graph(self, _calendar_pair):
+        self.graph, self.service = _calendar_pair
+        self.graph.reset_mock(return_value=True, side_effect=True)
 
-    def test_create_event(self):
-        self.graph.post.return_value = CREATED_EVENT
+    def test_create_event(self, created_event):
+        self.graph.post.return_value = created_event
         start = datetime(2025, 1, 20, 9, 0)
         result = self.service.create_event(
             subject="Test Event",
@@ -22,8 +31,8 @@ class TestCalendarService:
         assert call_json["subject"] == "Test Event"
         assert "America/Mexico_City" in call_json["start"]["timeZone"]
 
-    def test_create_event_with_end(self):
-        self.graph.post.return_value = CREATED_EVENT
+    def test_create_event_with_end(self, created_event):
+        self.graph.post.return_value = created_event
         start = datetime(2025, 1, 20, 9, 0)
         end = datetime(2025, 1, 20, 10, 30)
         self.service.create_event(subject="Test", start=start, end=end)
@@ -41,8 +50,8 @@ class TestCalendarService:
         self.service.delete_event("event-123")
         self.graph.delete.assert_called_once_with("/me/events/event-123")
 
-    def test_find_event_by_subject_found(self):
-        self.graph.get_all.return_value = [CREATED_EVENT]
+    def test_find_event_by_subject_found(self, created_event):
+        self.graph.get_all.return_value = [created_event]
         result = self.service.find_event_by_subject("[To Do] Test Task")
         assert result["id"] == "event-123"
 
@@ -51,8 +60,8 @@ class TestCalendarService:
         result = self.service.find_event_by_subject("Nonexistent")
         assert result is None
 
-    def test_create_weekly_review(self):
-        self.graph.post.return_value = WEEKLY_REVIEW_EVENT
+    def test_create_weekly_review(self, weekly_review_event):
+        self.graph.post.return_value = weekly_review_event
         start = datetime(2025, 1, 19, 18, 0)
         result = self.service.create_weekly_review(
             start=start,
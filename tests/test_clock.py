@@ -0,0 +1,21 @@
+from unittest.mock import patch
+
+from src.utils import clock
+
+
+class TestClock:
+    def test_now_iso_formats_once_per_second(self):
+        clock._TS_CACHE = (0, "")
+        with patch("src.utils.clock.time.time", side_effect=[1700000000.1, 1700000000.9, 1700000001.0]), \
+                patch("src.utils.clock.datetime", wraps=clock.datetime) as mock_dt:
+            first = clock.now_iso()
+            second = clock.now_iso()
+            third = clock.now_iso()
+
+        assert first == second == "2023-11-14T22:13:20+00:00"
+        assert third == "2023-11-14T22:13:21+00:00"
+        assert mock_dt.fromtimestamp.call_count == 2
+
+    def test_utc_timestamp_returns_epoch_seconds(self):
+        with patch("src.utils.clock.time.time", return_value=1700000000.5):
+            assert clock.utc_timestamp() == (1700000000, "2023-11-14T22:13:20+00:00")
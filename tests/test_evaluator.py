@@ -3,69 +3,53 @@ import pytest
 from src.rules.evaluator import TaskEvaluator
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def evaluator(config):
+    # needs_onenote is read-only apart from its score memo; one instance serves all
     return TaskEvaluator(config["rules"])
 
 
 class TestTaskEvaluator:
-    def test_simple_task_negative_keyword(self, evaluator):
-        task = {"title": "Pagar luz", "body": {"content": ""}}
-        assert evaluator.needs_onenote(task) is False
-
-    def test_complex_task_positive_keyword(self, evaluator):
-        task = {"title": "Investigar opciones de migración", "body": {"content": ""}}
-        assert evaluator.needs_onenote(task) is True
-
-    def test_force_onenote_prefix(self, evaluator):
-        task = {"title": "#onenote Revisar notas", "body": {"content": ""}}
-        assert evaluator.needs_onenote(task) is True
-
-    def test_force_skip_prefix(self, evaluator):
-        task = {"title": "#simple Investigar algo", "body": {"content": ""}}
-        assert evaluator.needs_onenote(task) is False
-
-    def test_long_title_adds_score(self, evaluator):
-        task = {
-            "title": "Preparar la documentación completa del nuevo sistema de gestión de inventarios",
-            "body": {"content": ""},
-        }
-        assert evaluator.needs_onenote(task) is True
-
-    def test_short_simple_task(self, evaluator):
-        task = {"title": "Comprar pan", "body": {"content": ""}}
-        assert evaluator.needs_onenote(task) is False
-
-    def test_task_with_body_content(self, evaluator):
-        task = {
-            "title": "Revisar el reporte mensual de ventas del equipo",
-            "body": {"content": "Ver datos en SharePoint"},
-        }
+    @pytest.mark.parametrize("title, body, expected", [
+        pytest.param("Pagar luz", {"content": ""}, False, id="simple_task_negative_keyword"),
+        pytest.param("Investigar opciones de migración", {"content": ""}, True,
+                     id="complex_task_positive_keyword"),
+        pytest.param("#onenote Revisar notas", {"content": ""}, True, id="force_onenote_prefix"),
+        pytest.param("#simple Investigar algo", {"content": ""}, False, id="force_skip_prefix"),
+        pytest.param(
+            "Preparar la documentación completa del nuevo sistema de gestión de inventarios",
+            {"content": ""}, True, id="long_title_adds_score",
+        ),
+        pytest.param("Comprar pan", {"content": ""}, False, id="short_simple_task"),
         # Long title (9 words) + body content -> score should be >= 2
-        assert evaluator.needs_onenote(task) is True
-
-    def test_body_as_string(self, evaluator):
-        task = {"title": "Diseñar nuevo logo", "body": "notas extra"}
-        assert evaluator.needs_onenote(task) is True
-
-    def test_medium_length_neutral_task(self, evaluator):
-        task = {"title": "Revisar correo electrónico", "body": {"content": ""}}
+        pytest.param("Revisar el reporte mensual de ventas del equipo",
+                     {"content": "Ver datos en SharePoint"}, True, id="task_with_body_content"),
+        pytest.param("Diseñar nuevo logo", "notas extra", True, id="body_as_string"),
         # No positive/negative keywords, 3 words (short penalty -1)
-        assert evaluator.needs_onenote(task) is False
-
-    def test_multiple_positive_keywords(self, evaluator):
-        task = {
-            "title": "Diseñar estrategia del proyecto",
-            "body": {"content": ""},
-        }
+        pytest.param("Revisar correo electrónico", {"content": ""}, False,
+                     id="medium_length_neutral_task"),
         # diseñar (+2) + estrategia (+2) + proyecto (+2) = 6
-        assert evaluator.needs_onenote(task) is True
-
-    def test_mixed_signals(self, evaluator):
-        task = {"title": "Llamar para resolver el problema", "body": {"content": ""}}
+        pytest.param("Diseñar estrategia del proyecto", {"content": ""}, True,
+                     id="multiple_positive_keywords"),
         # llamar (-2) + resolver (+2) = 0, < threshold
-        assert evaluator.needs_onenote(task) is False
-
-    def test_empty_task(self, evaluator):
-        task = {"title": "", "body": {"content": ""}}
-        assert evaluator.needs_onenote(task) is False
+        pytest.param("Llamar para resolver el problema", {"content": ""}, False, id="mixed_signals"),
+        pytest.param("", {"content": ""}, False, id="empty_task"),
+    ])
+    def test_needs_onenote(self, evaluator, title, body, expected):
+        assert evaluator.needs_onenote({"title": title, "body": body}) is expected
+
+    def test_overlapping_keywords_each_count_once(self):
+        evaluator = TaskEvaluator({
+            "positive_keywords": ["plan", "planificar", "lan"],
+            "negative_keywords": [],
+        })
+        # All three keywords occur (nested in one word); repeats do not add more
+        assert evaluator._calculate_score("planificar planificar", "") == 2 * 3 - 1
+
+    def test_score_memoized_for_unchanged_task(self, evaluator):
+        task = {"title": "Investigar opciones de migración", "body": {"content": "x"}}
+        evaluator._cached_score.cache_clear()
+        evaluator.needs_onenote(task)
+        evaluator.needs_onenote(dict(task))
+        info = evaluator._cached_score.cache_info()
+        assert (info.hits, info.misses) == (1, 1)
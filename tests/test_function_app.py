@@ -1,175 +1,165 @@
 from __future__ import annotations
 
+import os
 from unittest.mock import MagicMock, patch
 
 import pytest
 
+import function_app
+from function_app import sync_trigger
 
-class TestFunctionApp:
-    @patch("function_app.SyncEngine")
-    @patch("function_app.CalendarService")
-    @patch("function_app.OneNoteService")
-    @patch("function_app.TodoService")
-    @patch("function_app.TaskEvaluator")
-    @patch("function_app.TableSyncCache")
-    @patch("function_app.GraphClient")
-    @patch("function_app.create_auth_azure")
-    @patch("function_app.setup_logger")
-    @patch("function_app._load_config")
-    @patch.dict("os.environ", {
+_SERVICE_NAMES = (
+    "create_auth_azure", "TableSyncCache", "GraphClient", "create_session", "TaskEvaluator",
+    "CalendarService", "OneNoteService", "SyncEngine", "TodoService",
+    "setup_logger",
+)
+
+
+@pytest.fixture(scope="class")
+def _azure_env():
+    """Function App settings, set once per class rather than per test."""
+    with patch.dict(os.environ, {
         "CLIENT_ID": "test-client-id",
         "AzureWebJobsStorage": "UseDevelopmentStorage=true",
-    })
-    def test_sync_trigger_calls_run_once(
-        self,
-        mock_load_config,
-        mock_setup_logger,
-        mock_create_auth,
-        mock_graph,
-        mock_table_cache,
-        mock_evaluator,
-        mock_todo,
-        mock_onenote,
-        mock_calendar,
-        mock_engine_cls,
-    ):
-        from function_app import sync_trigger
-
-        mock_load_config.return_value = {
+    }):
+        yield
+
+
+@pytest.fixture
+def services():
+    """Replace the lazily imported sync stack with mocks."""
+    mocks = {name: MagicMock() for name in _SERVICE_NAMES}
+    with patch.dict(function_app._SERVICES, mocks, clear=True), \
+            patch.dict(function_app._CTX, clear=True):
+        yield function_app._SERVICES
+
+
+@pytest.fixture
+def load_config(monkeypatch):
+    """Swap function_app._load_config for a mock with a plain attribute set."""
+    mock = MagicMock()
+    monkeypatch.setattr(function_app, "_load_config", mock)
+    return mock
+
+
+@pytest.mark.usefixtures("_azure_env")
+class TestFunctionApp:
+    @pytest.mark.parametrize(
+        "env, past_due, authority, blob_name, table_prefix, config_file",
+        [
+            pytest.param(
+                {}, False, "https://login.microsoftonline.com/consumers",
+                "token_cache.json", "", "config.yaml", id="defaults",
+            ),
+            pytest.param(
+                {}, True, "https://login.microsoftonline.com/consumers",
+                "token_cache.json", "", "config.yaml", id="past-due",
+            ),
+            pytest.param(
+                {
+                    "AUTHORITY": "https://login.microsoftonline.com/organizations",
+                    "TOKEN_BLOB_NAME": "token_cache_work.json",
+                    "TABLE_PREFIX": "Work",
+                    "CONFIG_FILE": "config_work.yaml",
+                },
+                False, "https://login.microsoftonline.com/organizations",
+                "token_cache_work.json", "Work", "config_work.yaml", id="custom-env",
+            ),
+        ],
+    )
+    def test_sync_trigger_runs_once(self, load_config, services, monkeypatch, env, past_due,
+                                    authority, blob_name, table_prefix, config_file):
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        load_config.return_value = {
             "rules": {},
             "logging": {"level": "INFO"},
         }
         mock_engine = MagicMock()
-        mock_engine_cls.return_value = mock_engine
+        services["SyncEngine"].return_value = mock_engine
 
         timer = MagicMock()
-        timer.past_due = False
+        timer.past_due = past_due
 
         sync_trigger(timer)
 
-        mock_create_auth.assert_called_once_with(
+        services["create_auth_azure"].assert_called_once_with(
             "test-client-id", "UseDevelopmentStorage=true",
-            authority="https://login.microsoftonline.com/consumers",
-            blob_name="token_cache.json",
+            authority=authority, blob_name=blob_name,
+        )
+        services["TableSyncCache"].assert_called_once_with(
+            "UseDevelopmentStorage=true", table_prefix=table_prefix,
+        )
+        services["GraphClient"].assert_called_once_with(
+            services["create_auth_azure"].return_value,
+            session=services["create_session"].return_value,
         )
-        mock_table_cache.assert_called_once_with("UseDevelopmentStorage=true", table_prefix="")
-        mock_load_config.assert_called_once_with("config.yaml")
+        load_config.assert_called_once_with(config_file)
         mock_engine.run_once.assert_called_once()
 
-    @patch("function_app.SyncEngine")
-    @patch("function_app.CalendarService")
-    @patch("function_app.OneNoteService")
-    @patch("function_app.TodoService")
-    @patch("function_app.TaskEvaluator")
-    @patch("function_app.TableSyncCache")
-    @patch("function_app.GraphClient")
-    @patch("function_app.create_auth_azure")
-    @patch("function_app.setup_logger")
-    @patch("function_app._load_config")
-    @patch.dict("os.environ", {
-        "CLIENT_ID": "test-client-id",
-        "AzureWebJobsStorage": "UseDevelopmentStorage=true",
-    })
-    def test_sync_trigger_past_due(
-        self,
-        mock_load_config,
-        mock_setup_logger,
-        mock_create_auth,
-        mock_graph,
-        mock_table_cache,
-        mock_evaluator,
-        mock_todo,
-        mock_onenote,
-        mock_calendar,
-        mock_engine_cls,
-    ):
-        from function_app import sync_trigger
-
-        mock_load_config.return_value = {
-            "rules": {},
-            "logging": {"level": "INFO"},
-        }
-        mock_engine = MagicMock()
-        mock_engine_cls.return_value = mock_engine
+    def test_sync_trigger_propagates_exception(self, load_config, services):
+        load_config.side_effect = RuntimeError("config error")
 
         timer = MagicMock()
-        timer.past_due = True
+        timer.past_due = False
 
-        sync_trigger(timer)
+        with pytest.raises(RuntimeError, match="config error"):
+            sync_trigger(timer)
 
-        mock_engine.run_once.assert_called_once()
 
-    @patch("function_app.SyncEngine")
-    @patch("function_app.CalendarService")
-    @patch("function_app.OneNoteService")
-    @patch("function_app.TodoService")
-    @patch("function_app.TaskEvaluator")
-    @patch("function_app.TableSyncCache")
-    @patch("function_app.GraphClient")
-    @patch("function_app.create_auth_azure")
-    @patch("function_app.setup_logger")
-    @patch("function_app._load_config")
-    @patch.dict("os.environ", {
-        "CLIENT_ID": "test-client-id",
-        "AzureWebJobsStorage": "UseDevelopmentStorage=true",
-        "AUTHORITY": "https://login.microsoftonline.com/organizations",
-        "TOKEN_BLOB_NAME": "token_cache_work.json",
-        "TABLE_PREFIX": "Work",
-        "CONFIG_FILE": "config_work.yaml",
-    })
-    def test_sync_trigger_with_custom_env_vars(
-        self,
-        mock_load_config,
-        mock_setup_logger,
-        mock_create_auth,
-        mock_graph,
-        mock_table_cache,
-        mock_evaluator,
-        mock_todo,
-        mock_onenote,
-        mock_calendar,
-        mock_engine_cls,
-    ):
-        from function_app import sync_trigger
-
-        mock_load_config.return_value = {
-            "rules": {},
-            "logging": {"level": "INFO"},
-        }
-        mock_engine = MagicMock()
-        mock_engine_cls.return_value = mock_engine
+@pytest.mark.usefixtures("_azure_env")
+class TestWarmContext:
+    def test_warm_invocations_reuse_engine(self, load_config, services):
+        load_config.return_value = {"rules": {}}
+        mock_engine = services["SyncEngine"].return_value
 
         timer = MagicMock()
         timer.past_due = False
 
+        sync_trigger(timer)
         sync_trigger(timer)
 
-        mock_create_auth.assert_called_once_with(
-            "test-client-id", "UseDevelopmentStorage=true",
-            authority="https://login.microsoftonline.com/organizations",
-            blob_name="token_cache_work.json",
-        )
-        mock_table_cache.assert_called_once_with("UseDevelopmentStorage=true", table_prefix="Work")
-        mock_load_config.assert_called_once_with("config_work.yaml")
-        mock_engine.run_once.assert_called_once()
-
-    @patch("function_app.setup_logger")
-    @patch("function_app._load_config")
-    @patch.dict("os.environ", {
-        "CLIENT_ID": "test-client-id",
-        "AzureWebJobsStorage": "UseDevelopmentStorage=true",
-    })
-    def test_sync_trigger_propagates_exception(
-        self,
-        mock_load_config,
-        mock_setup_logger,
-    ):
-        from function_app import sync_trigger
+        services["create_auth_azure"].assert_called_once()
+        services["TableSyncCache"].assert_called_once()
+        assert mock_engine.run_once.call_count == 2
+        services["TableSyncCache"].return_value.close.assert_not_called()
 
-        mock_load_config.side_effect = RuntimeError("config error")
+    def test_failed_cycle_rebuilds_context(self, load_config, services):
+        load_config.return_value = {"rules": {}}
+        mock_engine = services["SyncEngine"].return_value
+        mock_engine.run_once.side_effect = [RuntimeError("boom"), None]
 
         timer = MagicMock()
         timer.past_due = False
 
-        with pytest.raises(RuntimeError, match="config error"):
+        with pytest.raises(RuntimeError, match="boom"):
             sync_trigger(timer)
+        assert function_app._CTX == {}
+        services["TableSyncCache"].return_value.close.assert_called_once()
+
+        sync_trigger(timer)
+        assert services["create_auth_azure"].call_count == 2
+
+
+class TestLoadServices:
+    def test_load_services_imports_once(self):
+        with patch.dict(function_app._SERVICES, clear=True):
+            services = function_app._load_services()
+            assert set(services) == set(_SERVICE_NAMES)
+            from src.services.sync_engine import SyncEngine
+            assert services["SyncEngine"] is SyncEngine
+            assert function_app._load_services() is services
+
+
+class TestLoadConfig:
+    def test_load_config_cached_until_mtime_changes(self, config_file):
+        function_app._CONFIG_CACHE.clear()
+        first = function_app._load_config(config_file)
+        second = function_app._load_config(config_file)
+        assert first is second
+
+        stat = os.stat(config_file)
+        os.utime(config_file, (stat.st_atime, stat.st_mtime + 10))
+        third = function_app._load_config(config_file)
+        assert third is not first
+        assert third == first
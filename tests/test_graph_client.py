@@ -1,25 +1,64 @@
+from typing import Callable, NamedTuple
 from unittest.mock import MagicMock, patch
 
 import pytest
 import requests
 
-from src.graph_client import GraphClient, BASE_URL
+from src import graph_client
+from src.graph_client import GraphClient, BASE_URL, create_session
+
+
+class _Resp(NamedTuple):
+    """Immutable stand-in for requests.Response, safe to share between tests."""
+
+    status_code: int
+    content: bytes
+    json: Callable[[], object]
+    headers: dict
+    text: str
+    raise_for_status: Callable[[], None]
+
+
+def _resp(status_code=200, body=None, headers=None, text=""):
+    """Build a _Resp; content is empty when there is no body."""
+    return _Resp(
+        status_code=status_code,
+        content=b"x" if body is not None else b"",
+        json=lambda: body,
+        headers=headers or {},
+        text=text,
+        raise_for_status=lambda: None,
+    )
+
+
+OK_RESP = _resp(200, {"ok": True})
+EMPTY_OK = _resp(200, {})
+ERR_500 = _resp(500)
+RATE_429 = _resp(429, headers={"Retry-After": "2"})
+UNAUTH_401 = _resp(401, text="Unauthorized")
+
+
+@pytest.fixture(scope="class")
+def _client_pair():
+    """One GraphClient (and its pooled session) per test class."""
+    auth, sleep = MagicMock(), MagicMock()
+    return GraphClient(auth, timeout=5, max_retries=2, sleep_fn=sleep), auth, sleep
 
 
 class TestGraphClient:
-    def setup_method(self):
-        self.auth = MagicMock()
+    @pytest.fixture(autouse=True)
+    def _fresh_auth(self, _client_pair):
+        self.client, self.auth, self.sleep = _client_pair
+        self.auth.reset_mock(return_value=True, side_effect=True)
+        self.sleep.reset_mock()
         self.auth.get_token.return_value = "test-token"
-        self.client = GraphClient(self.auth, timeout=5, max_retries=2)
+        # Not a number, so headers are not cached unless a test sets a real expiry
+        self.auth.expires_at = None
+        self.client._invalidate_headers()
 
     @patch.object(requests.Session, "request")
     def test_get_request(self, mock_request):
-        mock_resp = MagicMock()
-        mock_resp.status_code = 200
-        mock_resp.content = b'{"value": "test"}'
-        mock_resp.json.return_value = {"value": "test"}
-        mock_resp.raise_for_status = MagicMock()
-        mock_request.return_value = mock_resp
+        mock_request.return_value = _resp(200, {"value": "test"})
 
         result = self.client.get("/me/todo/lists")
 
@@ -31,21 +70,11 @@ class TestGraphClient:
 
     @patch.object(requests.Session, "request")
     def test_get_all_with_pagination(self, mock_request):
-        page1 = MagicMock()
-        page1.status_code = 200
-        page1.content = b'test'
-        page1.json.return_value = {
+        page1 = _resp(200, {
             "value": [{"id": "1"}],
             "@odata.nextLink": "https://graph.microsoft.com/v1.0/next",
-        }
-        page1.raise_for_status = MagicMock()
-
-        page2 = MagicMock()
-        page2.status_code = 200
-        page2.content = b'test'
-        page2.json.return_value = {"value": [{"id": "2"}]}
-        page2.raise_for_status = MagicMock()
-
+        })
+        page2 = _resp(200, {"value": [{"id": "2"}]})
         mock_request.side_effect = [page1, page2]
 
         result = self.client.get_all("/me/todo/lists")
@@ -54,122 +83,186 @@ class TestGraphClient:
         assert result[0]["id"] == "1"
         assert result[1]["id"] == "2"
 
-    @patch("time.sleep")
     @patch.object(requests.Session, "request")
-    def test_retry_on_server_error(self, mock_request, mock_sleep):
-        error_resp = MagicMock()
-        error_resp.status_code = 500
-        error_resp.headers = {}
-        error_resp.raise_for_status = MagicMock()
-
-        success_resp = MagicMock()
-        success_resp.status_code = 200
-        success_resp.content = b'{"ok": true}'
-        success_resp.json.return_value = {"ok": True}
-        success_resp.raise_for_status = MagicMock()
-
-        mock_request.side_effect = [error_resp, success_resp]
+    def test_retry_on_server_error(self, mock_request):
+        mock_request.side_effect = [ERR_500, OK_RESP]
 
         result = self.client.get("/me")
         assert result == {"ok": True}
         assert mock_request.call_count == 2
+        (wait,), _ = self.sleep.call_args
+        assert 1 <= wait < 2  # 2**0 plus jitter
 
-    @patch("time.sleep")
     @patch.object(requests.Session, "request")
-    def test_rate_limit_handling(self, mock_request, mock_sleep):
-        rate_resp = MagicMock()
-        rate_resp.status_code = 429
-        rate_resp.headers = {"Retry-After": "2"}
-
-        success_resp = MagicMock()
-        success_resp.status_code = 200
-        success_resp.content = b'{"ok": true}'
-        success_resp.json.return_value = {"ok": True}
-        success_resp.raise_for_status = MagicMock()
-
-        mock_request.side_effect = [rate_resp, success_resp]
+    def test_rate_limit_handling(self, mock_request):
+        mock_request.side_effect = [RATE_429, OK_RESP]
 
         result = self.client.get("/me")
         assert result == {"ok": True}
-        mock_sleep.assert_called_with(2)
+        self.sleep.assert_called_once_with(2)
 
     @patch.object(requests.Session, "request")
     def test_post_request(self, mock_request):
-        mock_resp = MagicMock()
-        mock_resp.status_code = 201
-        mock_resp.content = b'{"id": "new-123"}'
-        mock_resp.json.return_value = {"id": "new-123"}
-        mock_resp.raise_for_status = MagicMock()
-        mock_request.return_value = mock_resp
+        mock_request.return_value = _resp(201, {"id": "new-123"})
 
         result = self.client.post("/me/events", json={"subject": "Test"})
         assert result["id"] == "new-123"
 
+    @patch.object(requests.Session, "request")
+    def test_batch_splits_into_chunks_of_20(self, mock_request):
+        def respond(method, url, **kwargs):
+            return _resp(200, {"responses": [
+                {"id": r["id"], "status": 200, "body": {}} for r in kwargs["json"]["requests"]
+            ]})
+
+        mock_request.side_effect = respond
+        subs = [{"id": str(i), "method": "GET", "url": f"/x/{i}"} for i in range(25)]
+
+        result = self.client.batch(subs)
+
+        assert mock_request.call_count == 2
+        assert mock_request.call_args_list[0][0] == ("POST", f"{BASE_URL}/$batch")
+        assert len(mock_request.call_args_list[0][1]["json"]["requests"]) == 20
+        assert set(result) == {str(i) for i in range(25)}
+
     @patch.object(requests.Session, "request")
     def test_delete_request(self, mock_request):
-        mock_resp = MagicMock()
-        mock_resp.status_code = 204
-        mock_resp.content = b''
-        mock_resp.raise_for_status = MagicMock()
-        mock_request.return_value = mock_resp
+        mock_request.return_value = _resp(204)
 
         self.client.delete("/me/events/event-123")
         mock_request.assert_called_once()
 
-    @patch("time.sleep")
     @patch.object(requests.Session, "request")
-    def test_max_retries_exceeded(self, mock_request, mock_sleep):
-        error_resp = MagicMock()
-        error_resp.status_code = 500
-        error_resp.headers = {}
-        error_resp.raise_for_status = MagicMock()
-        mock_request.return_value = error_resp
+    def test_max_retries_exceeded(self, mock_request):
+        mock_request.return_value = ERR_500
 
         with pytest.raises(requests.HTTPError, match="failed after 2 retries"):
             self.client.get("/me")
+        # Exponential backoff: 2**attempt plus up to a second of jitter
+        waits = [c.args[0] for c in self.sleep.call_args_list]
+        assert len(waits) == 2
+        assert 1 <= waits[0] < 2 <= waits[1] < 3
 
     @patch.object(requests.Session, "request")
-    def test_401_local_removes_account(self, mock_request):
+    def test_401_local_removes_account(self, mock_request, monkeypatch):
         """In local mode, 401 should remove MSAL account and retry."""
-        unauth_resp = MagicMock()
-        unauth_resp.status_code = 401
-        unauth_resp.text = "Unauthorized"
+        mock_request.side_effect = [UNAUTH_401, OK_RESP]
 
-        success_resp = MagicMock()
-        success_resp.status_code = 200
-        success_resp.content = b'{"ok": true}'
-        success_resp.json.return_value = {"ok": True}
-        success_resp.raise_for_status = MagicMock()
-
-        mock_request.side_effect = [unauth_resp, success_resp]
-
-        import os
-        os.environ.pop("AZURE_FUNCTIONS_ENVIRONMENT", None)
+        monkeypatch.setattr(graph_client, "_IS_AZURE", False)
 
         result = self.client.get("/me")
         assert result == {"ok": True}
         self.auth.app.remove_account.assert_called_once()
 
     @patch.object(requests.Session, "request")
-    def test_401_azure_does_not_remove_account(self, mock_request):
+    def test_401_azure_does_not_remove_account(self, mock_request, monkeypatch):
         """In Azure Functions, 401 should NOT remove MSAL account."""
-        unauth_resp = MagicMock()
-        unauth_resp.status_code = 401
-        unauth_resp.text = "Unauthorized"
-
-        success_resp = MagicMock()
-        success_resp.status_code = 200
-        success_resp.content = b'{"ok": true}'
-        success_resp.json.return_value = {"ok": True}
-        success_resp.raise_for_status = MagicMock()
-
-        mock_request.side_effect = [unauth_resp, success_resp]
-
-        import os
-        os.environ["AZURE_FUNCTIONS_ENVIRONMENT"] = "Production"
-        try:
-            result = self.client.get("/me")
-            assert result == {"ok": True}
-            self.auth.app.remove_account.assert_not_called()
-        finally:
-            os.environ.pop("AZURE_FUNCTIONS_ENVIRONMENT", None)
+        mock_request.side_effect = [UNAUTH_401, OK_RESP]
+
+        monkeypatch.setattr(graph_client, "_IS_AZURE", True)
+
+        result = self.client.get("/me")
+        assert result == {"ok": True}
+        self.auth.app.remove_account.assert_not_called()
+
+    def test_uses_injected_session(self):
+        session = create_session()
+        client = GraphClient(self.auth, session=session)
+        assert client.session is session
+        adapter = session.get_adapter("https://graph.microsoft.com/v1.0/me")
+        assert adapter._pool_maxsize == 32
+
+    def test_default_session_is_pooled(self):
+        adapter = self.client.session.get_adapter("https://graph.microsoft.com/v1.0/me")
+        assert adapter._pool_maxsize == 32
+
+    @patch.object(requests.Session, "request")
+    def test_auth_header_reused_until_expiry(self, mock_request):
+        import time
+
+        self.auth.expires_at = time.time() + 3600
+        mock_request.side_effect = [EMPTY_OK, EMPTY_OK, UNAUTH_401, EMPTY_OK]
+
+        self.client.get("/me")
+        self.client.get("/me")
+        assert self.auth.get_token.call_count == 1
+
+        # A 401 drops the cached header and fetches a fresh token
+        self.client.get("/me")
+        assert self.auth.get_token.call_count == 2
+
+    @patch.object(requests.Session, "request")
+    def test_auth_header_refreshed_near_expiry(self, mock_request):
+        import time
+
+        self.auth.expires_at = time.time() + 10
+        mock_request.return_value = EMPTY_OK
+
+        self.client.get("/me")
+        self.client.get("/me")
+        assert self.auth.get_token.call_count == 2
+
+    @patch.object(requests.Session, "request")
+    def test_concurrent_requests_refresh_token_once(self, mock_request):
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.auth.expires_at = time.time() + 3600
+        mock_request.return_value = EMPTY_OK
+        gate = threading.Event()
+
+        def slow_token():
+            gate.wait(1)
+            return "test-token"
+
+        self.auth.get_token.side_effect = slow_token
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(self.client.get, "/me") for _ in range(4)]
+            gate.set()
+            for f in futures:
+                f.result()
+
+        assert self.auth.get_token.call_count == 1
+
+    @patch.object(requests.Session, "request")
+    def test_401_for_replaced_token_keeps_account(self, mock_request, monkeypatch):
+        """A 401 for a token another thread already replaced must not drop the account."""
+        import time
+
+        monkeypatch.setattr(graph_client, "_IS_AZURE", False)
+        self.auth.expires_at = time.time() + 3600
+        self.auth.get_token.side_effect = ["old-token", "new-token"]
+
+        calls = []
+
+        def respond(method, url, headers, **kwargs):
+            calls.append(headers["Authorization"])
+            if len(calls) > 1:
+                return OK_RESP
+            # Another worker refreshes the token while this request is in flight
+            self.client._invalidate_headers()
+            self.client._headers()
+            return UNAUTH_401
+
+        mock_request.side_effect = respond
+        self.client.get("/me")
+
+        self.auth.app.remove_account.assert_not_called()
+        assert calls == ["Bearer old-token", "Bearer new-token"]
+
+    @patch.object(requests.Session, "request")
+    def test_iter_all_fetches_next_page_lazily(self, mock_request):
+        mock_request.side_effect = [
+            _resp(200, {
+                "value": [{"id": "1"}],
+                "@odata.nextLink": "https://graph.microsoft.com/v1.0/next",
+            }),
+            _resp(200, {"value": [{"id": "2"}]}),
+        ]
+
+        items = self.client.iter_all("/me/todo/lists")
+        assert next(items) == {"id": "1"}
+        assert mock_request.call_count == 1
+        assert list(items) == [{"id": "2"}]
+        assert mock_request.call_count == 2
@@ -1,6 +1,6 @@
 """End-to-end integration test simulating a full sync cycle with mocked Graph API."""
 
-from unittest.mock import MagicMock
+import re
 
 import pytest
 
@@ -16,45 +16,81 @@ from tests.mocks.graph_responses import (
 )
 
 
-@pytest.fixture
-def mock_graph():
-    return MagicMock()
+# Collection responses keyed by the URL's last path segment
+_COLLECTIONS = {
+    "notebooks": NOTEBOOKS["value"],
+    "sections": SECTIONS["value"],
+    "lists": TODO_LISTS["value"],
+}
 
+_LIST_TASKS_RX = re.compile(r"/lists/([^/]+)/tasks")
+
+
+class StubGraph:
+    """Graph client stand-in whose methods are plain callables tests reassign."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.get_all = lambda url, params=None: []
+        # Resolve get_all at call time so tests only need to override that
+        self.iter_all = lambda url, params=None: iter(self.get_all(url, params))
+        self.get = lambda url, params=None: {}
+        self.post = lambda *args, **kwargs: {}
+        self.patch = lambda *args, **kwargs: {}
+        self.delete = lambda *args, **kwargs: None
+        # No $batch support: every list falls back to its own delta GET
+        self.batch = lambda sub_requests: {}
 
-@pytest.fixture
-def full_engine(config, temp_db, mock_graph):
-    """Build a full engine stack with mocked Graph client."""
-    todo = TodoService(mock_graph)
-    onenote = OneNoteService(mock_graph)
-    calendar = CalendarService(mock_graph)
-    evaluator = TaskEvaluator(config["rules"])
-    cache = SyncCache(db_path=temp_db)
 
+@pytest.fixture(scope="module")
+def _engine_stack(config, tmp_path_factory):
+    """Build the full engine stack once per module around a stub Graph client."""
+    graph = StubGraph()
+    cache = SyncCache(db_path=str(tmp_path_factory.mktemp("integration") / "sync.db"))
     engine = SyncEngine(
-        todo_service=todo,
-        onenote_service=onenote,
-        calendar_service=calendar,
-        evaluator=evaluator,
+        todo_service=TodoService(graph),
+        onenote_service=OneNoteService(graph),
+        calendar_service=CalendarService(graph),
+        evaluator=TaskEvaluator(config["rules"]),
         cache=cache,
         config=config,
     )
-    yield engine, mock_graph, cache
+    yield engine, graph, cache
     cache.close()
 
 
+@pytest.fixture
+def full_engine(_engine_stack):
+    """Hand each test the shared stack with the Graph stub, caches and tables reset."""
+    engine, graph, cache = _engine_stack
+    graph.reset()
+    engine.todo._lists_by_name = None
+    engine.onenote._server_filter = True
+    engine._notebook_id = None
+    engine._sections_cache.clear()
+    engine._list_ids.clear()
+    engine._reviewed_week = None
+    cache.conn.executescript("""
+        DELETE FROM synced_tasks;
+        DELETE FROM sync_log;
+        DELETE FROM weekly_reviews;
+        DELETE FROM delta_links;
+    """)
+    return _engine_stack
+
+
 class TestIntegration:
     def test_full_sync_cycle(self, full_engine):
         engine, graph, cache = full_engine
 
-        # Mock: notebook lookup
-        graph.get_all.side_effect = self._graph_get_all_handler
+        # Stub: notebook, section and list lookups (get_lists_by_name calls get_all)
+        graph.get_all = self._graph_get_all_handler
+        graph.get = self._graph_get_handler
 
-        # Mock: list lookup - find_list_by_name calls get_all
-        # We need to handle all get_all calls properly
-        graph.get.side_effect = self._graph_get_handler
-
-        # Mock: section creation
-        graph.post.return_value = CREATED_PAGE
+        # Stub: section creation
+        graph.post = lambda *args, **kwargs: CREATED_PAGE
 
         # Initialize engine
         engine._initialize()
@@ -91,18 +127,25 @@ class TestIntegration:
 
         # Override get_all for task fetching
         def get_all_for_tasks(url, params=None):
-            for list_id, tasks in tasks_by_list.items():
-                if list_id in url:
-                    return tasks
+            m = _LIST_TASKS_RX.search(url)
+            if m:
+                return tasks_by_list.get(m.group(1), [])
             return self._graph_get_all_handler(url, params)
 
-        graph.get_all.side_effect = get_all_for_tasks
-        graph.post.return_value = CREATED_PAGE
-        graph.get.side_effect = lambda url, params=None: {
-            "id": "page-123",
-            "links": {"oneNoteWebUrl": {"href": "https://onenote.com/page-123"}},
-        }
-        graph.patch.return_value = {}
+        graph.get_all = get_all_for_tasks
+        def get_for_sync(url, params=None):
+            if url.endswith("/tasks/delta"):
+                list_id = url.split("/")[-3]
+                return {
+                    "value": tasks_by_list[list_id],
+                    "@odata.deltaLink": f"https://graph.microsoft.com/v1.0{url}?$deltatoken=1",
+                }
+            return {
+                "id": "page-123",
+                "links": {"oneNoteWebUrl": {"href": "https://onenote.com/page-123"}},
+            }
+
+        graph.get = get_for_sync
 
         # Run one sync cycle
         engine._sync_cycle()
@@ -118,19 +161,16 @@ class TestIntegration:
         assert complex_task["needs_onenote"] == 1
         assert complex_task["onenote_page_id"] == "page-123"
 
+        # Delta links are stored for the next cycle
+        assert cache.get_delta_link("Hoy").endswith("$deltatoken=1")
+
         # Verify sync log
-        rows = cache.conn.execute("SELECT * FROM sync_log").fetchall()
-        assert len(rows) > 0
+        (logged,) = cache.conn.execute("SELECT COUNT(*) FROM sync_log").fetchone()
+        assert logged > 0
 
     @staticmethod
     def _graph_get_all_handler(url, params=None):
-        if "notebooks" in url:
-            return NOTEBOOKS["value"]
-        if "sections" in url:
-            return SECTIONS["value"]
-        if "todo/lists" in url and "tasks" not in url:
-            return TODO_LISTS["value"]
-        return []
+        return _COLLECTIONS.get(url.rsplit("/", 1)[-1], [])
 
     @staticmethod
     def _graph_get_handler(url, params=None):
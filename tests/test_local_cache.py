@@ -1,14 +1,33 @@
+import sqlite3
+
 import pytest
 
 from src.cache.local_cache import SyncCache
 
 
+class _Rollback(Exception):
+    """Raised at teardown to undo a test's writes."""
+
+
+@pytest.fixture(scope="class")
+def _shared_cache():
+    """One in-memory SyncCache (PRAGMAs, schema) per test class."""
+    cache = SyncCache(db_path=":memory:")
+    yield cache
+    cache.close()
+
+
 class TestSyncCache:
     @pytest.fixture(autouse=True)
-    def setup_cache(self, temp_db):
-        self.cache = SyncCache(db_path=temp_db)
-        yield
-        self.cache.close()
+    def setup_cache(self, _shared_cache):
+        """Run each test inside a transaction that is rolled back afterwards."""
+        self.cache = _shared_cache
+        try:
+            with self.cache.transaction():
+                yield
+                raise _Rollback
+        except _Rollback:
+            pass
 
     def test_upsert_and_get_task(self):
         task_data = {
@@ -41,18 +60,41 @@ class TestSyncCache:
         assert result["status"] == "completed"
         assert result["onenote_page_id"] == "page-1"
 
+    def test_upsert_partial_update_keeps_omitted_columns(self):
+        self.cache.upsert_task({
+            "task_id": "t1", "list_id": "list-1", "list_name": "Hoy",
+            "title": "Test task", "status": "notStarted",
+            "due_date": "2025-01-15T00:00:00", "onenote_link": "https://link",
+        })
+        created_at = self.cache.get_task("t1")["created_at"]
+
+        self.cache.upsert_task({"task_id": "t1", "status": "completed", "due_date": None})
+        result = self.cache.get_task("t1")
+        assert result["status"] == "completed"
+        assert result["title"] == "Test task"
+        assert result["onenote_link"] == "https://link"
+        assert result["due_date"] is None  # explicit None clears the column
+        assert result["created_at"] == created_at
+
+    def test_upsert_new_task_missing_required_columns_fails(self):
+        with pytest.raises(sqlite3.IntegrityError):
+            self.cache.upsert_task({"task_id": "t-new", "title": "No list or status"})
+        assert self.cache.get_task("t-new") is None
+
     def test_get_task_not_found(self):
         assert self.cache.get_task("nonexistent") is None
 
     def test_get_all_tasks(self):
-        for i in range(3):
-            self.cache.upsert_task({
+        self.cache.upsert_tasks_many([
+            {
                 "task_id": f"t{i}",
                 "list_id": "list-1",
                 "list_name": "Hoy",
                 "title": f"Task {i}",
                 "status": "notStarted",
-            })
+            }
+            for i in range(3)
+        ])
         result = self.cache.get_all_tasks()
         assert len(result) == 3
 
@@ -79,13 +121,12 @@ class TestSyncCache:
 
     def test_log_action(self):
         self.cache.log_action("create_page", task_id="t1", details="Test")
-        rows = self.cache.conn.execute("SELECT * FROM sync_log").fetchall()
-        assert len(rows) == 1
-        assert dict(rows[0])["action"] == "create_page"
+        rows = self.cache.conn.execute("SELECT action FROM sync_log").fetchall()
+        assert [r["action"] for r in rows] == ["create_page"]
 
     def test_log_action_failure(self):
         self.cache.log_action("create_page", task_id="t1", success=False)
-        row = dict(self.cache.conn.execute("SELECT * FROM sync_log").fetchone())
+        row = self.cache.conn.execute("SELECT success FROM sync_log LIMIT 1").fetchone()
         assert row["success"] == 0
 
     def test_weekly_review(self):
@@ -96,3 +137,108 @@ class TestSyncCache:
 
     def test_weekly_review_not_found(self):
         assert self.cache.get_weekly_review("2099-01-01") is None
+
+    def test_find_removed_tasks(self):
+        self.cache.upsert_tasks_many([
+            {"task_id": task_id, "list_id": "l", "list_name": list_name,
+             "title": task_id, "status": "notStarted"}
+            for task_id, list_name in (("t1", "Hoy"), ("t2", "Hoy"), ("t3", "Esta semana"))
+        ])
+        removed = self.cache.find_removed_tasks("Hoy", {"t1"})
+        assert [t["task_id"] for t in removed] == ["t2"]
+        assert removed[0]["list_name"] == "Hoy"
+        assert self.cache.find_removed_tasks("Hoy", set()) != []
+
+    def test_get_pending_tasks(self):
+        self.cache.upsert_tasks_many([
+            {"task_id": task_id, "list_id": "l", "list_name": list_name,
+             "title": task_id, "status": status}
+            for task_id, list_name, status in (
+                ("t1", "Hoy", "notStarted"), ("t2", "Esta semana", "inProgress"), ("t3", "Hoy", "completed"),
+            )
+        ])
+        assert self.cache.get_pending_tasks() == [
+            {"list_name": "Esta semana", "title": "t2"},
+            {"list_name": "Hoy", "title": "t1"},
+        ]
+
+    def test_delta_link_roundtrip(self):
+        assert self.cache.get_delta_link("Hoy") is None
+        self.cache.set_delta_link("Hoy", "https://delta/1")
+        self.cache.set_delta_link("Hoy", "https://delta/2")
+        assert self.cache.get_delta_link("Hoy") == "https://delta/2"
+
+    def test_log_actions_many(self):
+        self.cache.log_actions_many([
+            ("new_task_synced", "t1", "A", True),
+            ("create_page", "t1", None, False),
+        ])
+        rows = self.cache.conn.execute("SELECT action, success FROM sync_log ORDER BY id").fetchall()
+        assert [tuple(r) for r in rows] == [("new_task_synced", 1), ("create_page", 0)]
+
+    def test_hot_lookups_use_indexes(self):
+        for sql in (
+            "SELECT * FROM synced_tasks WHERE list_name = 'Hoy'",
+            "SELECT * FROM sync_log WHERE task_id = 't1'",
+            "SELECT * FROM weekly_reviews WHERE week_start = '2025-01-13'",
+        ):
+            plan = " ".join(r[3] for r in self.cache.conn.execute("EXPLAIN QUERY PLAN " + sql))
+            assert "USING INDEX" in plan, sql
+
+
+class TestSyncCacheTransactions:
+    """File-backed behaviour (WAL, commits, rollback) on a fresh database per test."""
+
+    @pytest.fixture(autouse=True)
+    def setup_cache(self, temp_db):
+        self.cache = SyncCache(db_path=temp_db)
+        yield
+        self.cache.close()
+
+    def test_wal_journal_mode(self):
+        mode = self.cache.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        synchronous = self.cache.conn.execute("PRAGMA synchronous").fetchone()[0]
+        assert mode == "wal"
+        assert synchronous == 1  # NORMAL
+
+    def test_transaction_commits_once(self):
+        with self.cache.transaction():
+            self.cache.upsert_task({
+                "task_id": "t1", "list_id": "l1", "list_name": "Hoy",
+                "title": "A", "status": "notStarted",
+            })
+            self.cache.log_action("new_task_synced", task_id="t1")
+            assert self.cache.conn.in_transaction
+
+        assert not self.cache.conn.in_transaction
+        other = SyncCache(db_path=self.cache.db_path)
+        try:
+            assert other.get_task("t1")["title"] == "A"
+        finally:
+            other.close()
+
+    def test_transaction_rolls_back_on_error(self):
+        with pytest.raises(RuntimeError):
+            with self.cache.transaction():
+                self.cache.log_action("new_task_synced", task_id="t1")
+                with self.cache.transaction():
+                    self.cache.save_weekly_review("evt-1", "2025-01-13")
+                raise RuntimeError("boom")
+
+        assert self.cache.conn.execute("SELECT COUNT(*) FROM sync_log").fetchone()[0] == 0
+        assert self.cache.get_weekly_review("2025-01-13") is None
+
+    def test_upsert_tasks_many(self):
+        self.cache.upsert_task({
+            "task_id": "t1", "list_id": "l1", "list_name": "Hoy",
+            "title": "Old", "status": "notStarted", "onenote_link": "https://link",
+        })
+        self.cache.upsert_tasks_many([
+            {"task_id": "t1", "title": "New", "status": "completed"},
+            {"task_id": "t2", "list_id": "l1", "list_name": "Hoy",
+             "title": "Second", "status": "notStarted"},
+        ])
+        assert self.cache.get_task("t1")["title"] == "New"
+        assert self.cache.get_task("t1")["onenote_link"] == "https://link"
+        assert self.cache.get_task("t2")["needs_onenote"] == 0
+        assert not self.cache.conn.in_transaction
@@ -9,46 +9,50 @@ from src.cache.table_cache import TableSyncCache
 class TestMultiAccountParametrization:
     """Tests that verify parametrization for multi-account support."""
 
-    @patch("azure.storage.blob.BlobServiceClient")
-    def test_blob_backend_custom_blob_name(self, mock_blob_cls):
+    @staticmethod
+    def _stub_service(blob_bytes: bytes = b"{}"):
+        """A BlobServiceClient stand-in handed straight to the backend."""
+        service = MagicMock()
+        container = service.get_container_client.return_value
+        container.get_blob_client.return_value.download_blob.return_value.readall.return_value = blob_bytes
+        return service, container
+
+    def test_blob_backend_custom_blob_name(self):
         """BlobTokenCacheBackend with custom blob_name reads/writes the correct blob."""
-        mock_container = MagicMock()
-        mock_blob_client = MagicMock()
-        mock_blob_client.download_blob.return_value.readall.return_value = b'{"token": "x"}'
-        mock_container.get_blob_client.return_value = mock_blob_client
-        mock_blob_cls.from_connection_string.return_value.get_container_client.return_value = mock_container
+        service, mock_container = self._stub_service(b'{"token": "x"}')
 
-        backend = BlobTokenCacheBackend("conn_str", blob_name="token_cache_work.json")
+        backend = BlobTokenCacheBackend(
+            "conn_str", blob_name="token_cache_work.json",
+            blob_service_factory=lambda conn: service,
+        )
         assert backend.blob_name == "token_cache_work.json"
 
         cache = MagicMock()
         backend.load(cache)
         mock_container.get_blob_client.assert_called_with("token_cache_work.json")
 
-    @patch("azure.storage.blob.BlobServiceClient")
-    def test_blob_backend_default_blob_name(self, mock_blob_cls):
+    def test_blob_backend_default_blob_name(self):
         """BlobTokenCacheBackend defaults to token_cache.json."""
-        mock_container = MagicMock()
-        mock_blob_cls.from_connection_string.return_value.get_container_client.return_value = mock_container
+        service, _ = self._stub_service()
 
-        backend = BlobTokenCacheBackend("conn_str")
+        backend = BlobTokenCacheBackend("conn_str", blob_service_factory=lambda conn: service)
         assert backend.blob_name == "token_cache.json"
 
     @patch("msal.PublicClientApplication")
-    @patch("azure.storage.blob.BlobServiceClient")
-    def test_create_auth_azure_custom_authority(self, mock_blob_cls, mock_msal):
+    def test_create_auth_azure_custom_authority(self, mock_msal):
         """create_auth_azure passes custom authority to MSAL app."""
-        mock_container = MagicMock()
-        mock_blob_cls.from_connection_string.return_value.get_container_client.return_value = mock_container
+        service, _ = self._stub_service()
 
         manager = create_auth_azure(
             "client-id", "conn_str",
             authority="https://login.microsoftonline.com/organizations",
             blob_name="token_cache_work.json",
+            blob_service_factory=lambda conn: service,
         )
 
         assert manager.authority == "https://login.microsoftonline.com/organizations"
         assert manager.blob_backend.blob_name == "token_cache_work.json"
+        assert manager.blob_backend.blob_service is service
         mock_msal.assert_called_once_with(
             client_id="client-id",
             authority="https://login.microsoftonline.com/organizations",
@@ -56,13 +60,11 @@ class TestMultiAccountParametrization:
         )
 
     @patch("msal.PublicClientApplication")
-    @patch("azure.storage.blob.BlobServiceClient")
-    def test_create_auth_azure_defaults(self, mock_blob_cls, mock_msal):
+    def test_create_auth_azure_defaults(self, mock_msal):
         """create_auth_azure defaults are backward-compatible (consumers, token_cache.json)."""
-        mock_container = MagicMock()
-        mock_blob_cls.from_connection_string.return_value.get_container_client.return_value = mock_container
+        service, _ = self._stub_service()
 
-        manager = create_auth_azure("client-id", "conn_str")
+        manager = create_auth_azure("client-id", "conn_str", blob_service_factory=lambda conn: service)
 
         assert manager.authority == "https://login.microsoftonline.com/consumers"
         assert manager.blob_backend.blob_name == "token_cache.json"
@@ -108,8 +110,8 @@ class TestLocalMultiAccount:
         assert auth.label == "personal"
 
     @patch("src.auth.msal.PublicClientApplication")
-    def test_work_uses_custom_cache(self, mock_app_cls):
-        custom_path = "/tmp/token_cache_work.json"
+    def test_work_uses_custom_cache(self, mock_app_cls, tmp_path):
+        custom_path = str(tmp_path / "token_cache_work.json")
         auth = create_auth(
             "client-123",
             authority="https://login.microsoftonline.com/organizations",
@@ -1,24 +1,57 @@
 from unittest.mock import MagicMock
 
+import pytest
+import requests
+
 from src.services.onenote_service import OneNoteService
 from tests.mocks.graph_responses import (
     NOTEBOOKS, SECTIONS, CREATED_SECTION, CREATED_PAGE, PAGE_WITH_LINK,
 )
 
 
+@pytest.fixture(scope="class")
+def _onenote_pair():
+    """One mocked Graph client and OneNoteService per test class."""
+    graph = MagicMock()
+    return graph, OneNoteService(graph)
+
+
 class TestOneNoteService:
-    def setup_method(self):
-        self.graph = MagicMock()
-        self.service = OneNoteService(self.graph)
+    @pytest.fixture(autouse=True)
+    def _fresh_graph(self, _onenote_pair):
+        self.graph, self.service = _onenote_pair
+        self.graph.reset_mock(return_value=True, side_effect=True)
+        # A test may have fallen back to client-side filtering
+        self.service._server_filter = True
 
     def test_get_notebook_found(self):
-        self.graph.get_all.return_value = NOTEBOOKS["value"]
+        self.graph.iter_all.return_value = NOTEBOOKS["value"]
         result = self.service.get_notebook("My Notebook")
         assert result is not None
         assert result["id"] == "nb-123"
+        self.graph.iter_all.assert_called_once_with(
+            "/me/onenote/notebooks",
+            params={"$filter": "displayName eq 'My Notebook'", "$select": "id,displayName"},
+        )
+
+    def test_get_notebook_escapes_quotes(self):
+        self.graph.iter_all.return_value = []
+        self.service.get_notebook("Kevin's Notebook")
+        params = self.graph.iter_all.call_args[1]["params"]
+        assert params["$filter"] == "displayName eq 'Kevin''s Notebook'"
+
+    def test_get_notebook_falls_back_when_filter_rejected(self):
+        bad_request = requests.HTTPError(response=MagicMock(status_code=400))
+        self.graph.iter_all.side_effect = [bad_request, NOTEBOOKS["value"], NOTEBOOKS["value"]]
+
+        assert self.service.get_notebook("My Notebook")["id"] == "nb-123"
+        assert self.service.get_notebook("My Notebook")["id"] == "nb-123"
+        # After the 400, later lookups go straight to the unfiltered listing
+        assert self.graph.iter_all.call_count == 3
+        self.graph.iter_all.assert_called_with("/me/onenote/notebooks")
 
     def test_get_notebook_not_found(self):
-        self.graph.get_all.return_value = []
+        self.graph.iter_all.return_value = []
         result = self.service.get_notebook("Missing")
         assert result is None
 
@@ -28,13 +61,13 @@ class TestOneNoteService:
         assert len(sections) == 2
 
     def test_ensure_section_existing(self):
-        self.graph.get_all.return_value = SECTIONS["value"]
+        self.graph.iter_all.side_effect = lambda url, params=None: iter(SECTIONS["value"])
         section = self.service.ensure_section("nb-123", "Hoy")
         assert section["id"] == "sec-hoy"
         self.graph.post.assert_not_called()
 
     def test_ensure_section_creates_new(self):
-        self.graph.get_all.return_value = SECTIONS["value"]
+        self.graph.iter_all.side_effect = lambda url, params=None: iter(SECTIONS["value"])
         self.graph.post.return_value = CREATED_SECTION
         section = self.service.ensure_section("nb-123", "En espera")
         assert section["id"] == "sec-espera-new"
@@ -52,6 +85,17 @@ class TestOneNoteService:
         call_args = self.graph.post.call_args
         assert "application/xhtml+xml" in str(call_args)
 
+    def test_create_page_escapes_html(self):
+        self.graph.post.return_value = CREATED_PAGE
+        self.service.create_page(
+            section_id="sec-hoy",
+            title="Q&A <draft>",
+            list_name="Hoy",
+        )
+        body = self.graph.post.call_args[1]["data"].decode("utf-8")
+        assert "<title>Q&amp;A &lt;draft&gt;</title>" in body
+        assert "<draft>" not in body
+
     def test_get_page_link(self):
         self.graph.get.return_value = PAGE_WITH_LINK
         link = self.service.get_page_link("page-123")
@@ -1,10 +1,16 @@
-from unittest.mock import MagicMock, patch
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from unittest.mock import Mock, patch
 
 import pytest
 
 from src.cache.local_cache import SyncCache
 from src.rules.evaluator import TaskEvaluator
+from src.services.calendar_service import CalendarService
+from src.services.onenote_service import OneNoteService
 from src.services.sync_engine import SyncEngine
+from src.services.todo_service import TodoService
 from tests.mocks.graph_responses import (
     NOTEBOOKS, SECTIONS, CREATED_SECTION, CREATED_PAGE, PAGE_WITH_LINK,
     TODO_LISTS, TASKS_HOY, TASKS_SEMANA, TASKS_ESPERA, CREATED_EVENT,
@@ -13,19 +19,15 @@ from tests.mocks.graph_responses import (
 
 @pytest.fixture
 def mock_services():
-    todo = MagicMock()
-    onenote = MagicMock()
-    calendar = MagicMock()
+    # Plain Mocks specced to the real services: no magic-method setup, and typos fail
+    todo = Mock(spec=TodoService)
+    onenote = Mock(spec=OneNoteService)
+    calendar = Mock(spec=CalendarService)
     return todo, onenote, calendar
 
 
-@pytest.fixture
-def engine(config, temp_db, mock_services):
-    todo, onenote, calendar = mock_services
-    evaluator = TaskEvaluator(config["rules"])
-    cache = SyncCache(db_path=temp_db)
-
-    # Setup mock responses for initialization
+def _stub_initialization(todo, onenote):
+    """Setup mock responses for initialization."""
     onenote.get_notebook.return_value = NOTEBOOKS["value"][0]
     onenote.ensure_section.side_effect = lambda nb_id, name: (
         next(
@@ -33,9 +35,42 @@ def engine(config, temp_db, mock_services):
             CREATED_SECTION,
         )
     )
-    todo.find_list_by_name.side_effect = lambda name: next(
-        (l for l in TODO_LISTS["value"] if l["displayName"] == name), None
+    todo.get_lists_by_name.return_value = {l["displayName"]: l for l in TODO_LISTS["value"]}
+
+
+@pytest.fixture(scope="module")
+def _memory_cache():
+    """One in-memory SyncCache per module; tests start from empty tables."""
+    cache = SyncCache(db_path=":memory:")
+    yield cache
+    cache.close()
+
+
+@pytest.fixture(scope="module")
+def evaluator(config):
+    """Rules evaluator built once per module; it holds no per-test state."""
+    return TaskEvaluator(config["rules"])
+
+
+@pytest.fixture
+def engine(config, _memory_cache, mock_services, evaluator):
+    todo, onenote, calendar = mock_services
+    cache = _memory_cache
+    cache.conn.executescript("""
+        DELETE FROM synced_tasks;
+        DELETE FROM sync_log;
+        DELETE FROM weekly_reviews;
+        DELETE FROM delta_links;
+    """)
+
+    _stub_initialization(todo, onenote)
+    # Serve full snapshots from get_tasks so tests only stub one method
+    todo.get_tasks_delta.side_effect = lambda list_id, delta_link=None: (
+        todo.get_tasks(list_id), None, True
     )
+    todo.get_deltas_for_lists.side_effect = lambda delta_links: {
+        list_id: todo.get_tasks_delta(list_id, link) for list_id, link in delta_links.items()
+    }
 
     eng = SyncEngine(
         todo_service=todo,
@@ -43,10 +78,29 @@ def engine(config, temp_db, mock_services):
         calendar_service=calendar,
         evaluator=evaluator,
         cache=cache,
-        config=config,
+        # Most tests return the same task for every list; sync lists in order
+        config={**config, "sync_workers": 1},
     )
-    yield eng
-    cache.close()
+    return eng
+
+
+@pytest.fixture(scope="module")
+def _initialized_state(config, evaluator):
+    """Notebook, list and section ids discovered by one _initialize() per module."""
+    todo, onenote = Mock(spec=TodoService), Mock(spec=OneNoteService)
+    _stub_initialization(todo, onenote)
+    eng = SyncEngine(todo, onenote, Mock(spec=CalendarService), evaluator, Mock(), config)
+    eng._initialize()
+    return eng._notebook_id, eng._list_ids, eng._sections_cache
+
+
+@pytest.fixture
+def initialized(engine, _initialized_state):
+    """Apply the post-_initialize() state to the engine fixture without rediscovery."""
+    notebook_id, list_ids, sections_cache = _initialized_state
+    engine._notebook_id = notebook_id
+    engine._list_ids = dict(list_ids)
+    engine._sections_cache = dict(sections_cache)
 
 
 class TestSyncEngine:
@@ -57,72 +111,60 @@ class TestSyncEngine:
         assert len(engine._list_ids) == 3
         assert "Hoy" in engine._sections_cache
 
+    def test_initialize_refetches_recreated_list(self, engine, mock_services):
+        todo, _, _ = mock_services
+        engine._initialize()
+        lists = {l["displayName"]: l for l in TODO_LISTS["value"]}
+        todo.get_lists_by_name.return_value = {
+            **lists, "Hoy": {"id": "list-hoy-2", "displayName": "Hoy"},
+        }
+
+        engine._initialize()
+
+        assert engine._list_ids["Hoy"] == "list-hoy-2"
+        todo.get_lists_by_name.assert_called_with(refresh=True)
+
     def test_initialize_notebook_not_found(self, engine, mock_services):
         _, onenote, _ = mock_services
         onenote.get_notebook.return_value = None
         with pytest.raises(RuntimeError, match="not found"):
             engine._initialize()
 
-    def test_sync_cycle_new_simple_task(self, engine, mock_services):
+    @pytest.mark.usefixtures("initialized")
+    @pytest.mark.parametrize("task_idx, expect_page, expect_event", [
+        pytest.param(0, False, False, id="simple"),         # "Pagar luz"
+        pytest.param(1, True, True, id="complex"),          # "Investigar opciones...", has a due date
+        pytest.param(2, True, False, id="force-onenote"),   # "#onenote Revisar notas"
+    ])
+    def test_sync_cycle_new_task(self, engine, mock_services, task_idx, expect_page, expect_event):
         todo, onenote, calendar = mock_services
-        engine._initialize()
 
-        # Return only the simple task
-        simple_task = TASKS_HOY["value"][0]  # "Pagar luz"
-        todo.get_tasks.return_value = [simple_task]
-
-        engine._sync_cycle()
-
-        # Simple task should NOT create a OneNote page
-        onenote.create_page.assert_not_called()
-        cached = engine.cache.get_task("task-simple-1")
-        assert cached is not None
-        assert cached["needs_onenote"] == 0
-
-    def test_sync_cycle_new_complex_task(self, engine, mock_services):
-        todo, onenote, calendar = mock_services
-        engine._initialize()
-
-        # Return only the complex task
-        complex_task = TASKS_HOY["value"][1]  # "Investigar opciones..."
-        todo.get_tasks.return_value = [complex_task]
+        task = TASKS_HOY["value"][task_idx]
+        todo.get_tasks.return_value = [task]
         onenote.create_page.return_value = CREATED_PAGE
         onenote.get_page_link.return_value = "https://onenote.com/page-123"
         calendar.create_event.return_value = CREATED_EVENT
 
         engine._sync_cycle()
 
-        # Complex task should create OneNote page
-        onenote.create_page.assert_called_once()
-        # Task has due date, should create calendar event
-        calendar.create_event.assert_called_once()
-        # Should update task body with OneNote link
-        todo.update_task_body.assert_called_once()
-
-        cached = engine.cache.get_task("task-complex-1")
-        assert cached["needs_onenote"] == 1
-        assert cached["onenote_page_id"] == "page-123"
-        assert cached["calendar_event_id"] == "event-123"
-
-    def test_sync_cycle_force_onenote_task(self, engine, mock_services):
-        todo, onenote, calendar = mock_services
-        engine._initialize()
-
-        force_task = TASKS_HOY["value"][2]  # "#onenote Revisar notas"
-        todo.get_tasks.return_value = [force_task]
-        onenote.create_page.return_value = CREATED_PAGE
-        onenote.get_page_link.return_value = "https://onenote.com/page-123"
-
-        engine._sync_cycle()
-
-        onenote.create_page.assert_called_once()
-
+        assert onenote.create_page.call_count == int(expect_page)
+        assert calendar.create_event.call_count == int(expect_event)
+        cached = engine.cache.get_task(task["id"])
+        assert cached["needs_onenote"] == int(expect_page)
+        assert cached["calendar_event_id"] == ("event-123" if expect_event else None)
+        if expect_page:
+            # The task body gets the link from the create response, no extra lookup
+            todo.update_task_body.assert_called_once()
+            onenote.get_page_link.assert_not_called()
+            assert onenote.create_page.call_args[1]["objective"] == task["body"]["content"]
+            assert cached["onenote_page_id"] == "page-123"
+
+    @pytest.mark.usefixtures("initialized")
     def test_sync_cycle_task_completed(self, engine, mock_services):
         todo, onenote, calendar = mock_services
-        engine._initialize()
 
         # First cycle: create task
-        task = TASKS_HOY["value"][1].copy()
+        task = TASKS_HOY["value"][1]
         todo.get_tasks.return_value = [task]
         onenote.create_page.return_value = CREATED_PAGE
         onenote.get_page_link.return_value = "https://onenote.com/page-123"
@@ -130,9 +172,9 @@ class TestSyncEngine:
         engine._sync_cycle()
 
         # Second cycle: task is completed
-        task["status"] = "completed"
-        task["lastModifiedDateTime"] = "2025-01-16T10:00:00Z"
-        todo.get_tasks.return_value = [task]
+        todo.get_tasks.return_value = [
+            {**task, "status": "completed", "lastModifiedDateTime": "2025-01-16T10:00:00Z"},
+        ]
         engine._sync_cycle()
 
         # Should update calendar event with [Completada] prefix
@@ -140,14 +182,12 @@ class TestSyncEngine:
         call_args = calendar.update_event.call_args
         assert "[Completada]" in call_args[0][1]["subject"]
 
+    @pytest.mark.usefixtures("initialized")
     def test_sync_cycle_task_removed(self, engine, mock_services):
         todo, onenote, calendar = mock_services
-        engine._initialize()
 
         # First cycle: add a simple task
-        task = TASKS_HOY["value"][0].copy()
-        task["id"] = "task-will-be-removed"
-        todo.get_tasks.return_value = [task]
+        todo.get_tasks.return_value = [{**TASKS_HOY["value"][0], "id": "task-will-be-removed"}]
         engine._sync_cycle()
 
         assert engine.cache.get_task("task-will-be-removed") is not None
@@ -158,12 +198,11 @@ class TestSyncEngine:
 
         assert engine.cache.get_task("task-will-be-removed") is None
 
+    @pytest.mark.usefixtures("initialized")
     def test_sync_cycle_no_changes(self, engine, mock_services):
         todo, onenote, calendar = mock_services
-        engine._initialize()
 
-        task = TASKS_HOY["value"][0].copy()
-        todo.get_tasks.return_value = [task]
+        todo.get_tasks.return_value = [TASKS_HOY["value"][0]]
 
         # First cycle
         engine._sync_cycle()
@@ -177,6 +216,27 @@ class TestSyncEngine:
         engine._running = True
         engine._handle_signal(15, None)
         assert engine._running is False
+        assert engine._stop.is_set()
+
+    def test_run_backs_off_after_failures(self, engine):
+        waits = []
+        cycles = iter([RuntimeError("boom"), RuntimeError("boom"), None])
+
+        def cycle():
+            outcome = next(cycles)
+            if outcome is not None:
+                raise outcome
+            engine._handle_signal(15, None)
+
+        with patch.object(engine, "_initialize"), \
+                patch.object(engine, "_sync_cycle", side_effect=cycle), \
+                patch.object(engine._stop, "wait", side_effect=waits.append), \
+                patch("src.services.sync_engine.signal.signal"), \
+                patch("src.services.sync_engine.time.monotonic", return_value=0.0):
+            engine.run()
+
+        # Deadlines advance 2x then 4x the interval from a clock that stays at 0
+        assert waits == [engine.interval * 2, engine.interval * 6, engine.interval * 7]
 
     def test_extract_due_date(self):
         task = {"dueDateTime": {"dateTime": "2025-01-20T00:00:00.0000000", "timeZone": "UTC"}}
@@ -185,3 +245,126 @@ class TestSyncEngine:
     def test_extract_due_date_none(self):
         assert SyncEngine._extract_due_date({"dueDateTime": None}) is None
         assert SyncEngine._extract_due_date({}) is None
+
+    @pytest.mark.usefixtures("initialized")
+    def test_sync_cycle_falls_back_when_batch_fails(self, engine, mock_services):
+        todo, onenote, calendar = mock_services
+        todo.get_deltas_for_lists.side_effect = RuntimeError("batch down")
+        todo.get_tasks.return_value = [TASKS_HOY["value"][0]]
+
+        engine._sync_cycle()
+
+        assert todo.get_tasks.call_count == 3
+        assert engine.cache.get_task("task-simple-1") is not None
+
+    @pytest.mark.usefixtures("initialized")
+    def test_sync_cycle_syncs_lists_in_parallel(self, engine, mock_services):
+        todo, onenote, calendar = mock_services
+        engine.sync_workers = 3
+        tasks_by_list = {
+            "list-hoy": TASKS_HOY["value"],
+            "list-semana": TASKS_SEMANA["value"],
+            "list-espera": TASKS_ESPERA["value"],
+        }
+        todo.get_tasks.side_effect = lambda list_id: tasks_by_list[list_id]
+        onenote.create_page.return_value = CREATED_PAGE
+        onenote.get_page_link.return_value = "https://onenote.com/page-123"
+        calendar.create_event.return_value = CREATED_EVENT
+
+        with patch("src.services.sync_engine.ThreadPoolExecutor", wraps=ThreadPoolExecutor) as pool:
+            engine._sync_cycle()
+
+        pool.assert_called_once_with(max_workers=3)
+        expected = sum(len(tasks) for tasks in tasks_by_list.values())
+        assert len(engine.cache.get_all_tasks()) == expected
+
+    @pytest.mark.usefixtures("initialized")
+    def test_sync_cycle_applies_delta_changes(self, engine, mock_services):
+        todo, onenote, calendar = mock_services
+        todo.get_tasks.return_value = [TASKS_HOY["value"][0]]
+        engine._sync_cycle()
+        assert engine.cache.get_task("task-simple-1") is not None
+
+        link = "https://graph.microsoft.com/v1.0/me/todo/lists/list-hoy/tasks/delta?$deltatoken=a"
+        engine.cache.set_delta_link("Hoy", link)
+        todo.get_tasks_delta.side_effect = lambda list_id, delta_link=None: (
+            ([{"id": "task-simple-1", "@removed": {"reason": "deleted"}}], link, False)
+            if delta_link else ([], None, False)
+        )
+
+        engine._sync_cycle()
+
+        # Only the reported removal is applied; no full-list diff
+        assert engine.cache.get_task("task-simple-1") is None
+        assert engine.cache.get_delta_link("Hoy") == link
+
+    @pytest.mark.parametrize("native_iso", [
+        pytest.param(True, marks=pytest.mark.skipif(
+            sys.version_info < (3, 11), reason="fromisoformat needs 3.11 for 7-digit fractions",
+        )),
+        False,
+    ])
+    def test_sync_calendar_event_truncates_fraction(self, engine, mock_services, native_iso):
+        _, _, calendar = mock_services
+        calendar.create_event.return_value = CREATED_EVENT
+        task = {"id": "t1", "title": "Due"}
+
+        with patch("src.services.sync_engine._NATIVE_ISO", native_iso):
+            engine._sync_calendar_event(
+                task, {"list_name": "Hoy", "due_date": "2025-01-20T00:00:00.1234567Z"},
+            )
+
+        start = calendar.create_event.call_args[1]["start"]
+        assert start == datetime(2025, 1, 20, 9, 0, 0, 123456, tzinfo=timezone.utc)
+
+    def test_weekly_review_lookup_skipped_once_known(self, engine, mock_services):
+        _, _, calendar = mock_services
+        calendar.create_weekly_review.return_value = {"id": "review-1"}
+
+        with patch.object(engine.cache, "get_weekly_review", wraps=engine.cache.get_weekly_review) as lookup:
+            engine._check_weekly_review()
+            engine._check_weekly_review()
+
+        calendar.create_weekly_review.assert_called_once()
+        lookup.assert_called_once()
+
+    @pytest.mark.usefixtures("initialized")
+    def test_failed_link_patch_is_logged_after_cycle(self, engine, mock_services):
+        todo, onenote, calendar = mock_services
+        todo.get_tasks.return_value = [TASKS_HOY["value"][1]]
+        onenote.create_page.return_value = CREATED_PAGE
+        onenote.get_page_link.return_value = "https://onenote.com/page-123"
+        calendar.create_event.return_value = CREATED_EVENT
+        todo.update_task_body.side_effect = RuntimeError("PATCH failed")
+
+        engine._sync_cycle()
+
+        assert engine._pending_io == []
+        assert engine.cache.get_task("task-complex-1")["onenote_page_id"] == "page-123"
+        failed = engine.cache.conn.execute(
+            "SELECT COUNT(*) FROM sync_log WHERE action = 'update_task_body' AND success = 0"
+        ).fetchone()[0]
+        assert failed == 1
+
+    def test_malformed_weekly_review_time_fails_at_startup(self, config):
+        config = {**config, "weekly_review": {"enabled": True, "time": "6pm"}}
+        with pytest.raises(ValueError, match="HH:MM"):
+            SyncEngine(Mock(), Mock(), Mock(), Mock(), Mock(), config)
+
+    def test_weekly_review_time_with_seconds_is_accepted(self, config):
+        config = {**config, "weekly_review": {"enabled": True, "time": "18:30:00"}}
+        engine = SyncEngine(Mock(), Mock(), Mock(), Mock(), Mock(), config)
+        assert engine._review_time == (18, 30)
+
+    @pytest.mark.usefixtures("initialized")
+    def test_page_link_fetched_when_missing_from_create_response(self, engine, mock_services):
+        todo, onenote, calendar = mock_services
+        todo.get_tasks.return_value = [TASKS_HOY["value"][1]]
+        onenote.create_page.return_value = {"id": "page-123"}
+        onenote.get_page_link.return_value = "https://onenote.com/page-123"
+        calendar.create_event.return_value = CREATED_EVENT
+
+        engine._sync_cycle()
+
+        onenote.get_page_link.assert_called_once_with("page-123")
+        assert engine.cache.get_task("task-complex-1")["onenote_link"] == "https://onenote.com/page-123"
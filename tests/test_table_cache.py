@@ -1,63 +1,124 @@
 from __future__ import annotations
 
+import re
+import uuid
+from types import MappingProxyType
 from unittest.mock import MagicMock, patch
 
 import pytest
+from azure.core.exceptions import ResourceExistsError, ServiceRequestError
 
 from src.cache.table_cache import TableSyncCache, _TASK_FIELD_MAP
 
+# Simple OData filter for tests: "<Field> eq 'value'" or "<Field> ne 'value'"
+_FILTER_RX = re.compile(r"^\s*(\w+)\s+(eq|ne)\s+'([^']*)'\s*$")
+
 
 class FakeTableClient:
-    """In-memory fake that mimics azure.data.tables.TableClient."""
+    """In-memory fake that mimics azure.data.tables.TableClient.
+
+    Reads hand out read-only views of the stored entities rather than copies;
+    the cache only projects them into new dicts, and a stray write raises.
+    """
 
     def __init__(self):
         # keyed by (PartitionKey, RowKey)
         self._entities: dict[tuple[str, str], dict] = {}
+        # Secondary indexes sharing the same entity dicts: PK -> RK -> entity, RK -> PK -> entity
+        self._by_pk: dict[str, dict[str, dict]] = {}
+        self._by_rk: dict[str, dict[str, dict]] = {}
+        # Queries that fell through to a full scan instead of a key index
+        self.scan_count = 0
+
+    def clear(self):
+        """Drop all entities and counters, as if the table were freshly created."""
+        self._entities.clear()
+        self._by_pk.clear()
+        self._by_rk.clear()
+        self.scan_count = 0
+        self.__dict__.pop("transactions", None)
+
+    def _store(self, entity: dict):
+        pk, rk = entity["PartitionKey"], entity["RowKey"]
+        self._entities[(pk, rk)] = entity
+        self._by_pk.setdefault(pk, {})[rk] = entity
+        self._by_rk.setdefault(rk, {})[pk] = entity
 
     def upsert_entity(self, entity: dict):
-        key = (entity["PartitionKey"], entity["RowKey"])
-        self._entities[key] = dict(entity)
+        self._store(dict(entity))
 
     def get_entity(self, partition_key: str, row_key: str) -> dict:
         key = (partition_key, row_key)
         if key not in self._entities:
             from azure.core.exceptions import ResourceNotFoundError
             raise ResourceNotFoundError("Not found")
-        return dict(self._entities[key])
+        return MappingProxyType(self._entities[key])
 
-    def delete_entity(self, partition_key: str, row_key: str):
-        key = (partition_key, row_key)
-        self._entities.pop(key, None)
+    def update_entity(self, entity: dict, mode=None):
+        from azure.data.tables import UpdateMode
 
-    def query_entities(self, query_filter: str) -> list[dict]:
-        results = []
-        for entity in self._entities.values():
-            if self._matches(entity, query_filter):
-                results.append(dict(entity))
-        return results
+        key = (entity["PartitionKey"], entity["RowKey"])
+        if key not in self._entities:
+            from azure.core.exceptions import ResourceNotFoundError
+            raise ResourceNotFoundError("Not found")
+        if mode == UpdateMode.MERGE:
+            self._entities[key].update(entity)
+        else:
+            self._store(dict(entity))
 
-    def list_entities(self) -> list[dict]:
-        return [dict(e) for e in self._entities.values()]
+    def delete_entity(self, partition_key: str, row_key: str):
+        if self._entities.pop((partition_key, row_key), None) is not None:
+            self._by_pk[partition_key].pop(row_key, None)
+            self._by_rk[row_key].pop(partition_key, None)
+
+    def query_entities(self, query_filter: str, select=None) -> list[dict]:
+        parsed = self._parse_filter(query_filter)
+        if parsed is None:
+            return []
+        field, op, value = parsed
+        index = {"PartitionKey": self._by_pk, "RowKey": self._by_rk}.get(field)
+        if op == "eq" and index is not None:
+            candidates = index.get(value, {}).values()
+        else:
+            self.scan_count += 1
+            candidates = (
+                e for e in self._entities.values() if (e.get(field) == value) == (op == "eq")
+            )
+        if select:
+            return [{k: e[k] for k in select if k in e} for e in candidates]
+        return [MappingProxyType(e) for e in candidates]
+
+    def list_entities(self, **kwargs) -> list[dict]:
+        return [MappingProxyType(e) for e in self._entities.values()]
+
+    def submit_transaction(self, operations: list[tuple]):
+        partitions = {entity["PartitionKey"] for _, entity in operations}
+        rows = {(entity["PartitionKey"], entity["RowKey"]) for _, entity in operations}
+        assert len(operations) <= 100, "batch exceeds 100 operations"
+        assert len(partitions) == 1, "batch spans several partitions"
+        assert len(rows) == len(operations), "batch touches a row twice"
+        self.transactions = getattr(self, "transactions", 0) + 1
+        for op, entity in operations:
+            assert op == "upsert"
+            self.upsert_entity(entity)
 
     @staticmethod
-    def _matches(entity: dict, query_filter: str) -> bool:
-        # Simple OData filter parser for tests
-        # Handles: "RowKey eq 'value'" and "PartitionKey eq 'value'"
-        parts = query_filter.split(" eq ")
-        if len(parts) != 2:
-            return False
-        field = parts[0].strip()
-        value = parts[1].strip().strip("'")
-        return entity.get(field) == value
+    def _parse_filter(query_filter: str) -> tuple[str, str, str] | None:
+        m = _FILTER_RX.match(query_filter)
+        return m.groups() if m else None
 
 
 class FakeTableServiceClient:
     """Fake TableServiceClient that returns FakeTableClient instances."""
 
+    url = "https://fake.table.core.windows.net"
+
     def __init__(self):
         self._tables: dict[str, FakeTableClient] = {}
+        self.create_calls = 0
 
     def create_table(self, name: str):
+        self.create_calls += 1
         if name not in self._tables:
             self._tables[name] = FakeTableClient()
 
@@ -67,9 +128,9 @@ class FakeTableServiceClient:
         return self._tables[name]
 
 
-@pytest.fixture
-def table_cache():
-    """Create a TableSyncCache backed by in-memory fakes."""
+@pytest.fixture(scope="module")
+def _shared_table_cache():
+    """Create one TableSyncCache backed by in-memory fakes per module."""
     fake_service = FakeTableServiceClient()
     with patch.object(
         TableSyncCache, "__init__", lambda self, conn, table_prefix="": None
@@ -81,14 +142,56 @@ def table_cache():
     cache.TASKS_TABLE = "SyncedTasks"
     cache.LOG_TABLE = "SyncLog"
     cache.REVIEWS_TABLE = "WeeklyReviews"
+    cache.DELTA_TABLE = "DeltaLinks"
     cache._ensure_tables()
     cache.tasks_client = fake_service.get_table_client(cache.TASKS_TABLE)
     cache.log_client = fake_service.get_table_client(cache.LOG_TABLE)
     cache.reviews_client = fake_service.get_table_client(cache.REVIEWS_TABLE)
+    cache.delta_client = fake_service.get_table_client(cache.DELTA_TABLE)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def fake_table_cache(_shared_table_cache):
+    """The shared cache with every fake table emptied."""
+    for client in _shared_table_cache.service._tables.values():
+        client.clear()
+    _shared_table_cache._pending_logs = None
+    return _shared_table_cache
+
+
+@pytest.fixture(scope="module")
+def _azurite_table_cache(azurite_connection_string):
+    """One TableSyncCache on Azurite per module, in its own prefixed tables."""
+    cache = TableSyncCache(azurite_connection_string, table_prefix=f"T{uuid.uuid4().hex[:12]}")
     yield cache
+    for name in (cache.TASKS_TABLE, cache.LOG_TABLE, cache.REVIEWS_TABLE, cache.DELTA_TABLE):
+        cache.service.delete_table(name)
     cache.close()
 
 
+@pytest.fixture
+def azurite_table_cache(_azurite_table_cache):
+    """The Azurite-backed cache with every table emptied."""
+    cache = _azurite_table_cache
+    for client in (cache.tasks_client, cache.log_client, cache.reviews_client, cache.delta_client):
+        for e in client.list_entities(select=["PartitionKey", "RowKey"]):
+            client.delete_entity(partition_key=e["PartitionKey"], row_key=e["RowKey"])
+    cache._pending_logs = None
+    return cache
+
+
+@pytest.fixture(params=["fake", pytest.param("azurite", marks=pytest.mark.integration)])
+def table_cache(request):
+    """An emptied cache on the in-memory fake or, with -m integration, on Azurite."""
+    return request.getfixturevalue(f"{request.param}_table_cache")
+
+
+# For tests that inspect FakeTableClient counters or internals
+_fake_only = pytest.mark.parametrize("table_cache", ["fake"], indirect=True)
+
+
 class TestTableSyncCache:
     def test_upsert_and_get_task(self, table_cache):
         task_data = {
@@ -124,18 +227,23 @@ class TestTableSyncCache:
     def test_get_task_not_found(self, table_cache):
         assert table_cache.get_task("nonexistent") is None
 
+    @_fake_only
     def test_get_all_tasks(self, table_cache):
-        for i in range(3):
-            table_cache.upsert_task({
+        table_cache.upsert_tasks_many([
+            {
                 "task_id": f"t{i}",
                 "list_id": "list-1",
                 "list_name": "Hoy",
                 "title": f"Task {i}",
                 "status": "notStarted",
-            })
+            }
+            for i in range(3)
+        ])
         result = table_cache.get_all_tasks()
         assert len(result) == 3
+        assert table_cache.tasks_client.transactions == 1
 
+    @_fake_only
     def test_get_tasks_by_list(self, table_cache):
         table_cache.upsert_task({
             "task_id": "t1", "list_id": "l1", "list_name": "Hoy",
@@ -148,6 +256,8 @@ class TestTableSyncCache:
         result = table_cache.get_tasks_by_list("Hoy")
         assert len(result) == 1
         assert result[0]["task_id"] == "t1"
+        # Served by a PartitionKey lookup, not a table scan
+        assert table_cache.tasks_client.scan_count == 0
 
     def test_delete_task(self, table_cache):
         table_cache.upsert_task({
@@ -163,12 +273,133 @@ class TestTableSyncCache:
         assert len(entities) == 1
         assert entities[0]["Action"] == "create_page"
 
+    def test_log_row_keys_unique_within_second(self, table_cache):
+        with patch("src.cache.table_cache.utc_timestamp", return_value=(1700000000, "ts")):
+            for _ in range(50):
+                table_cache.log_action("task_updated")
+        keys = [e["RowKey"] for e in table_cache.log_client.list_entities()]
+        assert len(set(keys)) == 50
+        assert keys == sorted(keys)
+
     def test_log_action_failure(self, table_cache):
         table_cache.log_action("create_page", task_id="t1", success=False)
         entities = list(table_cache.log_client.list_entities())
         assert len(entities) == 1
         assert entities[0]["Success"] is False
 
+    @_fake_only
+    def test_upsert_tasks_many_batches_per_partition(self, table_cache):
+        table_cache.upsert_task({
+            "task_id": "t0", "list_id": "l1", "list_name": "Hoy",
+            "title": "Old", "status": "notStarted", "onenote_link": "https://link",
+        })
+        tasks = [
+            {"task_id": f"t{i}", "list_id": "l1", "list_name": "Hoy",
+             "title": f"Task {i}", "status": "notStarted"}
+            for i in range(150)
+        ]
+        tasks.append({"task_id": "w1", "list_id": "l2", "list_name": "Trabajo",
+                      "title": "Work", "status": "notStarted"})
+        table_cache.upsert_tasks_many(tasks)
+
+        assert len(table_cache.get_all_tasks()) == 151
+        assert table_cache.tasks_client.transactions == 3
+        merged = table_cache.get_task("t0")
+        assert merged["title"] == "Task 0"
+        assert merged["onenote_link"] == "https://link"
+
+    @_fake_only
+    def test_log_actions_many(self, table_cache):
+        table_cache.log_actions_many(
+            [("task_updated", f"t{i}", "Title", True) for i in range(120)]
+        )
+        entities = table_cache.log_client.list_entities()
+        assert len(entities) == 120
+        assert table_cache.log_client.transactions == 2
+
+    @_fake_only
+    def test_get_task_stops_at_first_match(self, table_cache):
+        def pages():
+            yield {"PartitionKey": "Hoy", "RowKey": "t1", "Title": "A"}
+            raise AssertionError("second page should not be fetched")
+
+        with patch.object(table_cache.tasks_client, "query_entities", return_value=pages()):
+            assert table_cache.get_task("t1")["title"] == "A"
+
+    @pytest.mark.parametrize("existing", [True, False], ids=["merge", "insert"])
+    def test_blind_upsert_ignores_unmapped_keys(self, table_cache, existing):
+        if existing:
+            table_cache.upsert_task({"task_id": "t1", "list_id": "l1", "list_name": "L",
+                                     "title": "a", "status": "notStarted"}, prior={})
+        table_cache.upsert_task({"task_id": "t1", "list_name": "L", "title": "b", "extra": 1})
+        result = table_cache.get_task("t1")
+        assert result["title"] == "b"
+        assert "extra" not in result
+        assert result["status"] == ("notStarted" if existing else None)
+
+    def test_blind_upsert_without_list_name(self, table_cache):
+        table_cache.upsert_task({"task_id": "t1", "title": "No list", "extra": 1})
+        result = table_cache.get_task("t1")
+        assert result["title"] == "No list"
+        assert result["list_name"] is None
+
+    def test_new_task_written_without_merge_attempt(self, table_cache):
+        task = {"task_id": "t1", "list_id": "l1", "list_name": "Hoy",
+                "title": "A", "status": "notStarted"}
+        with patch.object(table_cache.tasks_client, "update_entity") as mock_merge:
+            table_cache.upsert_task(task, prior={})
+            mock_merge.assert_not_called()
+        assert table_cache.get_task("t1")["created_at"] is not None
+
+    @_fake_only
+    def test_writes_skip_rowkey_scan(self, table_cache):
+        task = {"task_id": "t1", "list_id": "l1", "list_name": "Hoy",
+                "title": "A", "status": "notStarted", "onenote_link": "https://link"}
+        table_cache.upsert_task(dict(task))
+        prior = table_cache.get_task("t1")
+
+        with patch.object(table_cache.tasks_client, "query_entities") as mock_query:
+            table_cache.upsert_task({"task_id": "t1", "list_name": "Hoy", "status": "completed",
+                                     "onenote_link": None})
+            merged = dict(table_cache.tasks_client._entities[("Hoy", "t1")])
+            table_cache.upsert_task({"task_id": "t1", "list_name": "Hoy", "title": "B"}, prior=prior)
+            table_cache.delete_task("t1", list_name="Hoy")
+            mock_query.assert_not_called()
+
+        assert merged["Status"] == "completed"
+        assert merged["OnenoteLink"] == "https://link"
+        assert table_cache.get_task("t1") is None
+
+    @_fake_only
+    def test_transaction_buffers_log_writes(self, table_cache):
+        with table_cache.transaction():
+            for i in range(3):
+                table_cache.log_action("task_updated", task_id=f"t{i}")
+            with table_cache.transaction():
+                table_cache.log_action("create_page", task_id="t0")
+            assert table_cache.log_client.list_entities() == []
+
+        assert len(table_cache.log_client.list_entities()) == 4
+        assert table_cache.log_client.transactions == 1
+
+    @_fake_only
+    def test_transaction_flushes_logs_on_error(self, table_cache):
+        with pytest.raises(RuntimeError):
+            with table_cache.transaction():
+                table_cache.log_action("sync_cycle_error", success=False)
+                raise RuntimeError("boom")
+
+        assert len(table_cache.log_client.list_entities()) == 1
+
+    def test_transaction_error_survives_failed_log_flush(self, table_cache):
+        with patch.object(table_cache.log_client, "submit_transaction",
+                          side_effect=RuntimeError("flush failed")):
+            with pytest.raises(ValueError, match="boom"):
+                with table_cache.transaction():
+                    table_cache.log_action("sync_cycle_error", success=False)
+                    raise ValueError("boom")
+        assert table_cache._pending_logs is None
+
     def test_weekly_review(self, table_cache):
         table_cache.save_weekly_review("evt-1", "2025-01-13")
         result = table_cache.get_weekly_review("2025-01-13")
@@ -178,6 +409,32 @@ class TestTableSyncCache:
     def test_weekly_review_not_found(self, table_cache):
         assert table_cache.get_weekly_review("2099-01-01") is None
 
+    def test_find_removed_tasks(self, table_cache):
+        table_cache.upsert_tasks_many([
+            {"task_id": task_id, "list_id": "l1", "list_name": "Hoy",
+             "title": task_id, "status": "notStarted"}
+            for task_id in ("t1", "t2")
+        ])
+        assert table_cache.find_removed_tasks("Hoy", {"t1"}) == [
+            {"task_id": "t2", "list_name": "Hoy", "title": "t2", "calendar_event_id": None},
+        ]
+
+    def test_get_pending_tasks(self, table_cache):
+        table_cache.upsert_tasks_many([
+            {"task_id": "t1", "list_id": "l1", "list_name": "Hoy",
+             "title": "Pendiente", "status": "notStarted"},
+            {"task_id": "t2", "list_id": "l1", "list_name": "Hoy",
+             "title": "Hecha", "status": "completed"},
+        ])
+        assert table_cache.get_pending_tasks() == [{"list_name": "Hoy", "title": "Pendiente"}]
+
+    def test_delta_link_roundtrip(self, table_cache):
+        assert table_cache.get_delta_link("Hoy") is None
+        table_cache.set_delta_link("Hoy", "https://delta/1")
+        table_cache.set_delta_link("Hoy", "https://delta/2")
+        assert table_cache.get_delta_link("Hoy") == "https://delta/2"
+
+    @_fake_only
     def test_entity_to_task_mapping(self, table_cache):
         """Verify PascalCase -> snake_case mapping covers all fields."""
         entity = {
@@ -220,10 +477,12 @@ class TestTableSyncCachePrefix:
         cache.TASKS_TABLE = "WorkSyncedTasks"
         cache.LOG_TABLE = "WorkSyncLog"
         cache.REVIEWS_TABLE = "WorkWeeklyReviews"
+        cache.DELTA_TABLE = "WorkDeltaLinks"
         cache._ensure_tables()
         cache.tasks_client = fake_service.get_table_client(cache.TASKS_TABLE)
         cache.log_client = fake_service.get_table_client(cache.LOG_TABLE)
         cache.reviews_client = fake_service.get_table_client(cache.REVIEWS_TABLE)
+        cache.delta_client = fake_service.get_table_client(cache.DELTA_TABLE)
 
         assert cache.TASKS_TABLE == "WorkSyncedTasks"
         assert cache.LOG_TABLE == "WorkSyncLog"
@@ -231,6 +490,7 @@ class TestTableSyncCachePrefix:
         assert "WorkSyncedTasks" in fake_service._tables
         assert "WorkSyncLog" in fake_service._tables
         assert "WorkWeeklyReviews" in fake_service._tables
+        assert "WorkDeltaLinks" in fake_service._tables
 
         # Verify it works — upsert and retrieve a task
         cache.upsert_task({
@@ -254,12 +514,48 @@ class TestTableSyncCachePrefix:
         cache.TASKS_TABLE = "SyncedTasks"
         cache.LOG_TABLE = "SyncLog"
         cache.REVIEWS_TABLE = "WeeklyReviews"
+        cache.DELTA_TABLE = "DeltaLinks"
         cache._ensure_tables()
         cache.tasks_client = fake_service.get_table_client(cache.TASKS_TABLE)
         cache.log_client = fake_service.get_table_client(cache.LOG_TABLE)
         cache.reviews_client = fake_service.get_table_client(cache.REVIEWS_TABLE)
+        cache.delta_client = fake_service.get_table_client(cache.DELTA_TABLE)
 
         assert cache.TASKS_TABLE == "SyncedTasks"
         assert cache.LOG_TABLE == "SyncLog"
         assert cache.REVIEWS_TABLE == "WeeklyReviews"
         cache.close()
+
+    def test_ensure_tables_skips_tables_already_created(self):
+        """A second cache on the same account should not re-create its tables."""
+        fake_service = FakeTableServiceClient()
+        for _ in range(2):
+            cache = TableSyncCache.__new__(TableSyncCache)
+            cache.service = fake_service
+            cache.TASKS_TABLE = "SyncedTasks"
+            cache.LOG_TABLE = "SyncLog"
+            cache.REVIEWS_TABLE = "WeeklyReviews"
+            cache.DELTA_TABLE = "DeltaLinks"
+            cache._ensure_tables()
+
+        assert fake_service.create_calls == 4
+
+    def test_ensure_tables_retries_after_real_failure(self):
+        """Only a created or already-existing table is remembered as ready."""
+        service = MagicMock()
+        service.url = "https://failing.table.core.windows.net"
+        service.create_table.side_effect = ServiceRequestError("network down")
+        cache = TableSyncCache.__new__(TableSyncCache)
+        cache.service = service
+        cache.TASKS_TABLE = "SyncedTasks"
+        cache.LOG_TABLE = "SyncLog"
+        cache.REVIEWS_TABLE = "WeeklyReviews"
+        cache.DELTA_TABLE = "DeltaLinks"
+
+        with pytest.raises(ServiceRequestError):
+            cache._ensure_tables()
+
+        service.create_table.side_effect = ResourceExistsError("exists")
+        cache._ensure_tables()
+        cache._ensure_tables()
+        assert service.create_table.call_count == 1 + 4
@@ -1,13 +1,26 @@
 from unittest.mock import MagicMock
 
+import pytest
+import requests
+
 from src.services.todo_service import TodoService
 from tests.mocks.graph_responses import TODO_LISTS, TASKS_HOY
 
 
+@pytest.fixture(scope="class")
+def _todo_pair():
+    """One mocked Graph client and TodoService per test class."""
+    graph = MagicMock()
+    return graph, TodoService(graph)
+
+
 class TestTodoService:
-    def setup_method(self):
-        self.graph = MagicMock()
-        self.service = TodoService(self.graph)
+    @pytest.fixture(autouse=True)
+    def _fresh_graph(self, _todo_pair):
+        self.graph, self.service = _todo_pair
+        self.graph.reset_mock(return_value=True, side_effect=True)
+        # Drop the list lookup memoised by get_lists_by_name
+        self.service._lists_by_name = None
 
     def test_get_lists(self):
         self.graph.get_all.return_value = TODO_LISTS["value"]
@@ -16,21 +29,32 @@ class TestTodoService:
         self.graph.get_all.assert_called_once_with("/me/todo/lists")
 
     def test_find_list_by_name_found(self):
-        self.graph.get_all.return_value = TODO_LISTS["value"]
+        self.graph.iter_all.return_value = iter(TODO_LISTS["value"])
         result = self.service.find_list_by_name("Hoy")
         assert result is not None
         assert result["id"] == "list-hoy"
 
     def test_find_list_by_name_not_found(self):
-        self.graph.get_all.return_value = TODO_LISTS["value"]
+        self.graph.iter_all.return_value = iter(TODO_LISTS["value"])
         result = self.service.find_list_by_name("No existe")
         assert result is None
 
+    def test_get_lists_by_name_fetches_once(self):
+        self.graph.get_all.return_value = TODO_LISTS["value"]
+        assert self.service.get_lists_by_name()["Hoy"]["id"] == "list-hoy"
+        assert "Esta semana" in self.service.get_lists_by_name()
+        self.graph.get_all.assert_called_once_with("/me/todo/lists")
+
+        self.service.get_lists_by_name(refresh=True)
+        assert self.graph.get_all.call_count == 2
+
     def test_get_tasks(self):
         self.graph.get_all.return_value = TASKS_HOY["value"]
         tasks = self.service.get_tasks("list-hoy")
         assert len(tasks) == 3
-        self.graph.get_all.assert_called_once()
+        self.graph.get_all.assert_called_once_with(
+            "/me/todo/lists/list-hoy/tasks", params={"$top": 100},
+        )
 
     def test_get_tasks_with_filter(self):
         self.graph.get_all.return_value = []
@@ -38,6 +62,44 @@ class TestTodoService:
         call_args = self.graph.get_all.call_args
         assert "$filter" in call_args[1]["params"]
 
+    def test_get_tasks_delta_follows_pages(self):
+        self.graph.get.side_effect = [
+            {"value": [{"id": "t1"}], "@odata.nextLink": "https://next"},
+            {"value": [{"id": "t2"}], "@odata.deltaLink": "https://delta"},
+        ]
+        tasks, link, full = self.service.get_tasks_delta("list-hoy")
+        assert [t["id"] for t in tasks] == ["t1", "t2"]
+        assert link == "https://delta"
+        assert full is True
+        self.graph.get.assert_any_call("/me/todo/lists/list-hoy/tasks/delta")
+
+    def test_get_tasks_delta_restarts_when_link_expired(self):
+        gone = requests.HTTPError(response=MagicMock(status_code=410))
+        self.graph.get.side_effect = [gone, {"value": [], "@odata.deltaLink": "https://new"}]
+        tasks, link, full = self.service.get_tasks_delta("list-hoy", "https://old")
+        assert (tasks, link, full) == ([], "https://new", True)
+
+    def test_get_deltas_for_lists_uses_batch(self):
+        self.graph.batch.return_value = {
+            "0": {"id": "0", "status": 200, "body": {
+                "value": [{"id": "t1"}], "@odata.deltaLink": "https://d0",
+            }},
+            "1": {"id": "1", "status": 429, "body": {}},
+        }
+        self.graph.get.return_value = {"value": [{"id": "t3"}], "@odata.deltaLink": "https://d1"}
+        old_link = "https://graph.microsoft.com/v1.0/me/todo/lists/list-manana/tasks/delta?$deltatoken=x"
+
+        result = self.service.get_deltas_for_lists({"list-hoy": None, "list-manana": old_link})
+
+        assert result == {
+            "list-hoy": ([{"id": "t1"}], "https://d0", True),
+            "list-manana": ([{"id": "t3"}], "https://d1", False),
+        }
+        sub_requests = self.graph.batch.call_args[0][0]
+        assert sub_requests[0]["url"] == "/me/todo/lists/list-hoy/tasks/delta"
+        assert sub_requests[1]["url"] == "/me/todo/lists/list-manana/tasks/delta?$deltatoken=x"
+        self.graph.get.assert_called_once_with(old_link)
+
     def test_get_task(self):
         self.graph.get.return_value = TASKS_HOY["value"][0]
         task = self.service.get_task("list-hoy", "task-simple-1")